@@ -0,0 +1,431 @@
+# benchmark.py
+"""
+Benchmark de ponta a ponta do pipeline de recomendação com dados sintéticos.
+
+Gera usuários, cachaças e avaliações com tamanho e densidade ajustáveis, sobe
+serviços locais de mentira (API HTTP paginada e um "sink" SMTP) e mede, etapa por
+etapa, tempo de parede, tempo de CPU e pico de memória:
+
+    busca -> matrizes -> treinamento -> pontuacao -> renderizacao -> envio
+
+O resultado é gravado em JSON para comparar versões.
+
+Uso:
+    python benchmark.py --users 20000 --items 2000 --density 0.005 --output resultado.json
+"""
+import argparse
+import json
+import os
+import platform
+import socketserver
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+ETAPAS = ("busca", "matrizes", "treinamento", "pontuacao", "renderizacao", "envio")
+
+
+# ======================================================================================
+# Dados sintéticos
+# ======================================================================================
+def gerar_dados_sinteticos(
+    n_users: int,
+    n_items: int,
+    densidade: float,
+    n_tipos: int = 5,
+    n_regioes: int = 20,
+    seed: int = 42,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Gera um catálogo e avaliações sintéticas no mesmo formato que vem da API.
+
+    A popularidade das cachaças segue uma lei de potência (poucas muito avaliadas,
+    muitas pouco avaliadas), como acontece com dados reais.
+
+    Args:
+        n_users: Número de usuários.
+        n_items: Número de cachaças no catálogo.
+        densidade: Fração da matriz usuários x cachaças que tem avaliação.
+        n_tipos: Cardinalidade de 'tipoCachaca'.
+        n_regioes: Cardinalidade de 'regiao'.
+        seed: Semente do gerador aleatório.
+
+    Returns:
+        Uma tupla (avaliacoes_df, cachacas_df).
+    """
+    rng = np.random.default_rng(seed)
+
+    item_ids = np.arange(1, n_items + 1)
+    cachacas_df = pd.DataFrame(
+        {
+            "id": item_ids,
+            "nome": [f"Cachaça {i}" for i in item_ids],
+            "tipoCachaca": rng.integers(0, n_tipos, n_items).astype(str),
+            "regiao": rng.integers(0, n_regioes, n_items).astype(str),
+            "descricao": [f"Descrição da cachaça {i}." for i in item_ids],
+            "teorAlcoolico": rng.uniform(38, 48, n_items).round(1),
+            "preco": rng.lognormal(4, 0.6, n_items).round(2),
+            "disponivel": rng.random(n_items) < 0.9,
+        }
+    )
+    cachacas_df["tipoCachaca"] = "TIPO_" + cachacas_df["tipoCachaca"]
+    cachacas_df["regiao"] = "Região " + cachacas_df["regiao"]
+    # De zero a três tags por cachaça, sorteadas de um vocabulário pequeno
+    cachacas_df["tags"] = [
+        [f"tag{t}" for t in rng.choice(30, n, replace=False)]
+        for n in rng.integers(0, 4, n_items)
+    ]
+
+    n_avaliacoes = max(n_users, int(n_users * n_items * densidade))
+    popularidade = 1.0 / np.arange(1, n_items + 1) ** 0.8
+    popularidade /= popularidade.sum()
+
+    # Todo usuário tem pelo menos uma avaliação; o restante é sorteado
+    users = np.concatenate(
+        [np.arange(1, n_users + 1), rng.integers(1, n_users + 1, n_avaliacoes - n_users)]
+    )
+    items = rng.choice(item_ids, size=len(users), p=popularidade)
+    avaliacoes_df = pd.DataFrame({"user.id": users, "cachaca.id": items})
+    avaliacoes_df = avaliacoes_df.drop_duplicates().reset_index(drop=True)
+    avaliacoes_df["notaGeral"] = rng.integers(1, 11, len(avaliacoes_df))
+    avaliacoes_df.insert(0, "id", np.arange(1, len(avaliacoes_df) + 1))
+    regiao_usuario = rng.integers(0, n_regioes, n_users + 1).astype(str)
+    avaliacoes_df["user.regiao"] = "Região " + regiao_usuario[avaliacoes_df["user.id"]]
+    return avaliacoes_df, cachacas_df
+
+
+def _avaliacoes_para_json(avaliacoes_df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Converte as avaliações para o formato aninhado da API ({'user': {'id': ...}})."""
+    return [
+        {
+            "id": int(i),
+            "user": {"id": int(u), "regiao": r},
+            "cachaca": {"id": int(c)},
+            "notaGeral": int(n),
+        }
+        for i, u, r, c, n in avaliacoes_df[
+            ["id", "user.id", "user.regiao", "cachaca.id", "notaGeral"]
+        ].itertuples(index=False)
+    ]
+
+
+# ======================================================================================
+# Serviços locais de mentira
+# ======================================================================================
+class _StubApiHandler(BaseHTTPRequestHandler):
+    """API paginada no formato do Spring Data, servindo os dados sintéticos."""
+
+    protocol_version = "HTTP/1.1"
+    dados: Dict[str, List[Dict[str, Any]]] = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        registros = self.dados.get(url.path)
+        if registros is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        query = parse_qs(url.query)
+        page = int(query.get("page", [0])[0])
+        size = int(query.get("size", [1000])[0])
+        total_pages = max(1, -(-len(registros) // size))
+        corpo = json.dumps(
+            {
+                "content": registros[page * size : (page + 1) * size],
+                "totalPages": total_pages,
+                "last": page >= total_pages - 1,
+            }
+        ).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+
+class _SmtpSinkHandler(socketserver.StreamRequestHandler):
+    """Servidor SMTP mínimo que aceita e descarta todas as mensagens (sem TLS/AUTH)."""
+
+    def _responder(self, linha: str):
+        self.wfile.write(linha.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self._responder("220 sink pronto")
+        recebendo_dados = False
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            if recebendo_dados:
+                if linha.rstrip(b"\r\n") == b".":
+                    recebendo_dados = False
+                    with self.server.lock:
+                        self.server.mensagens += 1
+                    self._responder("250 OK")
+                continue
+
+            comando = linha[:4].upper()
+            if comando in (b"HELO", b"EHLO"):
+                self._responder("250 sink")
+            elif comando == b"DATA":
+                recebendo_dados = True
+                self._responder("354 Termine com <CRLF>.<CRLF>")
+            elif comando == b"QUIT":
+                self._responder("221 Tchau")
+                return
+            else:
+                self._responder("250 OK")
+
+
+class _SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, endereco):
+        super().__init__(endereco, _SmtpSinkHandler)
+        self.lock = threading.Lock()
+        self.mensagens = 0
+
+
+def _iniciar_em_thread(servidor):
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+# ======================================================================================
+# Medição
+# ======================================================================================
+@contextmanager
+def _medir(resultados: Dict[str, Dict[str, Any]], etapa: str, medir_memoria: bool):
+    """Mede tempo de parede, tempo de CPU e pico de memória (tracemalloc) de um bloco."""
+    if medir_memoria:
+        tracemalloc.start()
+    inicio_parede, inicio_cpu = time.perf_counter(), time.process_time()
+    metricas: Dict[str, Any] = {}
+    try:
+        yield metricas
+    except Exception as e:
+        metricas["erro"] = f"{type(e).__name__}: {e}"
+        print(f"FALHA na etapa '{etapa}': {metricas['erro']}")
+    finally:
+        metricas["wall_s"] = round(time.perf_counter() - inicio_parede, 4)
+        metricas["cpu_s"] = round(time.process_time() - inicio_cpu, 4)
+        if medir_memoria:
+            metricas["peak_mem_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            tracemalloc.stop()
+        resultados[etapa] = metricas
+        print(f"[{etapa}] {metricas}")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+# ======================================================================================
+# Execução
+# ======================================================================================
+def executar_benchmark(
+    n_users: int,
+    n_items: int,
+    densidade: float,
+    n_tipos: int = 5,
+    n_regioes: int = 20,
+    seed: int = 42,
+    top_n: int = 3,
+    etapas: Tuple[str, ...] = ETAPAS,
+    medir_memoria: bool = True,
+) -> Dict[str, Any]:
+    """
+    Roda as etapas pedidas sobre dados sintéticos e retorna as métricas de cada uma.
+    Uma etapa que falha é registrada com o erro e as seguintes continuam quando possível.
+    """
+    import data_fetcher
+    import email_sender
+    import features
+    import matrix_builder
+    from recommender import Recommender
+
+    print(f"Gerando dados sintéticos ({n_users} usuários x {n_items} cachaças)...")
+    avaliacoes_df, cachacas_df = gerar_dados_sinteticos(
+        n_users, n_items, densidade, n_tipos, n_regioes, seed
+    )
+    resultados: Dict[str, Dict[str, Any]] = {}
+    artifacts_path = tempfile.mkdtemp(prefix="pingou-bench-") + "/"
+
+    if "busca" in etapas:
+        _StubApiHandler.dados = {
+            "/avaliacoes": _avaliacoes_para_json(avaliacoes_df),
+            "/cachacas": cachacas_df.to_dict("records"),
+        }
+        api = _iniciar_em_thread(ThreadingHTTPServer(("127.0.0.1", 0), _StubApiHandler))
+        os.environ.setdefault("API_KEY", "benchmark")
+        with _medir(resultados, "busca", medir_memoria) as m:
+            base_url = f"http://127.0.0.1:{api.server_port}"
+            with data_fetcher.ApiClient(base_url=base_url) as client:
+                dados = client.fetch_many(["/avaliacoes", "/cachacas"])
+            m["linhas"] = {k: (0 if v is None else len(v)) for k, v in dados.items()}
+        api.shutdown()
+
+    if "matrizes" in etapas:
+        with _medir(resultados, "matrizes", medir_memoria) as m:
+            from lightfm.data import Dataset  # Depende do lightfm
+
+            dataset = Dataset()
+            dataset.fit(
+                users=avaliacoes_df["user.id"].unique(),
+                items=cachacas_df["id"].unique(),
+                user_features=features.bucket_names(
+                    features.USER_PREFIX, features.USER_FEATURE_BUCKETS
+                ),
+                item_features=features.bucket_names(
+                    features.ITEM_PREFIX, features.ITEM_FEATURE_BUCKETS
+                ),
+            )
+            interactions, weights = matrix_builder.build_interactions(
+                dataset, avaliacoes_df
+            )
+            item_features = matrix_builder.build_item_features(dataset, cachacas_df)
+            user_features = matrix_builder.build_user_features(
+                dataset, weights, avaliacoes_df, cachacas_df
+            )
+            m["nnz_interacoes"] = int(interactions.nnz)
+            m["nnz_features"] = int(item_features.nnz)
+            m["nnz_user_features"] = int(user_features.nnz)
+
+    if "treinamento" in etapas:
+        with _medir(resultados, "treinamento", medir_memoria):
+            import pipeline  # Depende do lightfm
+
+            pipeline.executar_pipeline_treinamento(
+                avaliacoes_df, cachacas_df, artifacts_path=artifacts_path
+            )
+
+    user_ids = avaliacoes_df["user.id"].unique()
+    recomendacoes: Dict[Any, List[Dict[str, Any]]] = {}
+    if "pontuacao" in etapas:
+        with _medir(resultados, "pontuacao", medir_memoria) as m:
+            recommender = Recommender(artifacts_path)
+            if not recommender.loaded:
+                raise RuntimeError("artefatos do modelo indisponíveis")
+            recomendacoes = recommender.recommend_all(user_ids, top_n=top_n)
+            m["usuarios"] = len(recomendacoes)
+        if recomendacoes:
+            m["us_por_usuario"] = round(m["wall_s"] * 1e6 / len(recomendacoes), 2)
+
+    if not recomendacoes:
+        # Sem a etapa de pontuação, as etapas de e-mail usam recomendações sorteadas
+        registros = cachacas_df.to_dict("records")
+        rng = np.random.default_rng(seed)
+        recomendacoes = {
+            user_id: [registros[i] for i in rng.integers(0, len(registros), top_n)]
+            for user_id in user_ids
+        }
+
+    emails: List[Tuple[str, List[Dict[str, Any]]]] = [
+        (f"user_{user_id}@exemplo.com", recs) for user_id, recs in recomendacoes.items()
+    ]
+    if "renderizacao" in etapas:
+        with _medir(resultados, "renderizacao", medir_memoria) as m:
+            email_sender.BulkRenderer().render_many(emails)
+            m["mensagens"] = len(emails)
+
+    if "envio" in etapas:
+        sink = _iniciar_em_thread(_SmtpSink(("127.0.0.1", 0)))
+        with _medir(resultados, "envio", medir_memoria) as m:
+            with email_sender.SmtpPool(
+                host="127.0.0.1",
+                port=sink.server_address[1],
+                sender_email="benchmark@exemplo.com",
+                use_tls=False,
+                max_per_second=0,  # Sem limite de taxa no benchmark
+                login=False,
+            ) as smtp_pool:
+                smtp_pool.send_many(emails)
+            m["mensagens_recebidas"] = sink.mensagens
+        sink.shutdown()
+
+    return {
+        "config": {
+            "users": n_users,
+            "items": n_items,
+            "density": densidade,
+            "tipos": n_tipos,
+            "regioes": n_regioes,
+            "seed": seed,
+            "top_n": top_n,
+            "avaliacoes": len(avaliacoes_df),
+            "medir_memoria": medir_memoria,
+        },
+        "ambiente": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "commit": _git_commit(),
+            "data": pd.Timestamp.now(tz="UTC").isoformat(),
+        },
+        "etapas": resultados,
+    }
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--items", type=int, default=1_000)
+    parser.add_argument("--density", type=float, default=0.01)
+    parser.add_argument("--tipos", type=int, default=5)
+    parser.add_argument("--regioes", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument(
+        "--stages",
+        default=",".join(ETAPAS),
+        help=f"Etapas a executar, separadas por vírgula (padrão: {','.join(ETAPAS)}).",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Não mede o pico de memória (tracemalloc deixa o código Python mais lento).",
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    resultado = executar_benchmark(
+        n_users=args.users,
+        n_items=args.items,
+        densidade=args.density,
+        n_tipos=args.tipos,
+        n_regioes=args.regioes,
+        seed=args.seed,
+        top_n=args.top_n,
+        etapas=tuple(etapa.strip() for etapa in args.stages.split(",")),
+        medir_memoria=not args.no_memory,
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em '{args.output}'.")
@@ -1,9 +1,254 @@
 # data_fetcher.py
+import codecs
+import json
 import os
-from typing import Dict, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+from features import TAG_SEPARATOR
+
+# Configurações padrão do cliente (podem ser sobrescritas pelo .env:
+# API_TIMEOUT, API_PAGE_SIZE, API_MAX_WORKERS e API_MAX_RETRIES)
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+
+# Status HTTP considerados transitórios (vale a pena tentar de novo). Em 429 e 503 o
+# header Retry-After do servidor, se houver, é respeitado no lugar do backoff.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Diretório do cache local (um arquivo Parquet + metadados por endpoint)
+CACHE_PATH = "cache/"
+
+# Parâmetro de query usado para pedir apenas os registros alterados desde a última sincronização
+UPDATED_SINCE_PARAM = "updatedSince"
+
+# Colunas que o pipeline usa de cada endpoint e o tipo compacto de cada uma. Campos
+# aninhados usam o caminho com ponto (como no pd.json_normalize); os demais campos
+# são descartados logo na leitura; campos ausentes na resposta viram colunas vazias.
+# Endpoints fora daqui mantêm todas as colunas.
+ENDPOINT_SCHEMAS: Dict[str, Dict[str, str]] = {
+    "/avaliacoes": {
+        "id": "int32",
+        "user.id": "int32",
+        "cachaca.id": "int32",
+        "notaGeral": "float32",
+        "user.regiao": "category",
+    },
+    "/cachacas": {
+        "id": "int32",
+        "nome": "object",
+        "tipoCachaca": "category",
+        "regiao": "category",
+        "descricao": "object",
+        "teorAlcoolico": "float32",
+        "preco": "float32",
+        "tags": "list",
+        "disponivel": "boolean",
+    },
+}
+
+# Tamanho dos blocos lidos do corpo das respostas em streaming
+STREAM_CHUNK_BYTES = 1 << 16
+
+
+def _compact_column(serie: pd.Series, dtype: str) -> pd.Series:
+    """
+    Converte uma coluna para o tipo compacto do schema. Inteiros que não cabem no tipo
+    pedido ficam em int64 e colunas inteiras com valores ausentes usam o tipo inteiro
+    anulável do pandas (ex: Int32). Campos multivalorados ("list", ex: tags) viram
+    texto separado por `features.TAG_SEPARATOR`, que pode ser hasheado e gravado
+    em feather como qualquer texto. Uma coluna numérica com valores que não são
+    números (ex: IDs de texto) é mantida como objeto, sem perder esses valores.
+    """
+    if dtype == "list":
+        return serie.map(
+            lambda v: TAG_SEPARATOR.join(map(str, v)) if isinstance(v, list) else v
+        ).astype(object)
+    if dtype == "category":
+        return serie.astype("category")
+    if dtype == "object":
+        return serie.astype(object)
+
+    numeros = pd.to_numeric(serie, errors="coerce")
+    if (numeros.isna() & serie.notna()).any():
+        return serie.astype(object)
+    if not dtype.startswith("int"):
+        return numeros.astype(dtype)
+
+    limites = np.iinfo(dtype)
+    if numeros.notna().any() and (
+        numeros.min() < limites.min or numeros.max() > limites.max
+    ):
+        dtype = "int64"
+    return numeros.astype(dtype.capitalize() if numeros.isna().any() else dtype)
+
+
+def _records_to_frame(
+    records: List[Any], schema: Optional[Dict[str, str]]
+) -> pd.DataFrame:
+    """
+    Converte um bloco de registros JSON em DataFrame. Com schema, extrai apenas as
+    colunas dele (seguindo os caminhos com ponto) já nos tipos compactos; sem schema,
+    normaliza todos os campos com pd.json_normalize. Campos do schema que nenhum
+    registro do bloco traz ficam de fora (e não viram colunas só de nulos).
+    """
+    if schema is None:
+        return pd.json_normalize(records) if records else pd.DataFrame()
+
+    colunas = {}
+    for coluna, dtype in schema.items():
+        caminho = coluna.split(".")
+        valores = []
+        presente = False
+        for record in records:
+            for chave in caminho:
+                if not isinstance(record, dict) or chave not in record:
+                    record = None
+                    break
+                record = record[chave]
+            else:
+                presente = True
+            valores.append(record)
+        if presente:
+            colunas[coluna] = _compact_column(pd.Series(valores, dtype=object), dtype)
+    return pd.DataFrame(colunas, index=pd.RangeIndex(len(records)))
+
+
+def _concat_frames(
+    frames: List[pd.DataFrame], schema: Optional[Dict[str, str]]
+) -> pd.DataFrame:
+    """
+    Junta os blocos convertidos. As colunas categóricas são unidas com
+    `union_categoricals` (o pd.concat as transformaria em objetos Python). Uma coluna
+    que só alguns blocos trazem é completada com nulos nos demais.
+    """
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame({coluna: [] for coluna in schema or {}})
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    if schema is None:
+        return pd.concat(frames, ignore_index=True)
+
+    schema = {
+        coluna: dtype
+        for coluna, dtype in schema.items()
+        if any(coluna in frame for frame in frames)
+    }
+    frames = [
+        frame.assign(
+            **{
+                coluna: _compact_column(
+                    pd.Series([None] * len(frame), index=frame.index, dtype=object),
+                    dtype,
+                )
+                for coluna, dtype in schema.items()
+                if coluna not in frame
+            }
+        )
+        for frame in frames
+    ]
+    categoricas = [coluna for coluna, dtype in schema.items() if dtype == "category"]
+    df = pd.concat(
+        [frame.drop(columns=categoricas) for frame in frames], ignore_index=True
+    )
+    for coluna in categoricas:
+        df[coluna] = union_categoricals(
+            [frame[coluna] for frame in frames], ignore_order=True
+        )
+    return df[list(schema)]
+
+
+def _conform_to_schema(
+    df: pd.DataFrame, schema: Optional[Dict[str, str]]
+) -> pd.DataFrame:
+    """
+    Projeta um DataFrame já existente (ex: o cache local) nas colunas do schema que
+    ele tem.
+    """
+    if schema is None:
+        return df
+    return pd.DataFrame(
+        {
+            coluna: _compact_column(df[coluna], dtype)
+            for coluna, dtype in schema.items()
+            if coluna in df
+        },
+        index=df.index,
+    )
+
+
+def _iter_json_array(
+    texto: str,
+    blocos: Iterator[bytes],
+    decodificador: codecs.IncrementalDecoder,
+    tamanho_lote: int,
+) -> Iterator[List[Any]]:
+    """
+    Lê um array JSON de forma incremental, devolvendo os elementos em listas de até
+    `tamanho_lote`. Só um trecho do corpo e um lote de elementos ficam em memória.
+
+    Args:
+        texto: O início do corpo já lido (começando pelo '[').
+        blocos: O restante do corpo, em bytes.
+        decodificador: Decodificador incremental do charset da resposta.
+        tamanho_lote: Quantos elementos por lista.
+    """
+    json_decoder = json.JSONDecoder()
+    buffer = texto[texto.index("[") + 1 :]
+    lote: List[Any] = []
+    fim_do_corpo = False
+    while True:
+        posicao = 0
+        while True:
+            while posicao < len(buffer) and buffer[posicao] in " \t\r\n,":
+                posicao += 1
+            if posicao < len(buffer) and buffer[posicao] == "]":
+                if lote:
+                    yield lote
+                return
+            try:
+                elemento, fim = json_decoder.raw_decode(buffer, posicao)
+            except json.JSONDecodeError:
+                if fim_do_corpo:
+                    raise
+                break  # Elemento incompleto: lê mais um bloco
+            # Um elemento só está completo se vier seguido de ',' ou ']' (um número
+            # como '12' pode continuar no próximo bloco: '12.5')
+            seguinte = fim
+            while seguinte < len(buffer) and buffer[seguinte] in " \t\r\n":
+                seguinte += 1
+            if seguinte == len(buffer) or buffer[seguinte] not in ",]":
+                if fim_do_corpo:
+                    raise json.JSONDecodeError("Array JSON malformado", buffer, seguinte)
+                break
+            lote.append(elemento)
+            posicao = fim
+            if len(lote) >= tamanho_lote:
+                yield lote
+                lote = []
+
+        buffer = buffer[posicao:]
+        bloco = next(blocos, None)
+        if bloco is None:
+            if fim_do_corpo:
+                raise json.JSONDecodeError("Array JSON incompleto", buffer, 0)
+            fim_do_corpo = True
+            buffer += decodificador.decode(b"", final=True)
+        else:
+            buffer += decodificador.decode(bloco)
 
 
 def _get_api_headers() -> Dict[str, str]:
@@ -14,6 +259,393 @@ def _get_api_headers() -> Dict[str, str]:
     return {"Authorization": f"Bearer {api_key}"}
 
 
+class ApiClient:
+    """
+    Cliente HTTP da API Java com conexões reaproveitadas (keep-alive), busca paginada
+    com várias páginas em paralelo e novas tentativas com backoff para falhas
+    transitórias (429, 5xx e timeouts).
+
+    Endpoints paginados devem seguir o formato do Spring Data
+    ({"content": [...], "totalPages": N, "last": bool}); endpoints que retornam uma
+    lista simples são lidos em uma única requisição.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        page_size: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        timeout: Optional[float] = None,
+        backoff_factor: float = 0.5,
+    ):
+        self.base_url = base_url or os.getenv("API_BASE_URL")
+        self.page_size = page_size or int(os.getenv("API_PAGE_SIZE", DEFAULT_PAGE_SIZE))
+        self.max_workers = max(
+            1, max_workers or int(os.getenv("API_MAX_WORKERS", DEFAULT_MAX_WORKERS))
+        )
+        self.timeout = timeout or float(os.getenv("API_TIMEOUT", DEFAULT_TIMEOUT))
+        if max_retries is None:
+            max_retries = int(os.getenv("API_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,  # Após esgotar as tentativas, raise_for_status decide
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.max_workers,
+            pool_maxsize=self.max_workers * 2,
+            max_retries=retry,
+        )
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(_get_api_headers())
+
+    def close(self):
+        """Fecha as conexões mantidas pelo pool."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        """
+        Faz um GET no endpoint. Respostas 304 (Not Modified) não são tratadas como erro.
+        Com `stream=True`, o corpo não é lido aqui (ver `_iter_body`).
+        """
+        with metrics.timed("http_request_seconds", endpoint=endpoint):
+            response = self.session.get(
+                f"{self.base_url}{endpoint}",
+                params=params,
+                headers=headers,
+                timeout=self.timeout,
+                stream=stream,
+            )
+        metrics.inc(
+            "http_requests_total", endpoint=endpoint, status=response.status_code
+        )
+        if not stream:
+            metrics.inc(
+                "http_response_bytes_total", len(response.content), endpoint=endpoint
+            )
+        if response.status_code != 304:
+            response.raise_for_status()  # Lança um erro para status HTTP 4xx/5xx
+        return response
+
+    def _get_page(
+        self, endpoint: str, page: int, params: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        page_params = {**(params or {}), "page": page, "size": self.page_size}
+        return self._get(endpoint, page_params).json()
+
+    @staticmethod
+    def _iter_body(response: requests.Response, endpoint: str) -> Iterator[bytes]:
+        """Lê o corpo de uma resposta em streaming, contabilizando os bytes recebidos."""
+        for bloco in response.iter_content(STREAM_CHUNK_BYTES):
+            metrics.inc("http_response_bytes_total", len(bloco), endpoint=endpoint)
+            yield bloco
+
+    def _iter_pages(
+        self, endpoint: str, first_page: Dict[str, Any], params: Optional[Dict[str, Any]]
+    ) -> Iterator[List[Any]]:
+        """
+        Devolve o conteúdo de cada página, em ordem, buscando as seguintes em paralelo.
+        No máximo 2 x `max_workers` páginas ficam em memória ao mesmo tempo.
+        """
+        yield first_page["content"]
+        if first_page.get("last", False) or not first_page["content"]:
+            return
+
+        def get_page(page: int) -> Any:
+            return self._get_page(endpoint, page, params)
+
+        total_pages = first_page.get("totalPages")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            if total_pages is not None:
+                # Total conhecido: as páginas restantes são buscadas em paralelo, com
+                # uma janela limitada de páginas em andamento
+                next_page, em_andamento = 1, deque()
+                while next_page < total_pages or em_andamento:
+                    while (
+                        next_page < total_pages
+                        and len(em_andamento) < 2 * self.max_workers
+                    ):
+                        em_andamento.append(executor.submit(get_page, next_page))
+                        next_page += 1
+                    yield em_andamento.popleft().result()["content"]
+                return
+
+            # Total desconhecido: busca janelas de `max_workers` páginas por vez
+            next_page = 1
+            while True:
+                window = range(next_page, next_page + self.max_workers)
+                for page in executor.map(get_page, window):
+                    yield page["content"]
+                    if page.get("last", False) or len(page["content"]) < self.page_size:
+                        return
+                next_page += self.max_workers
+
+    def _fetch_chunks_with_etag(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[Optional[Iterator[List[Any]]], Optional[str]]:
+        """
+        Busca os registros de um endpoint em blocos: uma página por bloco nos endpoints
+        paginados ou `page_size` elementos por bloco quando a resposta é um array
+        simples (lido em streaming, sem carregar o corpo inteiro).
+
+        Returns:
+            Uma tupla (iterador de blocos de registros, etag). O iterador é None quando
+            o servidor responde 304 (nada mudou desde o ETag informado em `headers`).
+        """
+        first_params = {**(params or {}), "page": 0, "size": self.page_size}
+        first_response = self._get(endpoint, first_params, headers, stream=True)
+        etag = first_response.headers.get("ETag")
+        if first_response.status_code == 304:
+            first_response.close()
+            return None, etag
+
+        blocos = self._iter_body(first_response, endpoint)
+        decodificador = codecs.getincrementaldecoder(first_response.encoding or "utf-8")()
+        texto = ""
+        while not texto.strip():
+            bloco = next(blocos, None)
+            if bloco is None:
+                return iter([]), etag  # Corpo vazio
+            texto += decodificador.decode(bloco)
+
+        # Endpoint não paginado: o array é lido aos poucos
+        if texto.lstrip().startswith("["):
+            return _iter_json_array(texto, blocos, decodificador, self.page_size), etag
+
+        texto += "".join(decodificador.decode(bloco) for bloco in blocos)
+        first_page = json.loads(texto + decodificador.decode(b"", final=True))
+        if not isinstance(first_page, dict) or "content" not in first_page:
+            return iter([[first_page] if first_page else []]), etag
+        return self._iter_pages(endpoint, first_page, params), etag
+
+    def _fetch_records_with_etag(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[Optional[List[Any]], Optional[str]]:
+        """
+        Busca todos os registros de um endpoint, percorrendo as páginas se necessário.
+
+        Returns:
+            Uma tupla (registros, etag). Os registros são None quando o servidor
+            responde 304 (nada mudou desde o ETag informado em `headers`).
+        """
+        chunks, etag = self._fetch_chunks_with_etag(endpoint, params, headers)
+        if chunks is None:
+            return None, etag
+        records: List[Any] = []
+        for chunk in chunks:
+            records.extend(chunk)
+        return records, etag
+
+    def _fetch_frame_with_etag(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        """
+        Busca um endpoint direto para DataFrame, convertendo cada bloco assim que ele
+        chega. Com um schema em ENDPOINT_SCHEMAS, só as colunas dele são mantidas, nos
+        tipos compactos, e o pico de memória fica limitado a poucos blocos de registros
+        JSON, não importa o tamanho do histórico.
+
+        Returns:
+            Uma tupla (DataFrame, etag); o DataFrame é None em caso de 304.
+        """
+        chunks, etag = self._fetch_chunks_with_etag(endpoint, params, headers)
+        if chunks is None:
+            return None, etag
+        schema = ENDPOINT_SCHEMAS.get(endpoint)
+        frames = [_records_to_frame(chunk, schema) for chunk in chunks]
+        return _concat_frames(frames, schema), etag
+
+    def fetch_records(
+        self, endpoint: str, params: Optional[Dict[str, Any]] = None
+    ) -> List[Any]:
+        """
+        Busca todos os registros de um endpoint, percorrendo as páginas se necessário.
+
+        Args:
+            endpoint: O caminho do endpoint (ex: '/avaliacoes').
+            params: Parâmetros de query adicionais enviados em todas as páginas.
+
+        Returns:
+            A lista com todos os registros retornados pela API.
+        """
+        records, _ = self._fetch_records_with_etag(endpoint, params)
+        return records or []
+
+    def get_dataframe(self, endpoint: str) -> Optional[pd.DataFrame]:
+        """
+        Busca dados de um endpoint da API e os retorna como um DataFrame do Pandas.
+
+        Args:
+            endpoint: O caminho do endpoint (ex: '/avaliacoes').
+
+        Returns:
+            Um DataFrame com os dados ou None em caso de erro.
+        """
+        url = f"{self.base_url}{endpoint}"
+
+        print(f"Buscando dados de: {url}")
+        try:
+            # Cada bloco de registros JSON vira colunas compactas assim que chega
+            df, _ = self._fetch_frame_with_etag(endpoint)
+            if df.empty:
+                print(f"Aviso: Nenhum dado retornado do endpoint {endpoint}.")
+            return df
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # ValueError inclui o json.JSONDecodeError de um corpo malformado/truncado
+            print(f"Erro ao buscar dados da API em {url}: {e}")
+            return None
+
+    def sync_dataframe(
+        self,
+        endpoint: str,
+        key_column: str = "id",
+        cache_path: str = CACHE_PATH,
+        full_refresh: bool = False,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Sincroniza um endpoint com o cache local e retorna a tabela completa.
+
+        Na primeira execução (ou com `full_refresh=True`) todo o histórico é baixado.
+        Nas seguintes, a API recebe `updatedSince=<última sincronização>` e o ETag
+        salvo (If-None-Match), e apenas os registros alterados são mesclados ao cache,
+        substituindo as versões antigas pela chave `key_column`.
+
+        Args:
+            endpoint: O caminho do endpoint (ex: '/avaliacoes').
+            key_column: Coluna que identifica unicamente cada registro.
+            cache_path: Diretório onde ficam os arquivos do cache.
+            full_refresh: Ignora o cache e baixa tudo novamente (ex: para refletir exclusões).
+
+        Returns:
+            Um DataFrame com os dados ou None em caso de erro.
+        """
+        schema = ENDPOINT_SCHEMAS.get(endpoint)
+        cache = _EndpointCache(cache_path, endpoint)
+        cached_df, metadata = (None, {}) if full_refresh else cache.load()
+        if cached_df is not None:
+            # Caches gravados antes do schema atual são projetados nele
+            cached_df = _conform_to_schema(cached_df, schema)
+
+        params, headers = {}, {}
+        if cached_df is not None:
+            params[UPDATED_SINCE_PARAM] = metadata["last_sync"]
+            if metadata.get("etag"):
+                headers["If-None-Match"] = metadata["etag"]
+
+        url = f"{self.base_url}{endpoint}"
+        modo = "incremental" if cached_df is not None else "completa"
+        print(f"Sincronizando dados de: {url} (busca {modo})")
+
+        # O instante é registrado ANTES da busca para não perder alterações feitas durante ela
+        sync_started_at = datetime.now(timezone.utc).isoformat()
+        try:
+            delta_df, etag = self._fetch_frame_with_etag(endpoint, params, headers)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Erro ao buscar dados da API em {url}: {e}")
+            return None
+
+        if delta_df is None:
+            print(f"Nenhuma alteração em {endpoint} desde {metadata['last_sync']}.")
+            return cached_df
+
+        if cached_df is None:
+            merged_df = delta_df
+        elif delta_df.empty:
+            merged_df = cached_df
+        else:
+            print(f"{len(delta_df)} registro(s) alterado(s) em {endpoint}.")
+            merged_df = _concat_frames([cached_df, delta_df], schema)
+            merged_df = merged_df.drop_duplicates(subset=key_column, keep="last")
+            merged_df = merged_df.reset_index(drop=True)
+
+        if merged_df.empty:
+            print(f"Aviso: Nenhum dado retornado do endpoint {endpoint}.")
+            return merged_df
+
+        cache.save(merged_df, {"last_sync": sync_started_at, "etag": etag})
+        return merged_df
+
+    def fetch_many(
+        self, endpoints: Iterable[str], incremental: bool = False
+    ) -> Dict[str, Optional[pd.DataFrame]]:
+        """
+        Busca vários endpoints independentes ao mesmo tempo.
+
+        Args:
+            endpoints: Os caminhos dos endpoints.
+            incremental: Se True, usa o cache local e baixa apenas as alterações
+                (ver `sync_dataframe`).
+
+        Returns:
+            Um dicionário {endpoint: DataFrame ou None em caso de erro}.
+        """
+        endpoints = list(endpoints)
+        fetch = self.sync_dataframe if incremental else self.get_dataframe
+        with ThreadPoolExecutor(max_workers=max(1, len(endpoints))) as executor:
+            return dict(zip(endpoints, executor.map(fetch, endpoints)))
+
+
+class _EndpointCache:
+    """
+    Cache local de um endpoint: a tabela em Parquet e um JSON com os metadados da
+    última sincronização (instante e ETag). As escritas são atômicas.
+    """
+
+    def __init__(self, cache_path: str, endpoint: str):
+        name = endpoint.strip("/").replace("/", "_") or "root"
+        self.table_path = os.path.join(cache_path, f"{name}.parquet")
+        self.metadata_path = os.path.join(cache_path, f"{name}.json")
+
+    def load(self) -> Tuple[Optional[pd.DataFrame], Dict[str, Any]]:
+        if not (os.path.exists(self.table_path) and os.path.exists(self.metadata_path)):
+            return None, {}
+        with open(self.metadata_path, encoding="utf-8") as f:
+            metadata = json.load(f)
+        return pd.read_parquet(self.table_path), metadata
+
+    def save(self, df: pd.DataFrame, metadata: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.table_path), exist_ok=True)
+
+        # Escreve em arquivos temporários e troca de uma vez (os.replace é atômico)
+        df.to_parquet(self.table_path + ".tmp", index=False)
+        with open(self.metadata_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(metadata, f)
+        os.replace(self.table_path + ".tmp", self.table_path)
+        os.replace(self.metadata_path + ".tmp", self.metadata_path)
+
+
 def get_data_from_api(endpoint: str) -> Optional[pd.DataFrame]:
     """
     Busca dados de um endpoint da API e os retorna como um DataFrame do Pandas.
@@ -24,25 +656,8 @@ def get_data_from_api(endpoint: str) -> Optional[pd.DataFrame]:
     Returns:
         Um DataFrame com os dados ou None em caso de erro.
     """
-    base_url = os.getenv("API_BASE_URL")
-    url = f"{base_url}{endpoint}"
-
-    print(f"Buscando dados de: {url}")
-    try:
-        response = requests.get(url, headers=_get_api_headers())
-        response.raise_for_status()  # Lança um erro para status HTTP 4xx/5xx
-
-        data = response.json()
-        if not data:
-            print(f"Aviso: Nenhum dado retornado do endpoint {endpoint}.")
-            return pd.DataFrame()
-
-        # Normaliza o JSON para DataFrame, especialmente se os dados forem aninhados
-        return pd.json_normalize(data)
-
-    except requests.exceptions.RequestException as e:
-        print(f"Erro ao buscar dados da API em {url}: {e}")
-        return None
+    with ApiClient() as client:
+        return client.get_dataframe(endpoint)
 
 
 if __name__ == "__main__":
@@ -51,12 +666,15 @@ if __name__ == "__main__":
 
     load_dotenv()
 
-    avaliacoes = get_data_from_api("/avaliacoes")
+    with ApiClient() as client:
+        dados = client.fetch_many(["/avaliacoes", "/cachacas"])
+
+    avaliacoes = dados["/avaliacoes"]
     if avaliacoes is not None:
         print("\nAmostra de Avaliações:")
         print(avaliacoes.head())
 
-    cachacas = get_data_from_api("/cachacas")
+    cachacas = dados["/cachacas"]
     if cachacas is not None:
         print("\nAmostra de Cachaças:")
         print(cachacas.head())
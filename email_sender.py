@@ -1,31 +1,45 @@
 # email_sender.py
 import os
+import queue
 import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email import base64mime
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
+import metrics
 
-def _format_html_email(recommendations: List[Dict[str, Any]]) -> str:
-    """
-    Cria o corpo do e-mail em HTML a partir da lista de recomendações.
-    """
-    sender_name = os.getenv("EMAIL_SENDER_NAME", "Pingou")
+# Configurações padrão do pool de envio (podem ser sobrescritas pelo .env:
+# EMAIL_POOL_SIZE, EMAIL_MAX_PER_SECOND, EMAIL_MAX_PER_CONNECTION e EMAIL_USE_TLS)
+DEFAULT_POOL_SIZE = 3
+DEFAULT_MAX_PER_SECOND = 10.0
+DEFAULT_MAX_PER_CONNECTION = 100
+
+# Erros que indicam que a conexão caiu (vale reconectar e tentar de novo)
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+_ERRO_CONFIGURACAO = (
+    "ERRO: As variáveis de ambiente do e-mail não estão configuradas no arquivo .env."
+)
 
-    # Início do HTML com estilo CSS incorporado
-    html = f"""
+
+# Trechos fixos do corpo HTML: o início (com o CSS), o cartão de cada cachaça e o fim
+_HTML_HEAD = """
     <html>
     <head>
         <meta charset="UTF-8">
         <style>
-            body {{ font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; line-height: 1.6; background-color: #f9f9f9; color: #333; }}
-            .container {{ max-width: 600px; margin: 20px auto; padding: 20px; border: 1px solid #ddd; border-radius: 8px; background-color: #ffffff; }}
-            .header {{ font-size: 24px; font-weight: bold; color: #8B4513; text-align: center; border-bottom: 2px solid #8B4513; padding-bottom: 10px; margin-bottom: 20px; }}
-            .recommendation {{ margin-bottom: 20px; padding: 15px; border: 1px solid #eee; border-radius: 5px; background-color: #fafafa; }}
-            .rec-title {{ font-weight: bold; font-size: 18px; color: #BF5700; }}
-            .rec-details {{ font-size: 14px; color: #555; margin-top: 5px; }}
-            .rec-description {{ font-style: italic; color: #666; margin-top: 8px; }}
-            .footer {{ text-align: center; font-size: 12px; color: #999; margin-top: 30px; }}
+            body { font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; line-height: 1.6; background-color: #f9f9f9; color: #333; }
+            .container { max-width: 600px; margin: 20px auto; padding: 20px; border: 1px solid #ddd; border-radius: 8px; background-color: #ffffff; }
+            .header { font-size: 24px; font-weight: bold; color: #8B4513; text-align: center; border-bottom: 2px solid #8B4513; padding-bottom: 10px; margin-bottom: 20px; }
+            .recommendation { margin-bottom: 20px; padding: 15px; border: 1px solid #eee; border-radius: 5px; background-color: #fafafa; }
+            .rec-title { font-weight: bold; font-size: 18px; color: #BF5700; }
+            .rec-details { font-size: 14px; color: #555; margin-top: 5px; }
+            .rec-description { font-style: italic; color: #666; margin-top: 8px; }
+            .footer { text-align: center; font-size: 12px; color: #999; margin-top: 30px; }
         </style>
     </head>
     <body>
@@ -35,22 +49,19 @@ def _format_html_email(recommendations: List[Dict[str, Any]]) -> str:
             <p>Com base nas suas últimas avaliações, nosso sistema de recomendação selecionou algumas jóias que têm tudo a ver com o seu paladar:</p>
     """
 
-    # Adiciona cada recomendação dinamicamente
-    for rec in recommendations:
-        html += f"""
+_HTML_CARD = """
         <div class="recommendation">
-            <div class="rec-title">{rec.get('nome', 'Nome Indisponível')}</div>
+            <div class="rec-title">{nome}</div>
             <div class="rec-details">
-                <b>Tipo:</b> {rec.get('tipoCachaca', 'N/A')} | <b>Região:</b> {rec.get('regiao', 'N/A')}
+                <b>Tipo:</b> {tipo} | <b>Região:</b> {regiao}
             </div>
             <div class="rec-description">
-                {rec.get('descricao', 'Descrição não disponível.')}
+                {descricao}
             </div>
         </div>
         """
 
-    # Fim do HTML
-    html += f"""
+_HTML_TAIL = """
             <p>Esperamos que goste das sugestões!</p>
             <div class="footer">
                 Atenciosamente,<br>
@@ -60,7 +71,359 @@ def _format_html_email(recommendations: List[Dict[str, Any]]) -> str:
     </body>
     </html>
     """
-    return html
+
+_PLAIN_TEXT = "Temos novas recomendações de cachaça para você."
+
+# Marcadores usados para recortar o modelo de mensagem MIME serializada
+_RECIPIENT_MARKER = "destinatario@marcador.invalid"
+_HTML_MARKER = "marcador-do-corpo-html"
+
+
+def _campo(rec: Dict[str, Any], chave: str, padrao: str) -> Any:
+    """Valor de um campo da recomendação, com `padrao` se ausente, None ou NaN."""
+    valor = rec.get(chave)
+    # NaN é o único valor diferente de si mesmo (nulos de colunas categóricas)
+    return padrao if valor is None or valor != valor else valor
+
+
+def _render_card(rec: Dict[str, Any]) -> str:
+    """Renderiza o cartão HTML de uma cachaça recomendada."""
+    return _HTML_CARD.format(
+        nome=_campo(rec, "nome", "Nome Indisponível"),
+        tipo=_campo(rec, "tipoCachaca", "N/A"),
+        regiao=_campo(rec, "regiao", "N/A"),
+        descricao=_campo(rec, "descricao", "Descrição não disponível."),
+    )
+
+
+def _format_html_email(recommendations: List[Dict[str, Any]]) -> str:
+    """
+    Cria o corpo do e-mail em HTML a partir da lista de recomendações.
+    """
+    sender_name = os.getenv("EMAIL_SENDER_NAME", "Pingou")
+    partes = [_HTML_HEAD]
+    partes.extend(_render_card(rec) for rec in recommendations)
+    partes.append(_HTML_TAIL.format(sender_name=sender_name))
+    return "".join(partes)
+
+
+def _build_message(
+    recipient_email: str,
+    recommendations: List[Dict[str, Any]],
+    sender_email: str,
+    sender_name: str,
+) -> MIMEMultipart:
+    """Monta a mensagem MIME (texto + HTML) com as recomendações de um destinatário."""
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = f"Suas recomendações de cachaça da semana | {sender_name}"
+    msg["From"] = f"{sender_name} <{sender_email}>"
+    msg["To"] = recipient_email
+
+    html_body = _format_html_email(recommendations)
+    msg.attach(MIMEText(_PLAIN_TEXT, "plain"))
+    msg.attach(MIMEText(html_body, "html"))
+    return msg
+
+
+class BulkRenderer:
+    """
+    Renderiza as mensagens de muitos destinatários reaproveitando tudo o que é igual
+    entre elas.
+
+    O início e o fim do HTML, os cabeçalhos fixos (Subject, From), a parte em texto
+    puro e a estrutura MIME são preparados uma única vez, em um modelo de mensagem já
+    serializado. O cartão de cada cachaça é renderizado uma vez por execução e
+    guardado pelo seu id. Cada mensagem é então montada com um único join: cartões
+    do cache, o corpo HTML em base64 e o destinatário encaixados no modelo.
+
+    O resultado é equivalente ao de `render_message` (mesmos cabeçalhos e partes);
+    só o delimitador entre as partes é o mesmo para todas as mensagens da execução.
+    """
+
+    def __init__(
+        self, sender_email: Optional[str] = None, sender_name: Optional[str] = None
+    ):
+        self.sender_email = sender_email or os.getenv("EMAIL_USER")
+        self.sender_name = sender_name or os.getenv("EMAIL_SENDER_NAME", "Pingou")
+        self._html_tail = _HTML_TAIL.format(sender_name=self.sender_name)
+        self._cards: Dict[Any, str] = {}
+
+        # Serializa uma mensagem com marcadores no lugar do destinatário e do corpo
+        # HTML e a recorta nos trechos fixos que ficam entre eles
+        modelo = _build_message(
+            _RECIPIENT_MARKER, [], self.sender_email, self.sender_name
+        )
+        # (a parte HTML já é declarada em UTF-8 e base64)
+        modelo.get_payload(1).set_payload(_HTML_MARKER)
+        texto = modelo.as_string()
+        self._prefix, resto = texto.split(_RECIPIENT_MARKER)
+        self._middle, self._suffix = resto.split(_HTML_MARKER)
+
+    def _card(self, rec: Dict[str, Any]) -> str:
+        chave = rec.get("id")
+        if chave is None:
+            return _render_card(rec)
+        card = self._cards.get(chave)
+        if card is None:
+            card = self._cards[chave] = _render_card(rec)
+        return card
+
+    def render_html(self, recommendations: List[Dict[str, Any]]) -> str:
+        """Corpo HTML de um destinatário, montado a partir dos trechos em cache."""
+        return "".join(
+            [_HTML_HEAD, *map(self._card, recommendations), self._html_tail]
+        )
+
+    def render(self, recipient_email: str, recommendations: List[Dict[str, Any]]) -> str:
+        """Mensagem completa e serializada de um destinatário (como `render_message`)."""
+        if not _is_plain_address(recipient_email):
+            # Endereços que precisam de codificação passam pelo caminho completo
+            return _build_message(
+                recipient_email, recommendations, self.sender_email, self.sender_name
+            ).as_string()
+        html_body = self.render_html(recommendations).encode("utf-8")
+        return "".join(
+            [
+                self._prefix,
+                recipient_email,
+                self._middle,
+                base64mime.body_encode(html_body),
+                self._suffix,
+            ]
+        )
+
+    def render_many(
+        self, emails: Iterable[Tuple[str, List[Dict[str, Any]]]]
+    ) -> List[str]:
+        """Renderiza em lote as mensagens de vários pares (email, recomendações)."""
+        return [self.render(email, recs) for email, recs in emails]
+
+
+def _is_plain_address(endereco: str) -> bool:
+    """Endereço ASCII simples, que entra no cabeçalho To sem codificação nem dobra."""
+    return (
+        endereco.isascii()
+        and endereco.isprintable()
+        and len(endereco) < 72
+        and not any(c in endereco for c in ' ,;:"()<>')
+    )
+
+
+def render_message(recipient_email: str, recommendations: List[Dict[str, Any]]) -> str:
+    """
+    Renderiza e serializa a mensagem completa de um destinatário, pronta para ser
+    gravada na caixa de saída (ver `outbox.Outbox`) e enviada depois.
+
+    Para muitos destinatários, use `BulkRenderer`.
+    """
+    sender_email = os.getenv("EMAIL_USER")
+    sender_name = os.getenv("EMAIL_SENDER_NAME", "Pingou")
+    return _build_message(
+        recipient_email, recommendations, sender_email, sender_name
+    ).as_string()
+
+
+class _RateLimiter:
+    """Limita o envio a `max_per_second` mensagens por segundo, somando todas as threads."""
+
+    def __init__(self, max_per_second: Optional[float]):
+        self.interval = 1.0 / max_per_second if max_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        # Cada chamada reserva o próximo horário livre e dorme (fora do lock) até ele
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class _PooledConnection:
+    """Uma conexão SMTP autenticada e quantas mensagens já foram enviadas por ela."""
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.sent = 0
+
+
+class SmtpPool:
+    """
+    Pool pequeno de conexões SMTP de longa duração, já com STARTTLS e login feitos,
+    que envia muitas mensagens por conexão.
+
+    As mensagens são despachadas por threads (uma por conexão do pool), conexões
+    perdidas são refeitas automaticamente e a taxa total de envio respeita o limite
+    de mensagens por segundo configurado.
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        sender_email: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        max_per_second: Optional[float] = None,
+        max_per_connection: Optional[int] = None,
+        use_tls: Optional[bool] = None,
+        timeout: float = 30.0,
+        login: bool = True,
+    ):
+        # Busca as credenciais de e-mail do arquivo .env quando não informadas
+        self.host = host or os.getenv("EMAIL_HOST")
+        self.port = port or int(os.getenv("EMAIL_PORT", 587))
+        self.user = user or os.getenv("EMAIL_USER")
+        self.password = password or os.getenv("EMAIL_PASSWORD")
+        self.sender_email = sender_email or self.user
+        self.sender_name = os.getenv("EMAIL_SENDER_NAME", "Pingou")
+        self.pool_size = max(
+            1, pool_size or int(os.getenv("EMAIL_POOL_SIZE", DEFAULT_POOL_SIZE))
+        )
+        if max_per_second is None:
+            max_per_second = float(
+                os.getenv("EMAIL_MAX_PER_SECOND", DEFAULT_MAX_PER_SECOND)
+            )
+        self.max_per_connection = max_per_connection or int(
+            os.getenv("EMAIL_MAX_PER_CONNECTION", DEFAULT_MAX_PER_CONNECTION)
+        )
+        if use_tls is None:
+            use_tls = os.getenv("EMAIL_USE_TLS", "true").lower() != "false"
+        self.use_tls = use_tls
+        self.timeout = timeout
+        # Sem login apenas em relays internos ou servidores locais de teste
+        self.login = login
+
+        self._limiter = _RateLimiter(max_per_second)
+        self._renderer = BulkRenderer(self.sender_email, self.sender_name)
+
+        # Conexões ociosas; None representa uma vaga do pool ainda sem conexão aberta
+        self._idle: "queue.LifoQueue[Optional[_PooledConnection]]" = queue.LifoQueue()
+        for _ in range(self.pool_size):
+            self._idle.put(None)
+
+    def _connect(self) -> _PooledConnection:
+        metrics.inc("smtp_connections_total")
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()  # Ativa a segurança
+        if self.login:
+            server.login(self.user, self.password)
+        return _PooledConnection(server)
+
+    def check_settings(self) -> bool:
+        """
+        Verifica se o servidor e as credenciais (quando há login) estão configurados.
+        Se não estiverem, imprime o erro e retorna False, sem abrir conexões.
+        """
+        obrigatorias = [self.host, self.port]
+        if self.login:
+            obrigatorias += [self.user, self.password]
+        if not all(obrigatorias):
+            print(_ERRO_CONFIGURACAO)
+            return False
+        return True
+
+    @staticmethod
+    def _disconnect(connection: Optional[_PooledConnection]):
+        if connection is None:
+            return
+        try:
+            connection.server.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.server.close()
+
+    def send_message(self, recipient_email: str, msg: Union[MIMEMultipart, str]):
+        """
+        Envia uma mensagem (objeto MIME ou já serializada) usando uma conexão livre do
+        pool (bloqueia até haver uma). Se a conexão tiver caído, reconecta e tenta mais
+        uma vez.
+        """
+        payload = msg if isinstance(msg, str) else msg.as_string()
+        self._limiter.wait()
+        connection = self._idle.get()
+        inicio = time.perf_counter()
+        try:
+            for tentativa in range(2):
+                try:
+                    if connection is None:
+                        connection = self._connect()
+                    connection.server.sendmail(
+                        self.sender_email, recipient_email, payload
+                    )
+                    connection.sent += 1
+                    break
+                except RECONNECT_ERRORS:
+                    self._disconnect(connection)
+                    connection = None
+                    if tentativa == 1:
+                        raise
+            # Latência do envio em si (sem a espera pelo limite de taxa e pelo pool)
+            metrics.observe("email_send_seconds", time.perf_counter() - inicio)
+            metrics.inc("emails_sent_total")
+            metrics.inc("email_bytes_total", len(payload))
+
+            # Recicla a conexão depois de muitas mensagens (limite comum em relays)
+            if connection.sent >= self.max_per_connection:
+                self._disconnect(connection)
+                connection = None
+        except Exception:
+            metrics.inc("email_send_failures_total")
+            raise
+        finally:
+            self._idle.put(connection)
+
+    def send_many(
+        self, emails: Iterable[Tuple[str, List[Dict[str, Any]]]]
+    ) -> Dict[str, bool]:
+        """
+        Envia vários e-mails de recomendação em paralelo pelas conexões do pool.
+
+        Args:
+            emails: Pares (email_destinatario, lista_de_recomendacoes).
+
+        Returns:
+            Um dicionário {email_destinatario: True se enviado com sucesso} (vazio se o
+            e-mail não estiver configurado).
+        """
+        if not self.check_settings():
+            return {}
+
+        def enviar(item: Tuple[str, List[Dict[str, Any]]]) -> Tuple[str, bool]:
+            recipient_email, recommendations = item
+            msg = self._renderer.render(recipient_email, recommendations)
+            try:
+                self.send_message(recipient_email, msg)
+                return recipient_email, True
+            except Exception as e:
+                print(f"FALHA ao enviar e-mail para {recipient_email}: {e}")
+                return recipient_email, False
+
+        emails = [(email, recs) for email, recs in emails if recs]
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            resultados = dict(executor.map(enviar, emails))
+
+        enviados = sum(resultados.values())
+        print(f"{enviados}/{len(resultados)} e-mail(s) enviados com sucesso.")
+        return resultados
+
+    def close(self):
+        """Encerra todas as conexões abertas do pool."""
+        connections = [self._idle.get() for _ in range(self.pool_size)]
+        for connection in connections:
+            self._disconnect(connection)
+            self._idle.put(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 def send_recommendation_email(
@@ -68,6 +431,8 @@ def send_recommendation_email(
 ):
     """
     Envia um e-mail com as cachaças recomendadas para um destinatário.
+
+    Abre uma conexão só para esta mensagem; para enviar muitos e-mails, use `SmtpPool`.
     """
     if not recommendations:
         print(f"Nenhuma recomendação para enviar para {recipient_email}.")
@@ -83,20 +448,11 @@ def send_recommendation_email(
 
     # Verifica se as credenciais estão presentes
     if not all([host, port, user, password]):
-        print(
-            "ERRO: As variáveis de ambiente do e-mail não estão configuradas no arquivo .env."
-        )
+        print(_ERRO_CONFIGURACAO)
         return
 
     # Montando a mensagem de e-mail
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = f"Suas recomendações de cachaça da semana | {sender_name}"
-    msg["From"] = f"{sender_name} <{sender_email}>"
-    msg["To"] = recipient_email
-
-    html_body = _format_html_email(recommendations)
-    msg.attach(MIMEText("Temos novas recomendações de cachaça para você.", "plain"))
-    msg.attach(MIMEText(html_body, "html"))
+    msg = _build_message(recipient_email, recommendations, sender_email, sender_name)
 
     try:
         print(f"Tentando enviar e-mail para {recipient_email}...")
@@ -0,0 +1,182 @@
+# features.py
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Tamanho do espaço de hash das features das cachaças e dos usuários. Cada valor de
+# atributo (ex: 'regiao=Salinas') cai em um destes baldes, então as matrizes de
+# features e as tabelas de embeddings têm tamanho fixo, não importa quantos valores
+# novos apareçam (o preço é que valores raros podem dividir um balde)
+ITEM_FEATURE_BUCKETS = 1 << 12
+USER_FEATURE_BUCKETS = 1 << 10
+
+# Prefixos dos nomes dos baldes no Dataset do LightFM ('item#0', 'user#17', ...)
+ITEM_PREFIX = "item"
+USER_PREFIX = "user"
+
+# Atributos do catálogo usados como features das cachaças. Colunas ausentes no
+# catálogo são simplesmente ignoradas.
+ITEM_CATEGORICAL_COLUMNS = ("tipoCachaca", "regiao")
+# Campos numéricos entram pela faixa em que caem (bordas das faixas)
+ITEM_NUMERIC_BINS: Dict[str, Sequence[float]] = {
+    "teorAlcoolico": (38.0, 40.0, 42.0, 44.0, 46.0, 48.0),
+    "preco": (30.0, 50.0, 80.0, 120.0, 200.0, 400.0),
+}
+# Campos multivalorados: cada tag é uma feature (peso dividido entre as tags do item)
+ITEM_TAG_COLUMNS = ("tags",)
+TAG_SEPARATOR = "|"
+
+# Atributos dos usuários que vêm junto com as avaliações (ex: região onde moram)
+USER_CATEGORICAL_COLUMNS = ("user.regiao",)
+
+# Perfil de gosto: atributos das cachaças que o usuário avaliou com pelo menos
+# NOTA_MINIMA_GOSTO viram features do usuário, com peso proporcional à frequência
+TASTE_COLUMNS = ("tipoCachaca", "regiao")
+NOTA_MINIMA_GOSTO = 7.0
+
+_TOKEN_COLUMNS = ["id", "token", "peso"]
+
+
+def bucket_names(prefix: str, n_buckets: int) -> List[str]:
+    """Nomes dos baldes do espaço de hash, na forma usada no Dataset do LightFM."""
+    return [f"{prefix}#{balde}" for balde in range(n_buckets)]
+
+
+def hash_tokens(tokens: Sequence[str], n_buckets: int) -> np.ndarray:
+    """
+    Calcula o balde de cada token de forma vetorizada.
+
+    Usa `pd.util.hash_array` (chave fixa), que dá o mesmo resultado em qualquer
+    processo e execução, ao contrário de `hash()` do Python.
+    """
+    hashes = pd.util.hash_array(np.asarray(tokens, dtype=object), categorize=True)
+    return (hashes % np.uint64(n_buckets)).astype(np.int64)
+
+
+def feature_config() -> Dict[str, Any]:
+    """Configuração do espaço de features (muda o significado de cada balde)."""
+    return {
+        "item_buckets": ITEM_FEATURE_BUCKETS,
+        "user_buckets": USER_FEATURE_BUCKETS,
+        "item_categorical": list(ITEM_CATEGORICAL_COLUMNS),
+        "item_numeric_bins": {k: list(v) for k, v in ITEM_NUMERIC_BINS.items()},
+        "item_tags": list(ITEM_TAG_COLUMNS),
+        "user_categorical": list(USER_CATEGORICAL_COLUMNS),
+        "taste": list(TASTE_COLUMNS),
+        "nota_minima_gosto": NOTA_MINIMA_GOSTO,
+    }
+
+
+def _tokens(ids: np.ndarray, tokens, pesos=1.0) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "token": np.asarray(tokens, dtype=object),
+            "peso": np.broadcast_to(np.float32(pesos), len(ids)).astype(np.float32),
+        }
+    )
+
+
+def _categorical_tokens(
+    ids: np.ndarray, valores: pd.Series, prefixo: str
+) -> pd.DataFrame:
+    """Um token 'coluna=valor' por linha com valor preenchido."""
+    presentes = valores.notna().to_numpy()
+    textos = valores[presentes].astype(str).to_numpy(dtype=object)
+    return _tokens(ids[presentes], prefixo + "=" + textos)
+
+
+def _numeric_tokens(
+    ids: np.ndarray, valores: pd.Series, coluna: str, bordas: Sequence[float]
+) -> pd.DataFrame:
+    """Um token 'coluna#faixa' por linha com valor numérico."""
+    numeros = pd.to_numeric(valores, errors="coerce").to_numpy(dtype=np.float64)
+    presentes = ~np.isnan(numeros)
+    faixas = np.digitize(numeros[presentes], bordas)
+    return _tokens(ids[presentes], f"{coluna}#" + faixas.astype(str).astype(object))
+
+
+def _tag_tokens(ids: np.ndarray, valores: pd.Series, coluna: str) -> pd.DataFrame:
+    """Um token 'coluna=tag' por tag; o peso do item é dividido entre as suas tags."""
+    tags = valores.map(
+        lambda v: v.split(TAG_SEPARATOR) if isinstance(v, str) else v
+    )
+    explodido = pd.DataFrame({"id": ids, "tag": tags.to_numpy()}).explode("tag")
+    explodido["tag"] = explodido["tag"].astype(str).str.strip().where(
+        explodido["tag"].notna()
+    )
+    explodido = explodido[explodido["tag"].notna() & (explodido["tag"] != "")]
+    explodido = explodido.drop_duplicates()
+    por_item = explodido.groupby("id")["tag"].transform("size").to_numpy()
+    return _tokens(
+        explodido["id"].to_numpy(),
+        f"{coluna}=" + explodido["tag"].to_numpy(dtype=object),
+        1.0 / por_item,
+    )
+
+
+def _concat(partes: List[pd.DataFrame]) -> pd.DataFrame:
+    partes = [parte for parte in partes if not parte.empty]
+    if not partes:
+        return pd.DataFrame({coluna: [] for coluna in _TOKEN_COLUMNS})
+    return pd.concat(partes, ignore_index=True)
+
+
+def item_tokens(cachacas_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Lista os atributos de cada cachaça como tokens a serem hasheados.
+
+    Returns:
+        Um DataFrame com as colunas ['id', 'token', 'peso'], uma linha por atributo.
+    """
+    ids = cachacas_df["id"].to_numpy()
+    partes = []
+    for coluna in ITEM_CATEGORICAL_COLUMNS:
+        if coluna in cachacas_df:
+            partes.append(_categorical_tokens(ids, cachacas_df[coluna], coluna))
+    for coluna, bordas in ITEM_NUMERIC_BINS.items():
+        if coluna in cachacas_df:
+            partes.append(_numeric_tokens(ids, cachacas_df[coluna], coluna, bordas))
+    for coluna in ITEM_TAG_COLUMNS:
+        if coluna in cachacas_df:
+            partes.append(_tag_tokens(ids, cachacas_df[coluna], coluna))
+    return _concat(partes)
+
+
+def taste_tokens(cachacas_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tokens do perfil de gosto que cada cachaça transmite a quem gostou dela
+    ('gosto:tipoCachaca=OURO', ...). Cada coluna de TASTE_COLUMNS pesa o mesmo.
+
+    Returns:
+        Um DataFrame com as colunas ['id', 'token', 'peso'] (id da cachaça).
+    """
+    colunas = [coluna for coluna in TASTE_COLUMNS if coluna in cachacas_df]
+    ids = cachacas_df["id"].to_numpy()
+    partes = []
+    for coluna in colunas:
+        parte = _categorical_tokens(ids, cachacas_df[coluna], f"gosto:{coluna}")
+        parte["peso"] = np.float32(1.0 / len(colunas))
+        partes.append(parte)
+    return _concat(partes)
+
+
+def user_tokens(avaliacoes_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tokens dos atributos próprios dos usuários (USER_CATEGORICAL_COLUMNS) que vêm nas
+    avaliações. Vale o valor da avaliação mais recente de cada usuário.
+
+    Returns:
+        Um DataFrame com as colunas ['id', 'token', 'peso'] (id do usuário).
+    """
+    colunas = [coluna for coluna in USER_CATEGORICAL_COLUMNS if coluna in avaliacoes_df]
+    if not colunas:
+        return _concat([])
+    usuarios = avaliacoes_df[["user.id", *colunas]].drop_duplicates(
+        subset="user.id", keep="last"
+    )
+    ids = usuarios["user.id"].to_numpy()
+    return _concat(
+        [_categorical_tokens(ids, usuarios[coluna], coluna) for coluna in colunas]
+    )
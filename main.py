@@ -1,81 +1,217 @@
 # main.py
-import model_trainer
+import os
+import sys
+
+import pandas as pd
 from dotenv import load_dotenv
 
 import data_fetcher
 import email_sender
-from recommender import Recommender
+import metrics
+import pipeline
+from outbox import Outbox
+from recommender import COLD_START_MAX_RATINGS, DEFAULT_SHARD_SIZE, Recommender
+from stage_cache import StageCache, fingerprint
+
+# Quantas cachaças recomendar por e-mail
+TOP_N = 3
 
 
-def run_recommendation_pipeline():
+def _opcoes_recomendacao() -> dict:
     """
-    Orquestra o pipeline completo:
-    1. Busca dados da API Java.
-    2. Treina o modelo de recomendação.
-    3. Gera e envia recomendações por e-mail para cada usuário.
+    Filtros e diversidade das recomendações enviadas por e-mail (pelo .env:
+    RECS_ONLY_AVAILABLE=true só recomenda cachaças disponíveis e RECS_MAX_PER_TYPE
+    limita quantas cachaças de um mesmo tipo entram em cada e-mail).
     """
-    print("=" * 60)
-    print("INICIANDO PIPELINE DE RECOMENDAÇÃO DE CACHAÇAS")
-    print(
-        f"Data e Hora: {pd.Timestamp.now(tz='America/Sao_Paulo').strftime('%d/%m/%Y %H:%M:%S')}"
-    )
-    print("=" * 60)
+    filtros = {}
+    if os.getenv("RECS_ONLY_AVAILABLE", "false").lower() == "true":
+        filtros["disponivel"] = True
+    max_por_tipo = os.getenv("RECS_MAX_PER_TYPE")
+    return {
+        "filters": filtros or None,
+        "max_per_type": int(max_por_tipo) if max_por_tipo else None,
+    }
 
+
+def _gerar_recomendacoes(run_id: str, outbox: Outbox) -> bool:
+    """
+    Busca os dados, treina o modelo e grava na caixa de saída um e-mail renderizado
+    por usuário. Não espera por nenhum envio SMTP.
+
+    Returns:
+        True se as mensagens foram gravadas, False se o pipeline precisou ser abortado.
+    """
     # --- PASSO 1: BUSCAR DADOS FRESCOS DA API ---
-    print("\n[PASSO 1/3] Buscando dados da API Java...")
-    avaliacoes_df = data_fetcher.get_data_from_api("/avaliacoes")
-    cachacas_df = data_fetcher.get_data_from_api("/cachacas")
+    print("\n[PASSO 1/4] Buscando dados da API Java...")
+    # Os dois endpoints são independentes: buscamos ambos em paralelo, baixando apenas
+    # o que mudou desde a última execução (o restante vem do cache local)
+    with metrics.stage("busca"), data_fetcher.ApiClient() as api_client:
+        dados = api_client.fetch_many(["/avaliacoes", "/cachacas"], incremental=True)
+    avaliacoes_df = dados["/avaliacoes"]
+    cachacas_df = dados["/cachacas"]
 
     if avaliacoes_df is None or cachacas_df is None or avaliacoes_df.empty:
         print(
             "Pipeline abortado: não foi possível buscar dados ou não há avaliações para processar."
         )
-        return
+        return False
 
     # --- PASSO 2: TREINAR O MODELO ---
-    print("\n[PASSO 2/3] Treinando o modelo de IA com os novos dados...")
-    model_trainer.train_and_save_model(avaliacoes_df, cachacas_df)
+    print("\n[PASSO 2/4] Treinando o modelo de IA com os novos dados...")
+    # Modo incremental: continua o modelo anterior e faz um retreino completo periodicamente
+    with metrics.stage("treinamento"):
+        pipeline.executar_pipeline_treinamento(
+            avaliacoes_df, cachacas_df, incremental=True
+        )
+
+    # --- PASSO 3: GERAR AS RECOMENDAÇÕES E GRAVAR NA CAIXA DE SAÍDA ---
+    print("\n[PASSO 3/4] Gerando recomendações e preparando os e-mails...")
+    with metrics.stage("recomendacoes"):
+        return _gravar_recomendacoes(run_id, outbox, avaliacoes_df)
 
-    # --- PASSO 3: GERAR E ENVIAR RECOMENDAÇÕES ---
-    print("\n[PASSO 3/3] Gerando e enviando recomendações por e-mail...")
+
+def _gravar_recomendacoes(
+    run_id: str, outbox: Outbox, avaliacoes_df: pd.DataFrame
+) -> bool:
+    """Gera as recomendações de todos os usuários e grava os e-mails na caixa de saída."""
     recommender_system = Recommender()
 
-    if not recommender_system.model:
+    if not recommender_system.loaded:
         print("Pipeline abortado pois o modelo de recomendação não foi carregado.")
-        return
+        return False
 
     # Pega a lista de usuários únicos que fizeram avaliações
     unique_users = avaliacoes_df["user.id"].unique()
     print(f"Encontrados {len(unique_users)} usuários únicos para processar.")
 
-    for user_id in unique_users:
-        print(f"\n--- Processando recomendações para o usuário ID: {user_id} ---")
+    # Mesma versão do modelo, mesmos usuários e mesmos parâmetros: as recomendações da
+    # execução anterior continuam válidas e não precisam ser recalculadas
+    opcoes = _opcoes_recomendacao()
+    cache_etapas = StageCache()
+    impressao = fingerprint(
+        recommender_system.version,
+        unique_users,
+        TOP_N,
+        COLD_START_MAX_RATINGS,
+        opcoes,
+    )
+    recomendacoes_anteriores = cache_etapas.load("recomendacoes", impressao)
+    if recomendacoes_anteriores is not None:
+        print("Reaproveitando as recomendações já calculadas para este modelo.")
+        shard_results = [recomendacoes_anteriores]
+    else:
+        # Os usuários são divididos em fatias processadas em paralelo (RECS_WORKERS
+        # processos, RECS_SHARD_SIZE usuários por fatia); cada fatia é tratada assim
+        # que fica pronta
+        shard_results = recommender_system.recommend_sharded(
+            user_ids=unique_users,
+            top_n=TOP_N,
+            workers=int(os.getenv("RECS_WORKERS", os.cpu_count() or 1)),
+            shard_size=int(os.getenv("RECS_SHARD_SIZE", DEFAULT_SHARD_SIZE)),
+            **opcoes,
+        )
+
+    # O início e o fim do HTML, a estrutura MIME e o cartão de cada cachaça são
+    # preparados uma vez e reaproveitados em todas as mensagens
+    renderer = email_sender.BulkRenderer()
+    todas_recomendacoes = {}
+    mensagens = []
+    for shard_recommendations in shard_results:
+        todas_recomendacoes.update(shard_recommendations)
+        destinatarios = []
+        for user_id, recommendations in shard_recommendations.items():
+            if recommendations:
+                # Em um cenário real, você teria um endpoint para buscar o email do usuário.
+                # Ex: user_email = data_fetcher.get_user_details(user_id)['email']
+                user_email = f"user_{user_id}@exemplo.com"  # << SUBSTITUIR PELA LÓGICA REAL
+                destinatarios.append((user_id, user_email, recommendations))
+            else:
+                print(f"Nenhuma nova recomendação encontrada para o usuário {user_id}.")
+        renderizadas = renderer.render_many(
+            (user_email, recommendations)
+            for _, user_email, recommendations in destinatarios
+        )
+        mensagens.extend(
+            (user_id, user_email, mensagem)
+            for (user_id, user_email, _), mensagem in zip(destinatarios, renderizadas)
+        )
 
-        # Gera as recomendações para o usuário atual
-        recommendations = recommender_system.generate_recommendations(
-            user_id=user_id,
-            user_ratings_df=avaliacoes_df,
-            top_n=3,  # Recomendar o Top 3
+    if recomendacoes_anteriores is None:
+        cache_etapas.save(
+            "recomendacoes",
+            impressao,
+            todas_recomendacoes,
+            version=recommender_system.version,
         )
 
-        if recommendations:
-            # Em um cenário real, você teria um endpoint para buscar o email do usuário.
-            # Ex: user_email = data_fetcher.get_user_details(user_id)['email']
-            user_email = f"user_{user_id}@exemplo.com"  # << SUBSTITUIR PELA LÓGICA REAL
-            print(
-                f"Encontradas {len(recommendations)} recomendações. Enviando e-mail para {user_email}."
-            )
+    # Todas as mensagens entram em uma única transação: ou a rodada inteira fica
+    # registrada, ou nada (e a próxima execução refaz este passo)
+    gravadas = outbox.enqueue_many(run_id, mensagens)
+    print(f"{gravadas} e-mail(s) gravado(s) na caixa de saída.")
+    return True
+
+
+def run_recommendation_pipeline() -> bool:
+    """
+    Orquestra o pipeline completo:
+    1. Busca dados da API Java.
+    2. Treina o modelo de recomendação.
+    3. Gera as recomendações e grava os e-mails na caixa de saída.
+    4. Envia os e-mails pendentes da caixa de saída.
+
+    Cada rodada tem um identificador (PIPELINE_RUN_ID, por padrão a data do dia). Se
+    os e-mails desta rodada já estão na caixa de saída (ex: a execução anterior caiu
+    durante o envio), os passos 1 a 3 são pulados e apenas o que falta é enviado.
+
+    Returns:
+        True se a rodada terminou com todos os e-mails enviados; False se o pipeline
+        foi abortado, se o e-mail não está configurado ou se algum envio falhou.
+    """
+    agora = pd.Timestamp.now(tz="America/Sao_Paulo")
+    run_id = os.getenv("PIPELINE_RUN_ID") or agora.strftime("%Y-%m-%d")
+
+    print("=" * 60)
+    print("INICIANDO PIPELINE DE RECOMENDAÇÃO DE CACHAÇAS")
+    print(f"Data e Hora: {agora.strftime('%d/%m/%Y %H:%M:%S')} | Rodada: {run_id}")
+    print("=" * 60)
 
-            email_sender.send_recommendation_email(user_email, recommendations)
-        else:
-            print(f"Nenhuma nova recomendação encontrada para o usuário {user_id}.")
+    try:
+        with Outbox() as outbox:
+            if outbox.has_run(run_id):
+                print(
+                    f"\nOs e-mails da rodada {run_id} já foram gerados. "
+                    "Retomando apenas o envio."
+                )
+            elif not _gerar_recomendacoes(run_id, outbox):
+                return False
+
+            # --- PASSO 4: ENVIAR OS E-MAILS PENDENTES ---
+            print("\n[PASSO 4/4] Enviando os e-mails pendentes...")
+            # Reaproveita um pool de conexões SMTP autenticadas
+            with metrics.stage("envio"), email_sender.SmtpPool() as smtp_pool:
+                configurado = smtp_pool.check_settings()
+                falhas = outbox.drain(smtp_pool)[1] if configurado else 0
+    finally:
+        # Métricas da rodada (JSON e textfile do Prometheus), mesmo se ela falhar
+        metrics.set_gauge("pipeline_last_run_timestamp_seconds", agora.timestamp())
+        caminho_json, _ = metrics.export()
+        print(f"\nMétricas da rodada gravadas em '{caminho_json}'.")
 
     print("\n" + "=" * 60)
-    print("PIPELINE DE RECOMENDAÇÃO CONCLUÍDO COM SUCESSO!")
+    if not configurado:
+        print("PIPELINE CONCLUÍDO SEM ENVIO: o e-mail não está configurado.")
+        print("Os e-mails continuam na caixa de saída para a próxima execução.")
+    elif falhas:
+        print(f"PIPELINE CONCLUÍDO COM FALHAS: {falhas} e-mail(s) não enviado(s).")
+        print("Eles continuam na caixa de saída e serão tentados de novo.")
+    else:
+        print("PIPELINE DE RECOMENDAÇÃO CONCLUÍDO COM SUCESSO!")
     print("=" * 60)
+    return configurado and not falhas
 
 
 if __name__ == "__main__":
     # Carrega as variáveis de ambiente do arquivo .env para o sistema
     load_dotenv()
-    run_recommendation_pipeline()
+    # Código de saída diferente de zero para o agendador (ex: cron) perceber a falha
+    sys.exit(0 if run_recommendation_pipeline() else 1)
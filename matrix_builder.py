@@ -0,0 +1,249 @@
+# matrix_builder.py
+from typing import Any, Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import features
+
+
+def lookup_indices(mapping: Dict[Any, int], ids: Iterable[Any]) -> np.ndarray:
+    """
+    Traduz IDs reais para índices internos de uma só vez (busca vetorizada via pd.Index).
+
+    Args:
+        mapping: Dicionário {id_real: indice_interno} (ex: um dos mapeamentos do Dataset).
+        ids: Os IDs a traduzir.
+
+    Returns:
+        Um array int64 com os índices internos; IDs desconhecidos recebem -1.
+    """
+    chaves = pd.Index(list(mapping.keys()))
+    valores = np.fromiter(mapping.values(), dtype=np.int64, count=len(mapping))
+    posicoes = chaves.get_indexer(pd.Index(ids))
+    return np.where(posicoes >= 0, valores[posicoes], -1)
+
+
+def _check_known(indices: np.ndarray, ids: Sequence[Any], descricao: str):
+    """Lança ValueError (como o Dataset do LightFM) se algum ID não estiver mapeado."""
+    desconhecidos = indices < 0
+    if desconhecidos.any():
+        exemplo = np.asarray(ids)[desconhecidos][0]
+        raise ValueError(
+            f"{descricao} {exemplo} não está no mapeamento do dataset. "
+            f"Chame dataset.fit (ou fit_partial) com todos os IDs antes de construir as matrizes."
+        )
+
+
+def build_interactions(
+    dataset, avaliacoes_df: pd.DataFrame
+) -> Tuple[sparse.coo_matrix, sparse.coo_matrix]:
+    """
+    Constrói as matrizes de interações e de pesos (notas) diretamente a partir das
+    colunas do DataFrame, sem iterar linha a linha.
+
+    Produz o mesmo resultado que `dataset.build_interactions` alimentado com tuplas
+    (user.id, cachaca.id, notaGeral).
+
+    Args:
+        dataset: O Dataset do LightFM já ajustado (fit) com todos os usuários e itens.
+        avaliacoes_df: DataFrame com colunas ['user.id', 'cachaca.id', 'notaGeral'].
+
+    Returns:
+        Uma tupla (interactions, weights) de matrizes COO (usuários x itens).
+    """
+    user_id_map, _, item_id_map, _ = dataset.mapping()
+
+    user_ids = avaliacoes_df["user.id"].to_numpy()
+    item_ids = avaliacoes_df["cachaca.id"].to_numpy()
+    linhas = lookup_indices(user_id_map, user_ids)
+    colunas = lookup_indices(item_id_map, item_ids)
+    _check_known(linhas, user_ids, "Usuário")
+    _check_known(colunas, item_ids, "Cachaça")
+
+    shape = dataset.interactions_shape()
+    linhas = linhas.astype(np.int32)
+    colunas = colunas.astype(np.int32)
+    interactions = sparse.coo_matrix(
+        (np.ones(len(linhas), dtype=np.int32), (linhas, colunas)), shape=shape
+    )
+    weights = sparse.coo_matrix(
+        (avaliacoes_df["notaGeral"].to_numpy(dtype=np.float32), (linhas, colunas)),
+        shape=shape,
+    )
+    return interactions, weights
+
+
+def _bucket_columns(
+    feature_map: Dict[Any, int], prefix: str, n_buckets: int
+) -> np.ndarray:
+    """Índice interno (coluna da matriz de features) de cada balde do espaço de hash."""
+    nomes = features.bucket_names(prefix, n_buckets)
+    colunas = lookup_indices(feature_map, nomes)
+    _check_known(colunas, nomes, "Feature")
+    return colunas
+
+
+def _identity_entries(
+    id_map: Dict[Any, int], feature_map: Dict[Any, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Features de identidade: cada ID mapeado tem uma feature própria (se habilitadas)."""
+    identidade = lookup_indices(feature_map, id_map.keys())
+    if not (identidade >= 0).all():
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return np.fromiter(id_map.values(), np.int64, len(id_map)), identidade
+
+
+def _assemble(
+    linhas: Sequence[np.ndarray],
+    colunas: Sequence[np.ndarray],
+    pesos: Sequence[np.ndarray],
+    shape: Tuple[int, int],
+    normalize: bool,
+    descricao: str,
+) -> sparse.csr_matrix:
+    """Monta a matriz de features e, se `normalize`, normaliza cada linha para somar 1."""
+    matriz = sparse.coo_matrix(
+        (
+            np.concatenate(pesos).astype(np.float32),
+            (np.concatenate(linhas), np.concatenate(colunas)),
+        ),
+        shape=shape,
+    ).tocsr()  # tocsr soma as entradas duplicadas (ex: dois tokens no mesmo balde)
+
+    if normalize:
+        somas = np.asarray(matriz.sum(axis=1)).ravel()
+        if np.any(somas == 0):
+            raise ValueError(
+                "Não é possível normalizar a matriz de features: "
+                f"{descricao} sem nenhuma feature."
+            )
+        matriz = (sparse.diags((1.0 / somas).astype(np.float32)) @ matriz).tocsr()
+
+    return matriz
+
+
+def build_item_features(
+    dataset,
+    cachacas_df: pd.DataFrame,
+    normalize: bool = True,
+    n_buckets: int = features.ITEM_FEATURE_BUCKETS,
+) -> sparse.csr_matrix:
+    """
+    Constrói a matriz de características das cachaças (itens x features) a partir do
+    catálogo, sem iterar linha a linha.
+
+    Os atributos de cada cachaça (categorias, faixas dos campos numéricos e tags, ver
+    `features.item_tokens`) são hasheados para um dos `n_buckets` baldes fixos, de
+    modo que valores novos não exigem reajustar o Dataset nem aumentar o modelo.
+    Inclui as features de identidade de cada item e, se `normalize`, normaliza cada
+    linha para somar 1 (como o LightFM).
+
+    Args:
+        dataset: O Dataset do LightFM já ajustado (fit) com todos os itens e com os
+            baldes `features.bucket_names(features.ITEM_PREFIX, n_buckets)`.
+        cachacas_df: O catálogo, com a coluna 'id' e os atributos das cachaças.
+        normalize: Se True, aplica a normalização L1 por linha (padrão do LightFM).
+        n_buckets: Tamanho do espaço de hash.
+
+    Returns:
+        Uma matriz CSR (itens x features).
+    """
+    _, _, item_id_map, item_feature_map = dataset.mapping()
+    baldes = _bucket_columns(item_feature_map, features.ITEM_PREFIX, n_buckets)
+
+    item_ids = cachacas_df["id"].to_numpy()
+    _check_known(lookup_indices(item_id_map, item_ids), item_ids, "Cachaça")
+
+    linhas, colunas = _identity_entries(item_id_map, item_feature_map)
+    tokens = features.item_tokens(cachacas_df)
+    return _assemble(
+        [linhas, lookup_indices(item_id_map, tokens["id"].to_numpy())],
+        [colunas, baldes[features.hash_tokens(tokens["token"], n_buckets)]],
+        [np.ones(len(linhas), np.float32), tokens["peso"].to_numpy()],
+        dataset.item_features_shape(),
+        normalize,
+        "algumas cachaças estão",
+    )
+
+
+def build_user_features(
+    dataset,
+    weights: sparse.spmatrix,
+    avaliacoes_df: pd.DataFrame,
+    cachacas_df: pd.DataFrame,
+    normalize: bool = True,
+    n_buckets: int = features.USER_FEATURE_BUCKETS,
+) -> sparse.csr_matrix:
+    """
+    Constrói a matriz de características dos usuários (usuários x features), no mesmo
+    espaço de hash de tamanho fixo das cachaças.
+
+    Cada usuário recebe sua feature de identidade, os atributos próprios que vêm nas
+    avaliações (ex: região, ver `features.user_tokens`) e o perfil de gosto: os
+    atributos das cachaças que avaliou com nota >= `features.NOTA_MINIMA_GOSTO`, com
+    peso proporcional à frequência. O perfil sai de um único produto esparso
+    (usuários x itens) @ (itens x features), sem iterar por usuário.
+
+    Args:
+        dataset: O Dataset do LightFM já ajustado (fit) com todos os usuários, itens e
+            os baldes `features.bucket_names(features.USER_PREFIX, n_buckets)`.
+        weights: A matriz de notas (usuários x itens) de onde sai o perfil de gosto;
+            no treino com validação, apenas as avaliações de treino.
+        avaliacoes_df: As avaliações, com 'user.id' e os atributos dos usuários.
+        cachacas_df: O catálogo, com a coluna 'id' e as colunas de TASTE_COLUMNS.
+        normalize: Se True, aplica a normalização L1 por linha (padrão do LightFM).
+        n_buckets: Tamanho do espaço de hash.
+
+    Returns:
+        Uma matriz CSR (usuários x features).
+    """
+    user_id_map, user_feature_map, item_id_map, _ = dataset.mapping()
+    baldes = _bucket_columns(user_feature_map, features.USER_PREFIX, n_buckets)
+    shape = dataset.user_features_shape()
+
+    # Perfil de gosto: fração das cachaças bem avaliadas de cada usuário...
+    gostou = sparse.csr_matrix(weights, dtype=np.float32, copy=True)
+    gostou.sum_duplicates()
+    gostou.data = (gostou.data >= features.NOTA_MINIMA_GOSTO).astype(np.float32)
+    gostou.eliminate_zeros()
+    quantidades = np.asarray(gostou.sum(axis=1)).ravel()
+    inversos = np.divide(
+        1.0, quantidades, out=np.zeros_like(quantidades), where=quantidades > 0
+    )
+    fracoes = sparse.diags(inversos) @ gostou
+
+    # ... vezes os tokens de gosto que cada cachaça transmite
+    tokens_item = features.taste_tokens(cachacas_df)
+    linhas_item = lookup_indices(item_id_map, tokens_item["id"].to_numpy())
+    colunas_item = baldes[features.hash_tokens(tokens_item["token"], n_buckets)]
+    conhecidos = linhas_item >= 0
+    gosto_por_item = sparse.csr_matrix(
+        (
+            tokens_item["peso"].to_numpy()[conhecidos],
+            (linhas_item[conhecidos], colunas_item[conhecidos]),
+        ),
+        shape=(gostou.shape[1], shape[1]),
+    )
+    gosto = (fracoes @ gosto_por_item).tocoo()
+
+    # Atributos próprios dos usuários (ex: região)
+    tokens_usuario = features.user_tokens(avaliacoes_df)
+    linhas_usuario = lookup_indices(user_id_map, tokens_usuario["id"].to_numpy())
+    _check_known(linhas_usuario, tokens_usuario["id"].to_numpy(), "Usuário")
+    colunas_usuario = baldes[features.hash_tokens(tokens_usuario["token"], n_buckets)]
+
+    linhas, colunas = _identity_entries(user_id_map, user_feature_map)
+    return _assemble(
+        [linhas, gosto.row, linhas_usuario],
+        [colunas, gosto.col, colunas_usuario],
+        [
+            np.ones(len(linhas), np.float32),
+            gosto.data,
+            tokens_usuario["peso"].to_numpy(),
+        ],
+        shape,
+        normalize,
+        "alguns usuários estão",
+    )
@@ -0,0 +1,414 @@
+# metrics.py
+import json
+import math
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Diretório onde `export` grava as métricas (JSON + textfile do Prometheus) e os perfis
+METRICS_PATH = "metrics/"
+
+# Prefixo de todas as métricas no formato do Prometheus
+PREFIX = "pingou_"
+
+# Limites dos baldes dos histogramas, em segundos
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# Intervalo padrão entre duas amostras do profiler (sobrescrito por PROFILE_INTERVAL)
+DEFAULT_PROFILE_INTERVAL = 0.005
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> _Labels:
+    return tuple(sorted((chave, str(valor)) for chave, valor in labels.items()))
+
+
+def _metrics_path() -> str:
+    return os.getenv("METRICS_PATH", METRICS_PATH)
+
+
+def _env_flag(nome: str) -> bool:
+    return os.getenv(nome, "").lower() in ("1", "true", "yes", "sim")
+
+
+class Histogram:
+    """Histograma cumulativo com baldes fixos, no mesmo modelo do Prometheus."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # O último é o balde +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, count: int = 1):
+        self.counts[bisect_left(self.buckets, value)] += count
+        self.sum += value * count
+        self.count += count
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Pares (limite, observações <= limite), terminando em '+Inf'."""
+        limites = [repr(float(limite)) for limite in self.buckets] + ["+Inf"]
+        acumulado, pares = 0, []
+        for limite, contagem in zip(limites, self.counts):
+            acumulado += contagem
+            pares.append((limite, acumulado))
+        return pares
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimativa do quantil `q` (limite superior do balde onde ele cai). Se ele cair
+        no balde +Inf, vale o maior limite finito, como no histogram_quantile do
+        Prometheus; sem observações (ou sem baldes finitos), retorna None.
+        """
+        if not self.count or not self.buckets:
+            return None
+        alvo = q * self.count
+        acumulado = 0
+        for limite, contagem in zip(self.buckets, self.counts):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return float(limite)
+        return float(self.buckets[-1])
+
+
+class _SamplingProfiler:
+    """
+    Profiler por amostragem: uma thread de fundo lê a pilha de chamadas da thread
+    observada a cada `interval` segundos e conta quantas vezes cada pilha apareceu.
+    O custo sobre o código observado é quase nulo e independe do número de chamadas.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                nome_arquivo = os.path.basename(codigo.co_filename)
+                pilha.append(f"{codigo.co_name} ({nome_arquivo}:{frame.f_lineno})")
+                frame = frame.f_back
+            if pilha:
+                self.stacks[";".join(reversed(pilha))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str):
+        """Grava as pilhas no formato 'collapsed' (flamegraph.pl, speedscope)."""
+        with open(path, "w", encoding="utf-8") as f:
+            for pilha, contagem in self.stacks.most_common():
+                f.write(f"{pilha} {contagem}\n")
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas do processo: contadores, gauges, histogramas e o resumo de
+    cada etapa do pipeline (tempo de parede, tempo de CPU e memória).
+
+    Seguro para várias threads. Configuração pelo ambiente:
+        METRICS_TRACE_MEMORY: se verdadeiro, mede o pico de memória alocada em cada
+            etapa com tracemalloc (deixa o código Python mais lento).
+        PROFILE_STAGES: etapas (separadas por vírgula, ou 'all') executadas sob o
+            profiler por amostragem; as pilhas vão para <METRICS_PATH>/profile-<etapa>.txt.
+        METRICS_PATH: diretório das métricas exportadas e dos perfis.
+        PROFILE_INTERVAL: segundos entre duas amostras do profiler.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, _Labels], float] = {}
+        self.gauges: Dict[Tuple[str, _Labels], float] = {}
+        self.histograms: Dict[Tuple[str, _Labels], Histogram] = {}
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        # Picos de memória das etapas abertas (tracemalloc tem um único pico global)
+        self._memory_peaks: List[int] = []
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+            self.stages.clear()
+
+    def collect(self) -> Dict[str, Any]:
+        """
+        Retira e retorna os contadores e histogramas acumulados até aqui, para serem
+        somados ao registro de outro processo com `merge`.
+        """
+        with self._lock:
+            dados = {"counters": self.counters, "histograms": self.histograms}
+            self.counters, self.histograms = {}, {}
+        return dados
+
+    def merge(self, dados: Dict[str, Any]):
+        """Soma a este registro os contadores e histogramas vindos de `collect`."""
+        with self._lock:
+            for chave, valor in dados["counters"].items():
+                self.counters[chave] = self.counters.get(chave, 0) + valor
+            for chave, outro in dados["histograms"].items():
+                histograma = self.histograms.get(chave)
+                if histograma is None:
+                    histograma = self.histograms[chave] = Histogram(outro.buckets)
+                for balde, contagem in enumerate(outro.counts):
+                    histograma.counts[balde] += contagem
+                histograma.sum += outro.sum
+                histograma.count += outro.count
+
+    def inc(self, name: str, value: float = 1, **labels):
+        chave = (name, _labels(labels))
+        with self._lock:
+            self.counters[chave] = self.counters.get(chave, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[(name, _labels(labels))] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        count: int = 1,
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        **labels,
+    ):
+        """
+        Registra `count` observações de `value` no histograma `name` (ex: a latência
+        média por usuário de um bloco pontuado de uma só vez).
+        """
+        chave = (name, _labels(labels))
+        with self._lock:
+            histograma = self.histograms.get(chave)
+            if histograma is None:
+                histograma = self.histograms[chave] = Histogram(buckets)
+            histograma.observe(value, count)
+
+    @contextmanager
+    def timed(self, name: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels):
+        """Registra a duração do bloco no histograma `name`."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - inicio, buckets=buckets, **labels)
+
+    def _profile_enabled(self, stage: str) -> bool:
+        etapas = {nome.strip() for nome in os.getenv("PROFILE_STAGES", "").split(",")}
+        return stage in etapas or "all" in etapas
+
+    @contextmanager
+    def stage(self, name: str, profile: Optional[bool] = None) -> Iterator[None]:
+        """
+        Mede uma etapa do pipeline: tempo de parede, tempo de CPU do processo, pico de
+        RSS do processo até o fim da etapa e, com METRICS_TRACE_MEMORY, o pico de
+        memória alocada durante a etapa. Etapas podem ser aninhadas.
+
+        Args:
+            name: Nome da etapa (ex: 'treinamento').
+            profile: Força ligar/desligar o profiler por amostragem nesta etapa;
+                por padrão, segue PROFILE_STAGES.
+        """
+        medir_memoria = _env_flag("METRICS_TRACE_MEMORY")
+        if medir_memoria:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            elif self._memory_peaks:
+                # O pico até aqui pertence à etapa externa
+                self._memory_peaks[-1] = max(
+                    self._memory_peaks[-1], tracemalloc.get_traced_memory()[1]
+                )
+            tracemalloc.reset_peak()
+            self._memory_peaks.append(0)
+
+        profiler = None
+        if profile if profile is not None else self._profile_enabled(name):
+            profiler = _SamplingProfiler(
+                threading.get_ident(),
+                float(os.getenv("PROFILE_INTERVAL", DEFAULT_PROFILE_INTERVAL)),
+            )
+            profiler.start()
+
+        inicio_parede, inicio_cpu = time.perf_counter(), time.process_time()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "erro"
+            raise
+        finally:
+            resumo: Dict[str, Any] = {
+                "wall_seconds": time.perf_counter() - inicio_parede,
+                "cpu_seconds": time.process_time() - inicio_cpu,
+                # ru_maxrss é em KB no Linux e em bytes no macOS
+                "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                * (1 if sys.platform == "darwin" else 1024),
+                "status": status,
+            }
+            if medir_memoria:
+                pico = max(self._memory_peaks.pop(), tracemalloc.get_traced_memory()[1])
+                resumo["peak_memory_bytes"] = pico
+                if self._memory_peaks:
+                    self._memory_peaks[-1] = max(self._memory_peaks[-1], pico)
+                else:
+                    tracemalloc.stop()
+            if profiler is not None:
+                profiler.stop()
+                diretorio = _metrics_path()
+                os.makedirs(diretorio, exist_ok=True)
+                caminho = os.path.join(diretorio, f"profile-{name}.txt")
+                profiler.write(caminho)
+                resumo["profile"] = caminho
+            with self._lock:
+                self.stages[name] = resumo
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Retorna todas as métricas em um dicionário serializável em JSON."""
+
+        def serie(nome: str, labels: _Labels) -> Dict[str, Any]:
+            return {"name": nome, "labels": dict(labels)}
+
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "stages": {nome: dict(resumo) for nome, resumo in self.stages.items()},
+                "counters": [
+                    {**serie(*chave), "value": valor}
+                    for chave, valor in sorted(self.counters.items())
+                ],
+                "gauges": [
+                    {**serie(*chave), "value": valor}
+                    for chave, valor in sorted(self.gauges.items())
+                ],
+                "histograms": [
+                    {
+                        **serie(*chave),
+                        "count": h.count,
+                        "sum": h.sum,
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                        "buckets": dict(h.cumulative()),
+                    }
+                    for chave, h in sorted(self.histograms.items())
+                ],
+            }
+
+    def to_prometheus(self) -> str:
+        """Retorna as métricas no formato de texto de exposição do Prometheus."""
+
+        def formatar(nome: str, labels: _Labels, valor: float) -> str:
+            pares = ",".join(f'{chave}="{_escape(texto)}"' for chave, texto in labels)
+            serie = f"{PREFIX}{nome}{{{pares}}}" if pares else f"{PREFIX}{nome}"
+            return f"{serie} {float(valor)!r}"
+
+        snapshot = self.snapshot()
+        linhas: List[str] = []
+        tipos_declarados = set()
+
+        def declarar(nome: str, tipo: str):
+            if nome not in tipos_declarados:
+                tipos_declarados.add(nome)
+                linhas.append(f"# TYPE {PREFIX}{nome} {tipo}")
+
+        # As amostras de uma mesma métrica precisam ficar juntas, logo após o TYPE
+        for campo in ("wall_seconds", "cpu_seconds", "max_rss_bytes", "peak_memory_bytes"):
+            for etapa, resumo in snapshot["stages"].items():
+                if campo in resumo:
+                    declarar(f"stage_{campo}", "gauge")
+                    linhas.append(
+                        formatar(f"stage_{campo}", (("stage", etapa),), resumo[campo])
+                    )
+        for tipo, chave in (("counter", "counters"), ("gauge", "gauges")):
+            for metrica in snapshot[chave]:
+                declarar(metrica["name"], tipo)
+                labels = _labels(metrica["labels"])
+                linhas.append(formatar(metrica["name"], labels, metrica["value"]))
+        for metrica in snapshot["histograms"]:
+            nome, labels = metrica["name"], _labels(metrica["labels"])
+            declarar(nome, "histogram")
+            for limite, acumulado in metrica["buckets"].items():
+                linhas.append(formatar(f"{nome}_bucket", labels + (("le", limite),), acumulado))
+            linhas.append(formatar(f"{nome}_sum", labels, metrica["sum"]))
+            linhas.append(formatar(f"{nome}_count", labels, metrica["count"]))
+
+        declarar("last_export_timestamp_seconds", "gauge")
+        linhas.append(formatar("last_export_timestamp_seconds", (), snapshot["timestamp"]))
+        return "\n".join(linhas) + "\n"
+
+    def export(self, metrics_path: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Grava as métricas em `metrics.json` e `pingou.prom` (para o coletor textfile
+        do node_exporter). As escritas são atômicas.
+
+        Args:
+            metrics_path: Diretório de destino (padrão: METRICS_PATH do .env ou
+                METRICS_PATH deste módulo).
+
+        Returns:
+            Os caminhos (json, prom) gravados.
+        """
+        metrics_path = metrics_path or _metrics_path()
+        os.makedirs(metrics_path, exist_ok=True)
+        caminho_json = os.path.join(metrics_path, "metrics.json")
+        caminho_prom = os.path.join(metrics_path, "pingou.prom")
+        for caminho, conteudo in (
+            # JSON estrito: valores não finitos (ex: um gauge NaN) viram null
+            (
+                caminho_json,
+                json.dumps(_finite(self.snapshot()), indent=2, allow_nan=False),
+            ),
+            (caminho_prom, self.to_prometheus()),
+        ):
+            temporario = caminho + ".tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                f.write(conteudo)
+            os.replace(temporario, caminho)
+        return caminho_json, caminho_prom
+
+
+def _finite(valor: Any) -> Any:
+    """Troca, recursivamente, os floats infinitos ou NaN por None."""
+    if isinstance(valor, float):
+        return valor if math.isfinite(valor) else None
+    if isinstance(valor, dict):
+        return {chave: _finite(item) for chave, item in valor.items()}
+    if isinstance(valor, list):
+        return [_finite(item) for item in valor]
+    return valor
+
+
+def _escape(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Registro global do processo e atalhos para ele
+REGISTRY = MetricsRegistry()
+
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set_gauge
+observe = REGISTRY.observe
+timed = REGISTRY.timed
+stage = REGISTRY.stage
+export = REGISTRY.export
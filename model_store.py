@@ -0,0 +1,340 @@
+# model_store.py
+import json
+import numbers
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Diretório padrão dos artefatos (o mesmo usado pelo pipeline de treinamento)
+ARTIFACTS_PATH = "artifacts/"
+
+# Subdiretório com uma pasta por versão publicada e o arquivo que aponta a versão atual
+SERVING_DIR = "serving"
+CURRENT_FILE = "CURRENT"
+
+# Quantas versões antigas manter em disco (processos ainda podem estar usando-as)
+KEEP_VERSIONS = 3
+
+# Tabelas de cold start: quantas cachaças guardar por segmento de popularidade (o
+# ranking geral guarda todas) e por lista de "cachaças similares", e quais colunas do
+# catálogo definem os segmentos
+POPULAR_TOP_K = 100
+SIMILAR_TOP_K = 20
+SEGMENT_COLUMNS = ("tipoCachaca", "regiao")
+# Combinações de colunas que também têm ranking próprio (ex: tipo e região juntos)
+COMBINED_SEGMENTS = (("tipoCachaca", "regiao"),)
+
+_ARRAYS = (
+    "user_ids",
+    "item_ids",
+    "user_embeddings",
+    "user_biases",
+    "item_embeddings",
+    "item_biases",
+    "seen_indptr",
+    "seen_indices",
+    "popular_keys",
+    "popular_indptr",
+    "popular_indices",
+    "similar_items",
+)
+
+
+class ModelArtifacts:
+    """
+    Artefatos de serviço de uma versão do modelo, prontos para pontuar usuários.
+
+    Os arrays são abertos com `mmap_mode="r"`: a carga leva milissegundos e vários
+    processos que abrem a mesma versão compartilham as mesmas páginas de memória.
+
+    Atributos:
+        version: Identificador da versão publicada.
+        user_ids / item_ids: ID real de cada índice interno (o índice é a posição),
+            sempre int64 ou sempre texto (o tipo fica no manifest.json).
+        user_embeddings / user_biases: Representações dos usuários, já combinadas
+            com a matriz de features dos usuários (identidade, região, gosto).
+        item_embeddings / item_biases: Representações das cachaças, já combinadas com
+            a matriz de features (features x embeddings das features).
+        seen_indptr / seen_indices: Estrutura CSR (usuários x itens) das cachaças que
+            cada usuário já avaliou no treino (itens de `u` em
+            seen_indices[seen_indptr[u]:seen_indptr[u + 1]]).
+        popular_keys / popular_indptr / popular_indices: Rankings de popularidade por
+            segmento ("" para o geral, com todas as cachaças, "tipoCachaca=OURO",
+            "regiao=Salinas", "tipoCachaca=OURO|regiao=Salinas", ...); o ranking do
+            segmento `popular_keys[s]` é
+            popular_indices[popular_indptr[s]:popular_indptr[s + 1]].
+        similar_items: Matriz (itens x k) com as cachaças mais similares a cada uma,
+            da mais para a menos similar (cosseno entre as representações).
+        catalog: Catálogo de cachaças, uma linha por índice interno de item.
+    """
+
+    def __init__(self, version: str, arrays: Dict[str, np.ndarray], catalog: pd.DataFrame):
+        self.version = version
+        self.user_ids = arrays["user_ids"]
+        self.item_ids = arrays["item_ids"]
+        self.user_embeddings = arrays["user_embeddings"]
+        self.user_biases = arrays["user_biases"]
+        self.item_embeddings = arrays["item_embeddings"]
+        self.item_biases = arrays["item_biases"]
+        self.seen_indptr = arrays["seen_indptr"]
+        self.seen_indices = arrays["seen_indices"]
+        self.popular_keys = arrays["popular_keys"]
+        self.popular_indptr = arrays["popular_indptr"]
+        self.popular_indices = arrays["popular_indices"]
+        self.similar_items = arrays["similar_items"]
+        self.catalog = catalog
+
+
+def _ids_array(mapping: Dict[Any, int], kind: str) -> np.ndarray:
+    """
+    Converte um mapeamento {id_real: indice_interno} em um array indexado pelo índice.
+
+    Arrays de objetos não podem ser mapeados em memória, então os IDs precisam ser
+    todos inteiros (int64) ou todos texto. Nenhum ID é convertido: misturas são
+    recusadas, senão uma consulta pelo ID original não encontraria o usuário.
+
+    Raises:
+        ValueError: Se os IDs de `kind` ('user' ou 'item') misturam tipos ou não são
+            inteiros nem texto.
+    """
+    ids = [None] * len(mapping)
+    for id_real, indice in mapping.items():
+        ids[indice] = id_real
+    if all(isinstance(i, numbers.Integral) and not isinstance(i, bool) for i in ids):
+        return np.asarray(ids, dtype=np.int64)
+    if all(isinstance(i, str) for i in ids):
+        return np.asarray(ids, dtype=str)
+    tipos = sorted({type(i).__name__ for i in ids})
+    raise ValueError(
+        f"IDs de {kind} com tipos misturados ou não suportados ({', '.join(tipos)}): "
+        "use apenas inteiros ou apenas texto."
+    )
+
+
+def _id_dtype(ids: np.ndarray) -> str:
+    """Tipo dos IDs gravado no manifest.json ('int64' ou 'str')."""
+    return "str" if ids.dtype.kind == "U" else str(ids.dtype)
+
+
+def segment_key(column: str, value: Any, *others: Any) -> str:
+    """
+    Chave de um segmento de popularidade (ex: 'tipoCachaca=OURO'). Segmentos de
+    COMBINED_SEGMENTS recebem os pares seguintes, na mesma ordem das colunas
+    (ex: 'tipoCachaca=OURO|regiao=Salinas').
+    """
+    pares = (column, value, *others)
+    return "|".join(f"{pares[i]}={pares[i + 1]}" for i in range(0, len(pares), 2))
+
+
+def _popularity_tables(
+    seen: sparse.csr_matrix, item_biases: np.ndarray, catalog: pd.DataFrame
+) -> Dict[str, np.ndarray]:
+    """
+    Ranqueia as cachaças por número de avaliações (desempate pelo bias aprendido) no
+    geral e dentro de cada segmento de SEGMENT_COLUMNS e de COMBINED_SEGMENTS, em
+    formato CSR. O ranking geral é completo (o cold start com filtros o percorre
+    restrito aos itens permitidos); os segmentos guardam o top POPULAR_TOP_K.
+    """
+    contagens = np.bincount(seen.indices, minlength=seen.shape[1])
+    ordem = np.lexsort((-item_biases, -contagens))  # Última chave é a principal
+
+    chaves, rankings = [""], [ordem]
+    for colunas in [(coluna,) for coluna in SEGMENT_COLUMNS] + list(COMBINED_SEGMENTS):
+        if not all(coluna in catalog.columns for coluna in colunas):
+            continue
+        ranking_df = pd.DataFrame(
+            {
+                "item": ordem,
+                **{coluna: catalog[coluna].to_numpy()[ordem] for coluna in colunas},
+            }
+        ).dropna()
+        # O groupby preserva a ordem global dentro de cada segmento
+        for valores, grupo in ranking_df.groupby(list(colunas), sort=True):
+            pares = [item for par in zip(colunas, valores) for item in par]
+            chaves.append(segment_key(*pares))
+            rankings.append(grupo["item"].to_numpy()[:POPULAR_TOP_K])
+
+    tamanhos = np.array([len(ranking) for ranking in rankings], dtype=np.int64)
+    return {
+        "popular_keys": np.array(chaves, dtype=str),
+        "popular_indptr": np.concatenate([[0], np.cumsum(tamanhos)]),
+        "popular_indices": np.concatenate(rankings).astype(np.int32),
+    }
+
+
+def _similar_items(item_embeddings: np.ndarray, block_size: int = 1024) -> np.ndarray:
+    """
+    Calcula, em blocos, as SIMILAR_TOP_K cachaças mais similares a cada uma pelo
+    cosseno entre as representações aprendidas.
+    """
+    n_itens = item_embeddings.shape[0]
+    k = min(SIMILAR_TOP_K, n_itens - 1)
+    similares = np.empty((n_itens, max(k, 0)), dtype=np.int32)
+    if k <= 0:
+        return similares
+
+    normas = np.linalg.norm(item_embeddings, axis=1, keepdims=True)
+    normalizados = item_embeddings / np.maximum(normas, 1e-12)
+
+    for inicio in range(0, n_itens, block_size):
+        bloco = normalizados[inicio : inicio + block_size]
+        sims = bloco @ normalizados.T
+        linhas = np.arange(len(bloco))
+        sims[linhas, inicio + linhas] = -np.inf  # Um item não é similar a si mesmo
+
+        candidatos = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        ordem = np.argsort(-np.take_along_axis(sims, candidatos, axis=1), axis=1)
+        similares[inicio : inicio + len(bloco)] = np.take_along_axis(
+            candidatos, ordem, axis=1
+        )
+    return similares
+
+
+def current_version(artifacts_path: str = ARTIFACTS_PATH) -> Optional[str]:
+    """Retorna a versão publicada atualmente ou None se nada foi publicado ainda."""
+    try:
+        with open(os.path.join(artifacts_path, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish(
+    model,
+    dataset,
+    item_features,
+    interactions,
+    cachacas_df: pd.DataFrame,
+    artifacts_path: str = ARTIFACTS_PATH,
+    metadata: Optional[Dict[str, Any]] = None,
+    user_features=None,
+) -> str:
+    """
+    Grava os artefatos de serviço de um modelo treinado em uma nova versão e a torna
+    a versão atual de forma atômica.
+
+    A versão é escrita em uma pasta temporária, renomeada para o nome definitivo e só
+    então o arquivo CURRENT passa a apontar para ela (os.replace), de modo que um
+    leitor nunca vê uma versão pela metade.
+
+    Args:
+        model: O modelo LightFM treinado.
+        dataset: O Dataset do LightFM com os mapeamentos usados no treino.
+        item_features: A matriz de features das cachaças usada no treino.
+        interactions: A matriz de interações (usuários x itens) usada no treino, de onde
+            sai o índice de cachaças já avaliadas por cada usuário.
+        cachacas_df: O catálogo de cachaças.
+        artifacts_path: Diretório base dos artefatos.
+        metadata: Informações extras gravadas no manifest.json da versão (ex: as
+            métricas de qualidade do modelo na validação).
+        user_features: A matriz de features dos usuários usada no treino (None se o
+            modelo foi treinado só com as features de identidade).
+
+    Returns:
+        O identificador da versão publicada.
+    """
+    user_id_map, _, item_id_map, _ = dataset.mapping()
+
+    # Representações finais: a multiplicação pelas matrizes de features é feita aqui,
+    # uma única vez, e não a cada carga do Recommender
+    item_biases, item_embeddings = model.get_item_representations(item_features)
+    user_biases, user_embeddings = model.get_user_representations(user_features)
+
+    seen = sparse.csr_matrix(interactions, copy=True)
+    seen.sum_duplicates()
+    seen.eliminate_zeros()
+
+    user_ids = _ids_array(user_id_map, "user")
+    item_ids = _ids_array(item_id_map, "item")
+    arrays = {
+        "user_ids": user_ids,
+        "item_ids": item_ids,
+        "user_embeddings": user_embeddings.astype(np.float32),
+        "user_biases": user_biases.astype(np.float32),
+        "item_embeddings": item_embeddings.astype(np.float32),
+        "item_biases": item_biases.astype(np.float32),
+        # indptr e indices com o mesmo dtype: o scipy os usa sem copiar na carga
+        "seen_indptr": seen.indptr,
+        "seen_indices": seen.indices.astype(seen.indptr.dtype),
+    }
+
+    # Catálogo alinhado à ordem interna dos itens (linha i = item de índice interno i)
+    catalog = (
+        cachacas_df.drop_duplicates(subset="id", keep="last")
+        .set_index("id")
+        .reindex(pd.Index(item_ids, name="id"))
+        .reset_index()
+    )
+
+    # Tabelas de cold start (usuários novos ou com poucas avaliações)
+    arrays.update(_popularity_tables(seen, arrays["item_biases"], catalog))
+    arrays["similar_items"] = _similar_items(arrays["item_embeddings"])
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    serving_path = os.path.join(artifacts_path, SERVING_DIR)
+    tmp_path = os.path.join(serving_path, f".tmp-{version}")
+    os.makedirs(tmp_path)
+
+    for nome, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{nome}.npy"), np.ascontiguousarray(array))
+    catalog.to_feather(os.path.join(tmp_path, "catalog.feather"))
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": version,
+                "n_users": len(user_ids),
+                "n_items": len(item_ids),
+                "user_id_dtype": _id_dtype(user_ids),
+                "item_id_dtype": _id_dtype(item_ids),
+                "no_components": int(item_embeddings.shape[1]),
+                **(metadata or {}),
+            },
+            f,
+        )
+
+    os.rename(tmp_path, os.path.join(serving_path, version))
+
+    current_tmp = os.path.join(artifacts_path, CURRENT_FILE + ".tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(artifacts_path, CURRENT_FILE))
+
+    _remove_old_versions(serving_path)
+    return version
+
+
+def _remove_old_versions(serving_path: str):
+    """Apaga as versões mais antigas, mantendo as KEEP_VERSIONS mais recentes."""
+    versions = sorted(
+        nome for nome in os.listdir(serving_path) if not nome.startswith(".")
+    )
+    for nome in versions[:-KEEP_VERSIONS]:
+        # Processos que ainda mapeiam estes arquivos continuam funcionando (Linux/macOS)
+        shutil.rmtree(os.path.join(serving_path, nome), ignore_errors=True)
+
+
+def load(
+    artifacts_path: str = ARTIFACTS_PATH, version: Optional[str] = None
+) -> Optional[ModelArtifacts]:
+    """
+    Abre os artefatos de serviço de uma versão (por padrão, a atual).
+
+    Returns:
+        Os artefatos carregados ou None se nenhuma versão foi publicada.
+    """
+    version = version or current_version(artifacts_path)
+    if version is None:
+        return None
+
+    version_path = os.path.join(artifacts_path, SERVING_DIR, version)
+    arrays = {
+        nome: np.load(os.path.join(version_path, f"{nome}.npy"), mmap_mode="r")
+        for nome in _ARRAYS
+    }
+    catalog = pd.read_feather(os.path.join(version_path, "catalog.feather"))
+    return ModelArtifacts(version, arrays, catalog)
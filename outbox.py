@@ -0,0 +1,235 @@
+# outbox.py
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Iterable, Optional, Tuple
+
+# Arquivo SQLite onde ficam as mensagens prontas para envio
+OUTBOX_PATH = "outbox/outbox.sqlite3"
+
+# Depois de quantas falhas uma mensagem deixa de ser tentada automaticamente
+DEFAULT_MAX_ATTEMPTS = 5
+
+STATUS_PENDING = "pending"
+STATUS_DELIVERED = "delivered"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    idempotency_key TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    delivered_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_status ON messages (status, attempts);
+CREATE INDEX IF NOT EXISTS idx_messages_run ON messages (run_id);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL
+);
+"""
+
+
+def _agora() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Outbox:
+    """
+    Caixa de saída durável (SQLite) para os e-mails de recomendação.
+
+    O pipeline grava as mensagens já renderizadas com uma chave de idempotência por
+    usuário e por execução (`<run_id>:<user_id>`); uma etapa separada (`drain`) envia
+    as pendentes e as marca como entregues. Se o processo cair no meio do envio, uma
+    nova execução com o mesmo run_id envia apenas o que ainda falta, sem duplicar
+    e-mails para quem já recebeu.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH):
+        diretorio = os.path.dirname(path)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        # WAL: leituras não bloqueiam a escrita e cada commit é durável e barato
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def idempotency_key(run_id: str, user_id: Any) -> str:
+        return f"{run_id}:{user_id}"
+
+    def has_run(self, run_id: str) -> bool:
+        """
+        Indica se as mensagens desta execução já foram gravadas na caixa de saída
+        (mesmo que ela não tenha gerado nenhuma mensagem).
+        """
+        # A busca em messages cobre caixas gravadas antes da tabela runs existir
+        cursor = self.connection.execute(
+            "SELECT 1 FROM runs WHERE run_id = ? "
+            "UNION ALL SELECT 1 FROM messages WHERE run_id = ? LIMIT 1",
+            (run_id, run_id),
+        )
+        return cursor.fetchone() is not None
+
+    def enqueue_many(
+        self, run_id: str, messages: Iterable[Tuple[Any, str, str]]
+    ) -> int:
+        """
+        Grava várias mensagens em uma única transação (ou todas entram, ou nenhuma),
+        junto com o registro da execução, que vale mesmo sem nenhuma mensagem (ver
+        `has_run`). Mensagens cuja chave de idempotência já existe são ignoradas.
+
+        Args:
+            run_id: Identificador da execução do pipeline (ex: a data da rodada).
+            messages: Tuplas (user_id, email_destinatario, mensagem_serializada).
+
+        Returns:
+            Quantas mensagens novas foram gravadas.
+        """
+        criado_em = _agora()
+        linhas = [
+            (
+                self.idempotency_key(run_id, user_id),
+                run_id,
+                str(user_id),
+                recipient,
+                payload,
+                criado_em,
+            )
+            for user_id, recipient, payload in messages
+        ]
+        with self.connection:
+            antes = self.connection.total_changes
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO messages "
+                "(idempotency_key, run_id, user_id, recipient, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                linhas,
+            )
+            gravadas = self.connection.total_changes - antes
+            self.connection.execute(
+                "INSERT OR IGNORE INTO runs (run_id, created_at) VALUES (?, ?)",
+                (run_id, criado_em),
+            )
+            return gravadas
+
+    def pending(
+        self,
+        limit: Optional[int] = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        after_key: str = "",
+    ):
+        """
+        Retorna (chave, destinatário, mensagem) das mensagens ainda não entregues,
+        em ordem de chave, começando depois de `after_key`.
+        """
+        query = (
+            "SELECT idempotency_key, recipient, payload FROM messages "
+            "WHERE status = ? AND attempts < ? AND idempotency_key > ? "
+            "ORDER BY idempotency_key"
+        )
+        params: Tuple[Any, ...] = (STATUS_PENDING, max_attempts, after_key)
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        return self.connection.execute(query, params).fetchall()
+
+    def mark_delivered(self, key: str):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE messages SET status = ?, delivered_at = ?, attempts = attempts + 1 "
+                "WHERE idempotency_key = ?",
+                (STATUS_DELIVERED, _agora(), key),
+            )
+
+    def mark_failed(self, key: str, error: str):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE messages SET attempts = attempts + 1, last_error = ? "
+                "WHERE idempotency_key = ?",
+                (error, key),
+            )
+
+    def drain(
+        self,
+        smtp_pool,
+        batch_size: int = 500,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> Tuple[int, int]:
+        """
+        Envia todas as mensagens pendentes pelo pool SMTP, marcando cada uma como
+        entregue assim que o servidor a aceita.
+
+        Args:
+            smtp_pool: Um `email_sender.SmtpPool` aberto.
+            batch_size: Quantas mensagens são lidas do banco por vez.
+            max_attempts: Mensagens que já falharam tantas vezes não são mais tentadas.
+
+        Returns:
+            Uma tupla (enviadas, falhas). Se o e-mail não estiver configurado, nada é
+            enviado e as mensagens continuam pendentes.
+        """
+        if not smtp_pool.check_settings():
+            return 0, 0
+
+        enviadas, falhas = 0, 0
+        ultima_chave = ""
+        with ThreadPoolExecutor(max_workers=smtp_pool.pool_size) as executor:
+            while True:
+                # Cada mensagem é tentada no máximo uma vez por drain; as que falharem
+                # continuam pendentes para o próximo
+                lote = self.pending(batch_size, max_attempts, after_key=ultima_chave)
+                if not lote:
+                    break
+                ultima_chave = lote[-1][0]
+
+                futuros = {
+                    executor.submit(smtp_pool.send_message, recipient, payload): (
+                        key,
+                        recipient,
+                    )
+                    for key, recipient, payload in lote
+                }
+                # O banco só é atualizado nesta thread, conforme cada envio termina
+                for futuro in as_completed(futuros):
+                    key, recipient = futuros[futuro]
+                    try:
+                        futuro.result()
+                        self.mark_delivered(key)
+                        enviadas += 1
+                    except Exception as e:
+                        print(f"FALHA ao enviar e-mail para {recipient}: {e}")
+                        self.mark_failed(key, str(e))
+                        falhas += 1
+
+        print(f"Caixa de saída: {enviadas} e-mail(s) enviado(s), {falhas} falha(s).")
+        return enviadas, falhas
+
+
+if __name__ == "__main__":
+    # Envia o que estiver pendente na caixa de saída (requer .env configurado)
+    from dotenv import load_dotenv
+
+    import email_sender
+
+    load_dotenv()
+
+    with Outbox() as outbox, email_sender.SmtpPool() as smtp_pool:
+        outbox.drain(smtp_pool)
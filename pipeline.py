@@ -1,34 +1,493 @@
+import json
 import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import joblib
+import numpy as np
 import pandas as pd
 from lightfm import LightFM
 from lightfm.data import Dataset
+from lightfm.evaluation import auc_score, precision_at_k
+from scipy import sparse
+
+import features
+import matrix_builder
+import metrics
+import model_store
+from stage_cache import StageCache, fingerprint
+
+# Diretório para salvar o modelo treinado e outros artefatos
+ARTIFACTS_PATH = model_store.ARTIFACTS_PATH
+
+# Quantas épocas de fit_partial rodar sobre as interações novas no modo incremental
+EPOCAS_INCREMENTAIS = 3
+
+# A cada quantas execuções incrementais forçamos um retreino completo
+# (pode ser sobrescrito pela variável de ambiente FULL_RETRAIN_EVERY)
+RETREINO_COMPLETO_A_CADA = 7
+
+# Hiperparâmetros do modelo
+NO_COMPONENTS = 30
+LEARNING_RATE = 0.05
+
+# Parada antecipada: até quantas épocas treinar, que fração das avaliações separar para
+# validação, quantas épocas seguidas sem melhora na precision@k toleramos e qual a
+# melhora mínima que conta como melhora
+EPOCAS_MAXIMAS = 20
+FRACAO_VALIDACAO = 0.1
+PACIENCIA = 2
+MELHORA_MINIMA = 1e-3
+
+# k da precision@k (o mesmo número de cachaças enviadas por e-mail) e quantos usuários,
+# no máximo, são avaliados a cada época (uma amostra mantém a avaliação barata)
+TOP_K_VALIDACAO = 3
+MAX_USUARIOS_VALIDACAO = 10_000
+
+
+def _num_threads() -> int:
+    """Threads do treino e da avaliação: TRAIN_THREADS ou todos os núcleos."""
+    return max(1, int(os.getenv("TRAIN_THREADS", os.cpu_count() or 1)))
+
+
+def _novo_modelo() -> LightFM:
+    # Usamos 'warp' (Weighted Approximate-Rank Pairwise) porque ele é ótimo para otimizar
+    # a ordem (ranking) das recomendações, que é exatamente o que queremos.
+    return LightFM(
+        loss="warp",
+        random_state=42,
+        no_components=NO_COMPONENTS,
+        learning_rate=LEARNING_RATE,
+    )
+
+
+def _carregar_artefatos_anteriores(artifacts_path: str):
+    """
+    Carrega o modelo, o dataset, a matriz de pesos e o estado do último treinamento.
+
+    Returns:
+        Uma tupla (model, dataset, weights, estado) ou None se algum artefato não existir.
+    """
+    caminhos = [
+        os.path.join(artifacts_path, nome)
+        for nome in ("model.pkl", "dataset.pkl", "weights.npz", "training_state.json")
+    ]
+    if not all(os.path.exists(caminho) for caminho in caminhos):
+        return None
+
+    with open(caminhos[3], encoding="utf-8") as f:
+        estado = json.load(f)
+    return (
+        joblib.load(caminhos[0]),
+        joblib.load(caminhos[1]),
+        sparse.load_npz(caminhos[2]),
+        estado,
+    )
+
+
+def _expandir_embeddings(model: LightFM, n_user_features: int, n_item_features: int):
+    """
+    Aumenta as matrizes de embeddings e biases (e seus acumuladores do otimizador) para
+    acomodar usuários, itens e features novos. As linhas existentes são preservadas,
+    pois o Dataset do LightFM sempre acrescenta os novos índices no final.
+    As novas linhas são inicializadas exatamente como o LightFM faz em um modelo novo.
+    """
+    valor_inicial_gradiente = 1.0 if model.learning_schedule == "adagrad" else 0.0
+
+    for prefixo, n_total in (("user", n_user_features), ("item", n_item_features)):
+        embeddings = getattr(model, f"{prefixo}_embeddings")
+        n_novos = n_total - embeddings.shape[0]
+        if n_novos <= 0:
+            continue
+
+        novos_embeddings = (
+            (model.random_state.rand(n_novos, model.no_components) - 0.5)
+            / model.no_components
+        ).astype(np.float32)
+        novas_linhas = {
+            "embeddings": novos_embeddings,
+            "embedding_gradients": np.full_like(
+                novos_embeddings, valor_inicial_gradiente
+            ),
+            "embedding_momentum": np.zeros_like(novos_embeddings),
+            "biases": np.zeros(n_novos, dtype=np.float32),
+            "bias_gradients": np.full(n_novos, valor_inicial_gradiente, np.float32),
+            "bias_momentum": np.zeros(n_novos, dtype=np.float32),
+        }
+        for sufixo, linhas in novas_linhas.items():
+            atributo = f"{prefixo}_{sufixo}"
+            setattr(
+                model,
+                atributo,
+                np.ascontiguousarray(
+                    np.concatenate([getattr(model, atributo), linhas])
+                ),
+            )
+
+
+def _interacoes_alteradas(weights: sparse.spmatrix, weights_anteriores: sparse.spmatrix):
+    """
+    Compara a matriz de pesos atual com a do último treinamento e retorna apenas as
+    avaliações novas ou alteradas.
+
+    Returns:
+        Uma tupla (interactions, weights) no mesmo formato de `Dataset.build_interactions`.
+    """
+    atual = weights.tocsr()
+    anterior = weights_anteriores.tocsr()
+    anterior.resize(atual.shape)  # Novos usuários/itens entram como linhas/colunas vazias
+
+    diferenca = atual - anterior
+    diferenca.eliminate_zeros()
+
+    # Pesos atuais nas posições que mudaram. Avaliações removidas aparecem na
+    # diferença, mas não há o que treinar nelas (o peso atual é zero)
+    alteradas = sparse.csr_matrix(atual.multiply(diferenca.astype(bool)))
+    alteradas.eliminate_zeros()
+    alteradas = alteradas.tocoo()
+    linhas, colunas, pesos = alteradas.row, alteradas.col, alteradas.data
+
+    interactions = sparse.coo_matrix(
+        (np.ones(len(linhas), dtype=np.int32), (linhas, colunas)), shape=atual.shape
+    )
+    weights_novos = sparse.coo_matrix(
+        (pesos.astype(np.float32), (linhas, colunas)), shape=atual.shape
+    )
+    return interactions, weights_novos
+
+
+def _treinar_epocas(
+    model: LightFM,
+    interactions,
+    user_features,
+    item_features,
+    sample_weight,
+    epocas: int,
+    num_threads: int,
+    ao_fim_da_epoca: Optional[Callable[[int], bool]] = None,
+    verbose: bool = True,
+) -> int:
+    """
+    Treina o modelo por até `epocas` épocas, uma chamada de fit_partial por época, para
+    registrar o tempo de cada uma. O resultado é o mesmo de uma única chamada com
+    `epochs=epocas` (e, em um modelo novo, o mesmo de `fit`).
+
+    Args:
+        ao_fim_da_epoca: Chamada com o número da época ao fim de cada uma; se retornar
+            True, o treinamento para ali.
+        verbose: Mostra o progresso a cada época (como o `verbose=True` do LightFM),
+            já descarregado na saída para aparecer em logs redirecionados.
+
+    Returns:
+        Quantas épocas foram treinadas.
+    """
+    inicio_treino = time.perf_counter()
+    for epoca in range(1, epocas + 1):
+        inicio = time.perf_counter()
+        model.fit_partial(
+            interactions,
+            user_features=user_features,
+            item_features=item_features,
+            sample_weight=sample_weight,
+            epochs=1,
+            num_threads=num_threads,
+        )
+        duracao = time.perf_counter() - inicio
+        metrics.observe(
+            "training_epoch_seconds", duracao, buckets=metrics.DURATION_BUCKETS
+        )
+        if verbose:
+            print(
+                f"Época {epoca}/{epocas} concluída em {duracao:.2f}s "
+                f"(total: {time.perf_counter() - inicio_treino:.1f}s).",
+                flush=True,
+            )
+        if ao_fim_da_epoca is not None and ao_fim_da_epoca(epoca):
+            epocas = epoca
+            break
+    metrics.set_gauge("training_epochs", epocas)
+    return epocas
+
+
+def _separar_validacao(
+    weights: sparse.spmatrix, fracao: float, seed: int = 42
+) -> Tuple[sparse.coo_matrix, sparse.coo_matrix, sparse.coo_matrix]:
+    """
+    Separa aleatoriamente uma fração das avaliações para validação.
+
+    Returns:
+        Uma tupla (interactions_treino, weights_treino, interactions_validacao). A
+        validação é restrita a uma amostra de até MAX_USUARIOS_VALIDACAO usuários.
+    """
+    rng = np.random.default_rng(seed)
+    todas = weights.tocsr().tocoo()  # Soma avaliações repetidas do mesmo par
+    validacao = rng.random(todas.nnz) < fracao
+
+    def montar(mascara: np.ndarray, valores: np.ndarray) -> sparse.coo_matrix:
+        return sparse.coo_matrix(
+            (valores[mascara], (todas.row[mascara], todas.col[mascara])),
+            shape=todas.shape,
+        )
+
+    usuarios = np.unique(todas.row[validacao])
+    if len(usuarios) > MAX_USUARIOS_VALIDACAO:
+        amostra = rng.choice(usuarios, MAX_USUARIOS_VALIDACAO, replace=False)
+        avaliados = validacao & np.isin(todas.row, amostra)
+    else:
+        avaliados = validacao
+
+    uns = np.ones(todas.nnz, dtype=np.int32)
+    return (
+        montar(~validacao, uns),
+        montar(~validacao, todas.data.astype(np.float32)),
+        montar(avaliados, uns),
+    )
+
+
+# Estado treinável do LightFM: embeddings e biases de usuários e de itens, com os
+# acumuladores do otimizador (para que o treino continue de onde parou)
+_ESTADO_MODELO = tuple(
+    f"{lado}_{campo}"
+    for lado in ("user", "item")
+    for campo in (
+        "embeddings",
+        "embedding_gradients",
+        "embedding_momentum",
+        "biases",
+        "bias_gradients",
+        "bias_momentum",
+    )
+)
+
+
+def _copiar_estado(model: LightFM) -> Dict[str, np.ndarray]:
+    """Cópia do estado treinável do modelo (ver `_restaurar_estado`)."""
+    return {nome: getattr(model, nome).copy() for nome in _ESTADO_MODELO}
+
+
+def _restaurar_estado(model: LightFM, estado: Dict[str, np.ndarray]):
+    """Volta o modelo ao estado copiado por `_copiar_estado`."""
+    for nome, array in estado.items():
+        setattr(model, nome, array)
+
+
+def _treinar_com_parada_antecipada(
+    interactions,
+    weights,
+    user_features,
+    item_features,
+    num_threads: int,
+    construir_user_features: Callable[[sparse.spmatrix], sparse.csr_matrix],
+) -> Tuple[LightFM, Dict[str, Any]]:
+    """
+    Escolhe o número de épocas pela precision@k em avaliações separadas para
+    validação, sem treinar um segundo modelo do zero.
+
+    O modelo é treinado época a época sobre o restante das avaliações; depois de cada
+    época, precision@k e AUC são calculadas (em paralelo, com `num_threads`) sobre a
+    validação, e o estado da melhor época é copiado. O treino para quando a
+    precision@k passa PACIENCIA épocas sem melhorar pelo menos MELHORA_MINIMA. O
+    modelo volta então ao estado da melhor época e é publicado assim: é exatamente o
+    modelo validado (uma época extra só sobre as avaliações separadas enviesaria o
+    WARP para esses itens).
+
+    Args:
+        construir_user_features: Monta a matriz de features dos usuários a partir de
+            uma matriz de notas; o perfil de gosto do modelo de validação sai apenas
+            das avaliações de treino, para não vazar a validação.
+
+    Returns:
+        Uma tupla (modelo_final, avaliacao) com as métricas da melhor época.
+    """
+    treino, weights_treino, validacao = _separar_validacao(weights, FRACAO_VALIDACAO)
+    if validacao.nnz == 0:
+        print("Poucas avaliações para validação: treinando o número máximo de épocas.")
+        model = _novo_modelo()
+        _treinar_epocas(
+            model,
+            interactions,
+            user_features,
+            item_features,
+            weights,
+            EPOCAS_MAXIMAS,
+            num_threads,
+        )
+        return model, {"epocas": EPOCAS_MAXIMAS}
+
+    print(
+        f"Validação: {validacao.nnz} avaliação(ões) separada(s); "
+        f"até {EPOCAS_MAXIMAS} épocas, paciência de {PACIENCIA}."
+    )
+    user_features_treino = construir_user_features(weights_treino)
+    modelo_validacao = _novo_modelo()
+    historico: List[Dict[str, float]] = []
+    melhor: Dict[str, Any] = {"epocas": 0, "precisao": -1.0, "auc": None}
+    melhor_estado: Dict[str, np.ndarray] = {}
+
+    def avaliar(epoca: int) -> bool:
+        argumentos = dict(
+            train_interactions=treino,
+            user_features=user_features_treino,
+            item_features=item_features,
+            num_threads=num_threads,
+        )
+        precisao = float(
+            precision_at_k(
+                modelo_validacao, validacao, k=TOP_K_VALIDACAO, **argumentos
+            ).mean()
+        )
+        auc = float(auc_score(modelo_validacao, validacao, **argumentos).mean())
+        historico.append({"epoca": epoca, "precisao": precisao, "auc": auc})
+        print(f"  precision@{TOP_K_VALIDACAO} = {precisao:.4f} | AUC = {auc:.4f}")
+
+        if precisao > melhor["precisao"] + MELHORA_MINIMA:
+            melhor.update(epocas=epoca, precisao=precisao, auc=auc)
+            melhor_estado.update(_copiar_estado(modelo_validacao))
+        return epoca - melhor["epocas"] >= PACIENCIA
+
+    with metrics.stage("treinamento.validacao"):
+        treinadas = _treinar_epocas(
+            modelo_validacao,
+            treino,
+            user_features_treino,
+            item_features,
+            weights_treino,
+            EPOCAS_MAXIMAS,
+            num_threads,
+            ao_fim_da_epoca=avaliar,
+        )
+    if treinadas < EPOCAS_MAXIMAS:
+        print(f"Parada antecipada na época {treinadas}: a precision@k estabilizou.")
+
+    metrics.set_gauge("training_precision_at_k", melhor["precisao"], k=TOP_K_VALIDACAO)
+    metrics.set_gauge("training_auc", melhor["auc"])
+    print(
+        f"Melhor época: {melhor['epocas']} (precision@{TOP_K_VALIDACAO} = "
+        f"{melhor['precisao']:.4f}, AUC = {melhor['auc']:.4f})."
+    )
+
+    # Volta à melhor época: as seguintes só pioraram a validação
+    model = modelo_validacao
+    _restaurar_estado(model, melhor_estado)
+    metrics.set_gauge("training_epochs", melhor["epocas"])
+    avaliacao = {
+        "epocas": melhor["epocas"],
+        "k": TOP_K_VALIDACAO,
+        "precisao_at_k": melhor["precisao"],
+        "auc": melhor["auc"],
+        "avaliacoes_validacao": int(validacao.nnz),
+        "historico": historico,
+    }
+    return model, avaliacao
+
+
+def _parametros_treinamento(
+    parada_antecipada: bool, incremental: bool, epocas_incrementais: int
+) -> Dict[str, Any]:
+    """Parâmetros que, junto com os dados, determinam o modelo treinado."""
+    return {
+        "no_components": NO_COMPONENTS,
+        "learning_rate": LEARNING_RATE,
+        "epocas_maximas": EPOCAS_MAXIMAS,
+        "parada_antecipada": parada_antecipada,
+        "fracao_validacao": FRACAO_VALIDACAO,
+        "paciencia": PACIENCIA,
+        "melhora_minima": MELHORA_MINIMA,
+        "top_k_validacao": TOP_K_VALIDACAO,
+        "incremental": incremental,
+        "epocas_incrementais": epocas_incrementais,
+        "features": features.feature_config(),
+    }
 
 
 def executar_pipeline_treinamento(
-    avaliacoes_df: pd.DataFrame, cachacas_df: pd.DataFrame
+    avaliacoes_df: pd.DataFrame,
+    cachacas_df: pd.DataFrame,
+    incremental: bool = False,
+    epocas_incrementais: int = EPOCAS_INCREMENTAIS,
+    artifacts_path: str = ARTIFACTS_PATH,
+    parada_antecipada: bool = True,
 ):
     """
     Recebe os DataFrames de avaliações e cachaças, treina o modelo de recomendação
     e salva os artefatos necessários para uso posterior.
 
+    No modo incremental, o modelo e o dataset da execução anterior são reaproveitados:
+    os mapeamentos são estendidos com os novos usuários, itens e features, as matrizes
+    de embeddings crescem e apenas as avaliações novas ou alteradas são treinadas por
+    algumas épocas. Um retreino completo é feito periodicamente (ver
+    RETREINO_COMPLETO_A_CADA) ou quando não há artefatos anteriores.
+
     Args:
-        avaliacoes_df (pd.DataFrame): DataFrame com colunas ['user.id', 'cachaca.id', 'notaGeral'].
-        cachacas_df (pd.DataFrame): DataFrame com colunas ['id', 'nome', 'tipoCachaca', 'regiao'].
+        avaliacoes_df (pd.DataFrame): DataFrame com colunas ['user.id', 'cachaca.id', 'notaGeral']
+            (e, se disponíveis, atributos dos usuários como 'user.regiao').
+        cachacas_df (pd.DataFrame): DataFrame com colunas ['id', 'nome', 'tipoCachaca', 'regiao']
+            (e, se disponíveis, 'teorAlcoolico', 'preco' e 'tags'; ver features.py).
+        incremental (bool): Se True, tenta continuar o treinamento a partir do modelo anterior.
+        epocas_incrementais (int): Número de épocas de fit_partial no modo incremental.
+        artifacts_path (str): Diretório onde os artefatos são lidos e salvos.
+        parada_antecipada (bool): No treinamento completo, escolhe o número de épocas
+            pela precision@k em avaliações separadas para validação (até
+            EPOCAS_MAXIMAS). Se False, treina sempre EPOCAS_MAXIMAS épocas.
+
+    Returns:
+        A versão dos artefatos de serviço em uso ao final (None se nada foi publicado).
     """
 
     # --- Validação Inicial ---
     if avaliacoes_df.empty or cachacas_df.empty:
         print("Erro: Os DataFrames de entrada não podem estar vazios.")
-        return
+        return None
 
     print("✅ INICIANDO O PIPELINE DE TREINAMENTO DA IA.")
 
-    # Diretório para salvar o modelo treinado e outros artefatos
-    ARTIFACTS_PATH = "artifacts/"
-    if not os.path.exists(ARTIFACTS_PATH):
-        os.makedirs(ARTIFACTS_PATH)
+    # Impressão digital das entradas: se avaliações, catálogo e parâmetros são os mesmos
+    # do último treinamento e a versão publicada por ele ainda é a atual, não há nada
+    # a recalcular (ex: uma nova execução depois de uma falha no envio dos e-mails)
+    cache_etapas = StageCache(artifacts_path)
+    colunas_avaliacoes = ["user.id", "cachaca.id", "notaGeral"] + [
+        coluna
+        for coluna in features.USER_CATEGORICAL_COLUMNS
+        if coluna in avaliacoes_df
+    ]
+    # Em ordem canônica: a mesma base devolvida em outra ordem pela API não invalida
+    # o cache (a ordenação estável preserva a ordem das avaliações repetidas de um par)
+    impressao = fingerprint(
+        avaliacoes_df[colunas_avaliacoes]
+        .sort_values(["user.id", "cachaca.id"], kind="mergesort")
+        .reset_index(drop=True),
+        cachacas_df.sort_values("id", kind="mergesort").reset_index(drop=True),
+        _parametros_treinamento(parada_antecipada, incremental, epocas_incrementais),
+    )
+    versao_atual = model_store.current_version(artifacts_path)
+    anterior = cache_etapas.lookup("treinamento", impressao)
+    if anterior is not None and anterior.get("version") == versao_atual:
+        print(
+            "Avaliações, catálogo e parâmetros iguais aos do último treinamento: "
+            f"reaproveitando o modelo publicado (versão {versao_atual})."
+        )
+        return versao_atual
+
+    if not os.path.exists(artifacts_path):
+        os.makedirs(artifacts_path)
+
+    anteriores = _carregar_artefatos_anteriores(artifacts_path) if incremental else None
+    if anteriores is not None:
+        model, dataset, weights_anteriores, estado = anteriores
+        limite = int(os.getenv("FULL_RETRAIN_EVERY", RETREINO_COMPLETO_A_CADA))
+        if estado.get("execucoes_incrementais", 0) >= limite:
+            print(
+                f"{limite} execuções incrementais seguidas: fazendo um retreino completo."
+            )
+            anteriores = None
+        elif estado.get("features") != features.feature_config():
+            # Outro espaço de hash: os baldes antigos não significam mais o mesmo
+            print("O espaço de features mudou: fazendo um retreino completo.")
+            anteriores = None
+    elif incremental:
+        print("Nenhum artefato anterior encontrado: fazendo um treinamento completo.")
+    modo_incremental = anteriores is not None
+    num_threads = _num_threads()
 
     # ======================================================================================
     # PASSO 1: Preparar o "Dataset" do LightFM
@@ -36,12 +495,20 @@ def executar_pipeline_treinamento(
     # que existem no nosso sistema. Ele criará um "dicionário" interno para mapear tudo.
     # ======================================================================================
     print("\nPASSO 1: Mapeando usuários, itens e features...")
-    dataset = Dataset()
-    dataset.fit(
+    if not modo_incremental:
+        dataset = Dataset()
+    # No modo incremental, fit_partial apenas acrescenta o que ainda não existe nos
+    # mapeamentos (os índices internos antigos continuam os mesmos). As features são
+    # os baldes fixos do espaço de hash: valores novos de atributos não as alteram.
+    (dataset.fit_partial if modo_incremental else dataset.fit)(
         users=avaliacoes_df["user.id"].unique(),
         items=cachacas_df["id"].unique(),
-        item_features=cachacas_df["tipoCachaca"].unique().tolist()
-        + cachacas_df["regiao"].unique().tolist(),
+        user_features=features.bucket_names(
+            features.USER_PREFIX, features.USER_FEATURE_BUCKETS
+        ),
+        item_features=features.bucket_names(
+            features.ITEM_PREFIX, features.ITEM_FEATURE_BUCKETS
+        ),
     )
     print("Mapeamento concluído.")
 
@@ -51,48 +518,111 @@ def executar_pipeline_treinamento(
     # cachaça e com que nota". Esta matriz é a base da Filtragem Colaborativa.
     # ======================================================================================
     print("\nPASSO 2: Construindo a matriz de interações (usuário x cachaça)...")
-    (interactions, weights) = dataset.build_interactions(
-        # Fornecemos uma tupla para cada avaliação no formato (id_usuario, id_item, peso)
-        (row["user.id"], row["cachaca.id"], row["notaGeral"])
-        for _, row in avaliacoes_df.iterrows()
-    )
+    # Os IDs são traduzidos para índices internos de forma vetorizada e a matriz esparsa
+    # é montada direto dos arrays (mesmo resultado de dataset.build_interactions)
+    with metrics.stage("treinamento.matrizes"):
+        (interactions, weights) = matrix_builder.build_interactions(dataset, avaliacoes_df)
     print("Matriz de interações construída.")
 
     # ======================================================================================
-    # PASSO 3: Construir a Matriz de Características dos Itens
-    # Objetivo: Criar uma estrutura que descreve cada cachaça por suas características
-    # (ex: 'tipo: Ouro', 'região: Salinas'). Esta matriz é a base da Filtragem
-    # Baseada em Conteúdo.
+    # PASSO 3: Construir as Matrizes de Características dos Itens e dos Usuários
+    # Objetivo: Criar estruturas que descrevem cada cachaça por suas características
+    # (ex: 'tipo: Ouro', 'região: Salinas', faixa de teor alcoólico, tags) e cada
+    # usuário pelo seu perfil (ex: região, tipos de cachaça de que gosta). Estas
+    # matrizes são a base da Filtragem Baseada em Conteúdo.
     # ======================================================================================
-    print("\nPASSO 3: Construindo a matriz de características das cachaças...")
-    item_features = dataset.build_item_features(
-        # Fornecemos uma tupla para cada cachaça no formato (id_item, [lista_de_features])
-        (row["id"], [row["tipoCachaca"], row["regiao"]])
-        for _, row in cachacas_df.iterrows()
-    )
-    print("Matriz de características construída.")
+    print("\nPASSO 3: Construindo as matrizes de características...")
+
+    def construir_user_features(pesos: sparse.spmatrix) -> sparse.csr_matrix:
+        return matrix_builder.build_user_features(
+            dataset, pesos, avaliacoes_df, cachacas_df
+        )
+
+    # Cada cachaça e cada usuário recebem sua feature de identidade + os atributos
+    # hasheados em um número fixo de baldes (ver features.py)
+    with metrics.stage("treinamento.features"):
+        item_features = matrix_builder.build_item_features(dataset, cachacas_df)
+        user_features = construir_user_features(weights)
+    metrics.set_gauge("feature_matrix_nnz", item_features.nnz, kind="item")
+    metrics.set_gauge("feature_matrix_nnz", user_features.nnz, kind="user")
+    print("Matrizes de características construídas.")
 
     # ======================================================================================
     # PASSO 4: Instanciar e Treinar o Modelo
     # Objetivo: Alimentar o modelo LightFM com as matrizes criadas para que ele aprenda os
     # padrões de gosto dos usuários.
     # ======================================================================================
-    print("\nPASSO 4: Instanciando e treinando o modelo LightFM...")
+    if modo_incremental:
+        print("\nPASSO 4: Continuando o treinamento do modelo anterior (incremental)...")
 
-    # Usamos 'warp' (Weighted Approximate-Rank Pairwise) porque ele é ótimo para otimizar
-    # a ordem (ranking) das recomendações, que é exatamente o que queremos.
-    model = LightFM(loss="warp", random_state=42, no_components=30, learning_rate=0.05)
-
-    # O método 'fit' inicia o treinamento.
-    model.fit(
-        interactions,  # A matriz de quem avaliou o quê
-        item_features=item_features,  # As características de cada cachaça
-        sample_weight=weights,  # As notas dadas em cada avaliação
-        epochs=20,  # Número de vezes que o modelo "estuda" os dados
-        num_threads=4,  # Quantos processadores usar para acelerar
-        verbose=True,  # Mostra o progresso do treinamento
-    )
-    print("Treinamento concluído.")
+        # Só treinamos as avaliações que mudaram desde o último treinamento
+        interactions_novas, weights_novos = _interacoes_alteradas(
+            weights, weights_anteriores
+        )
+        if interactions_novas.nnz == 0:
+            print("Nenhuma avaliação nova desde o último treinamento. Nada a fazer.")
+            if versao_atual is not None:
+                cache_etapas.record("treinamento", impressao, version=versao_atual)
+            return versao_atual
+        print(f"{interactions_novas.nnz} avaliação(ões) nova(s) ou alterada(s).")
+
+        # Abre espaço nas matrizes do modelo para os novos usuários, itens e features
+        _expandir_embeddings(
+            model,
+            n_user_features=dataset.user_features_shape()[1],
+            n_item_features=dataset.item_features_shape()[1],
+        )
+
+        with metrics.stage("treinamento.modelo"):
+            _treinar_epocas(
+                model,
+                interactions_novas,
+                user_features,
+                item_features,
+                weights_novos,
+                epocas_incrementais,
+                num_threads,
+            )
+        # A avaliação do último treinamento completo continua valendo como referência
+        estado = {
+            **estado,
+            "execucoes_incrementais": estado.get("execucoes_incrementais", 0) + 1,
+        }
+        print("Treinamento incremental concluído.")
+    else:
+        print("\nPASSO 4: Instanciando e treinando o modelo LightFM...")
+
+        # Treina com a matriz de quem avaliou o quê, as características de cada cachaça
+        # e as notas dadas em cada avaliação. O número de épocas (vezes que o modelo
+        # "estuda" os dados) é escolhido pela qualidade em avaliações de validação.
+        with metrics.stage("treinamento.modelo"):
+            if parada_antecipada:
+                model, avaliacao = _treinar_com_parada_antecipada(
+                    interactions,
+                    weights,
+                    user_features,
+                    item_features,
+                    num_threads,
+                    construir_user_features,
+                )
+            else:
+                model = _novo_modelo()
+                _treinar_epocas(
+                    model,
+                    interactions,
+                    user_features,
+                    item_features,
+                    weights,
+                    EPOCAS_MAXIMAS,
+                    num_threads,
+                )
+                avaliacao = {"epocas": EPOCAS_MAXIMAS}
+        estado = {
+            "execucoes_incrementais": 0,
+            "avaliacao": avaliacao,
+            "features": features.feature_config(),
+        }
+        print("Treinamento concluído.")
 
     # ======================================================================================
     # PASSO 5: Salvar os Artefatos
@@ -102,13 +632,42 @@ def executar_pipeline_treinamento(
     # ======================================================================================
     print("\nPASSO 5: Salvando o modelo treinado e os artefatos...")
 
-    # Usamos joblib pois é eficiente para salvar objetos Python complexos
-    joblib.dump(model, os.path.join(ARTIFACTS_PATH, "model.pkl"))
-    joblib.dump(dataset, os.path.join(ARTIFACTS_PATH, "dataset.pkl"))
+    # Usamos joblib pois é eficiente para salvar objetos Python complexos.
+    # O modelo e o dataset completos são usados pelo treinamento incremental.
+    joblib.dump(model, os.path.join(artifacts_path, "model.pkl"))
+    joblib.dump(dataset, os.path.join(artifacts_path, "dataset.pkl"))
+
+    # Pesos usados neste treinamento e estado, para o próximo treinamento incremental
+    sparse.save_npz(os.path.join(artifacts_path, "weights.npz"), weights.tocsr())
+    with open(
+        os.path.join(artifacts_path, "training_state.json"), "w", encoding="utf-8"
+    ) as f:
+        json.dump(estado, f)
+
+    # Artefatos de serviço do Recommender: embeddings/biases em .npy (mapeáveis em
+    # memória), representações dos itens já multiplicadas pela matriz de features,
+    # IDs em arrays compactos e o catálogo. Publicados atomicamente como nova versão.
+    with metrics.stage("treinamento.publicacao"):
+        versao = model_store.publish(
+            model,
+            dataset,
+            item_features,
+            interactions,
+            cachacas_df,
+            artifacts_path=artifacts_path,
+            user_features=user_features,
+            metadata={
+                "avaliacao": estado.get("avaliacao"),
+                "features": estado.get("features"),
+            },
+        )
+    print(f"Artefatos de serviço publicados (versão {versao}).")
+    cache_etapas.record("treinamento", impressao, version=versao)
 
     print(
-        f"✅ PIPELINE DE TREINAMENTO CONCLUÍDO! Artefatos salvos em '{ARTIFACTS_PATH}'."
+        f"✅ PIPELINE DE TREINAMENTO CONCLUÍDO! Artefatos salvos em '{artifacts_path}'."
     )
+    return versao
 
 
 # --- BLOCO DE EXECUÇÃO DE EXEMPLO ---
@@ -1,114 +1,710 @@
 # recommender.py
-from typing import Any, Dict, List
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import joblib
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
-# Define o caminho padrão para os artefatos salvos pelo model_trainer
-ARTIFACTS_PATH = "artifacts/"
+import metrics
+import model_store
+
+# Define o caminho padrão para os artefatos salvos pelo pipeline de treinamento
+ARTIFACTS_PATH = model_store.ARTIFACTS_PATH
+
+# Usuários com até este número de avaliações são atendidos pelas tabelas de cold start
+COLD_START_MAX_RATINGS = 2
+
+# Quantos itens do ranking de popularidade o cold start lê de cada vez
+POPULAR_CHUNK = 64
+
+# Tamanho padrão de cada fatia de usuários no modo multiprocesso
+DEFAULT_SHARD_SIZE = 5000
+
+# Atributos do catálogo pelos quais as recomendações podem ser filtradas, ex:
+# filters={"regiao": ["Salinas", "Paraíba"], "disponivel": True}
+FILTER_COLUMNS = ("tipoCachaca", "regiao", "disponivel")
+
+# Atributo limitado pelo re-ranqueamento de diversidade (max_per_type) e quantos
+# candidatos por posição do top-N ele considera
+DIVERSITY_COLUMN = "tipoCachaca"
+DIVERSITY_CANDIDATES_PER_SLOT = 4
+
+# Recommender de cada processo trabalhador (ver `Recommender.recommend_sharded`)
+_worker_recommender = None
+
+
+def _init_worker(artifacts_path: str, version: str):
+    """
+    Inicializa um processo trabalhador: abre a mesma versão dos artefatos com mmap,
+    de modo que todos os processos compartilham as páginas dos embeddings e nada
+    grande é serializado por tarefa.
+
+    O registro de métricas herdado do processo principal (fork) é zerado: o
+    trabalhador devolve só o que ele mesmo mediu, senão as métricas anteriores ao
+    pool seriam somadas de novo uma vez por trabalhador.
+    """
+    global _worker_recommender
+    metrics.REGISTRY.reset()
+    _worker_recommender = Recommender(artifacts_path, version)
+
+
+def _recommend_shard(
+    user_ids: List[Any],
+    top_n: int,
+    filters: Optional[Dict[str, Any]],
+    max_per_type: Optional[int],
+) -> Tuple[Dict[Any, List[Dict[str, Any]]], Dict[str, Any]]:
+    recommendations = _worker_recommender.recommend_all(
+        user_ids, top_n=top_n, filters=filters, max_per_type=max_per_type
+    )
+    # As métricas do trabalhador voltam junto para serem somadas no processo principal
+    return recommendations, metrics.REGISTRY.collect()
 
 
 class Recommender:
-    def __init__(self):
+    def __init__(
+        self, artifacts_path: str = ARTIFACTS_PATH, version: Optional[str] = None
+    ):
         """
-        Carrega todos os artefatos necessários (modelo, dataset, etc.)
-        quando uma instância da classe é criada.
+        Carrega a versão atual (ou a `version` pedida) dos artefatos de serviço
+        (embeddings mapeados em memória, mapeamentos de IDs e catálogo) quando uma
+        instância da classe é criada.
         """
-        self.model = None
-        self.dataset = None
+        self.artifacts_path = artifacts_path
+        self.artifacts = None
+        self.version = None
         self.cachacas_df = None
-        self.user_id_map = None
-        self.item_id_map_inv = None
+
+        # user_index / item_index: a posição de cada ID real é o seu índice interno
+        self.user_index = None
+        self.item_index = None
+
+        # Representações pré-computadas pelo pipeline de treinamento
+        self.user_biases = None
+        self.user_embeddings = None
+        self.item_biases = None
+        self.item_embeddings = None
+
+        # Tabelas de cold start (popularidade por segmento e cachaças similares)
+        self.similar_item_table = None
+        self._popular_slices = None
+
+        # Índices construídos uma vez por execução para filtragem e consulta O(1)
+        self.item_records = None
+        self.seen_items = None
+        self._seen_counts = None
+        self._indexed_ratings_df = None
+        self._attribute_masks: Dict[str, Dict[Any, np.ndarray]] = {}
+        self._diversity_codes = None
 
         try:
             print("Carregando artefatos do modelo treinado...")
-            self.model = joblib.load(ARTIFACTS_PATH + "model.pkl")
-            self.dataset = joblib.load(ARTIFACTS_PATH + "dataset.pkl")
-            self.cachacas_df = joblib.load(ARTIFACTS_PATH + "cachacas_df.pkl")
+            artifacts = model_store.load(artifacts_path, version)
+        except FileNotFoundError:
+            artifacts = None
 
-            # Extrai os mapeamentos do dataset para traduzir IDs
-            # user_id_map: Converte o ID real do usuário para o índice interno do modelo
-            # item_id_map: Converte o ID real da cachaça para o índice interno
-            user_id_map, _, item_id_map, _ = self.dataset.mapping()
-            self.user_id_map = user_id_map
+        if artifacts is None:
+            print(f"ERRO: Artefatos do modelo não encontrados no diretório '{artifacts_path}'.")
+            print("Por favor, execute o 'pipeline.py' primeiro.")
+            return
 
-            # Criamos um mapeamento inverso para converter o índice interno de volta para o ID real
-            self.item_id_map_inv = {v: k for k, v in item_id_map.items()}
+        self.artifacts = artifacts
+        self.version = artifacts.version
+        self.cachacas_df = artifacts.catalog
+        self.user_index = pd.Index(artifacts.user_ids)
+        self.item_index = pd.Index(artifacts.item_ids)
+        self.user_biases = artifacts.user_biases
+        self.user_embeddings = artifacts.user_embeddings
+        self.item_biases = artifacts.item_biases
+        self.item_embeddings = artifacts.item_embeddings
 
-            print("Artefatos carregados com sucesso.")
+        # Índice de itens já avaliados publicado junto com o modelo (usado quando
+        # nenhum DataFrame de avaliações é informado, ex: no servidor)
+        self._published_seen_items = sparse.csr_matrix(
+            (
+                np.ones(len(artifacts.seen_indices), dtype=np.bool_),
+                artifacts.seen_indices,
+                artifacts.seen_indptr,
+            ),
+            shape=(len(self.user_index), len(self.item_index)),
+        )
+        # Quantas avaliações cada usuário tem (decide quem vai para o cold start)
+        self._published_seen_counts = np.diff(self._published_seen_items.indptr)
 
-        except FileNotFoundError:
-            print("ERRO: Arquivos de modelo não encontrados no diretório 'artifacts/'.")
-            print("Por favor, execute o 'model_trainer.py' primeiro.")
+        self.similar_item_table = artifacts.similar_items
+        self._popular_slices = {
+            chave: (int(inicio), int(fim))
+            for chave, inicio, fim in zip(
+                artifacts.popular_keys.tolist(),
+                artifacts.popular_indptr[:-1],
+                artifacts.popular_indptr[1:],
+            )
+        }
 
-    def generate_recommendations(
-        self, user_id: Any, user_ratings_df: pd.DataFrame, top_n: int = 5
-    ) -> List[Dict[str, Any]]:
+        self._build_item_records()
+        self._build_attribute_index()
+
+        print(f"Artefatos carregados com sucesso (versão {self.version}).")
+
+    @property
+    def loaded(self) -> bool:
+        """Indica se os artefatos do modelo foram carregados."""
+        return self.artifacts is not None
+
+    def _select_top_items(self, scores: np.ndarray, top_n: int) -> np.ndarray:
         """
-        Gera uma lista das N melhores recomendações para um usuário específico.
+        Seleciona os índices dos `top_n` maiores scores de cada linha usando uma
+        ordenação parcial (np.argpartition) em vez de ordenar o catálogo inteiro.
+        Itens com score -inf (já avaliados) nunca são retornados.
 
         Args:
-            user_id: O ID do usuário para o qual gerar recomendações.
-            user_ratings_df: DataFrame contendo todas as avaliações para filtrar itens já vistos.
-            top_n: O número de recomendações a serem retornadas.
+            scores: Matriz (usuários x itens) de scores.
+            top_n: Quantidade de itens por usuário.
 
         Returns:
-            Uma lista de dicionários, onde cada dicionário contém os detalhes de uma cachaça recomendada.
+            Matriz (usuários x k) com os índices internos, do maior para o menor score.
         """
-        if not self.model or not self.user_id_map:
-            print("Recomendador não foi inicializado corretamente. Abortando.")
-            return []
+        k = min(top_n, scores.shape[1])
+        if k <= 0:
+            return np.empty((scores.shape[0], 0), dtype=np.int64)
+
+        # Apenas os k melhores de cada linha ficam (desordenados) nas primeiras colunas
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+
+        # Ordena somente os k candidatos
+        order = np.argsort(-candidate_scores, axis=1)
+        return np.take_along_axis(candidates, order, axis=1)
 
-        # Verifica se o usuário existe no nosso dataset de treinamento
-        if user_id not in self.user_id_map:
-            print(
-                f"Usuário {user_id} é novo ou não possui avaliações. Não é possível gerar recomendações personalizadas."
+    def _build_item_records(self):
+        """
+        Pré-monta a tabela "índice interno -> registro da cachaça", para que os detalhes
+        de cada recomendação sejam obtidos em O(1) em vez de filtrar o catálogo inteiro.
+        O catálogo já vem alinhado à ordem interna; itens sem cadastro ficam como None.
+        """
+        no_catalogo = self.cachacas_df.drop(columns="id").notna().any(axis=1)
+        self.item_records = [
+            record if presente else None
+            for record, presente in zip(
+                self.cachacas_df.to_dict("records"), no_catalogo.to_numpy()
             )
-            return []
+        ]
 
-        # Pega o índice interno do usuário, que o modelo entende
-        internal_user_id = self.user_id_map[user_id]
-
-        # Pega a lista de todas as cachaças que o usuário já avaliou para não recomendá-las novamente
-        known_positives_ids = user_ratings_df[user_ratings_df["user.id"] == user_id][
-            "cachaca.id"
-        ].tolist()
-
-        # Pega os índices de todos os itens possíveis em nosso catálogo
-        all_item_indices = np.arange(len(self.item_id_map_inv))
-
-        # O CORAÇÃO DA RECOMENDAÇÃO:
-        # O modelo calcula um "score" para cada cachaça para este usuário específico.
-        scores = self.model.predict(
-            internal_user_id,
-            all_item_indices,
-            item_features=self.dataset.build_item_features(
-                (
-                    (row["id"], [row["tipoCachaca"], row["regiao"]])
-                    for _, row in self.cachacas_df.iterrows()
+    def _build_attribute_index(self):
+        """
+        Pré-computa, para cada coluna de FILTER_COLUMNS, uma máscara booleana por valor
+        sobre a ordem interna dos itens (máscara[i] = o item i tem aquele valor), e o
+        código de DIVERSITY_COLUMN de cada item (-1 se ausente).
+        """
+        for coluna in FILTER_COLUMNS:
+            if coluna not in self.cachacas_df:
+                continue
+            categorias = pd.Categorical(self.cachacas_df[coluna])
+            mascaras = (
+                categorias.codes[np.newaxis, :]
+                == np.arange(len(categorias.categories))[:, np.newaxis]
+            )
+            self._attribute_masks[coluna] = dict(zip(categorias.categories, mascaras))
+
+        if DIVERSITY_COLUMN in self.cachacas_df:
+            self._diversity_codes = (
+                pd.Categorical(self.cachacas_df[DIVERSITY_COLUMN]).codes.astype(np.int64)
+            )
+
+    def _filter_mask(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Combina as máscaras pré-computadas em uma máscara booleana dos itens permitidos:
+        os valores de uma mesma coluna se somam (OU) e as colunas se restringem (E).
+
+        Args:
+            filters: {coluna: valor ou lista de valores}, com colunas de FILTER_COLUMNS.
+
+        Returns:
+            A máscara (um booleano por índice interno de item) ou None sem filtros.
+        """
+        if not filters:
+            return None
+        permitidos = np.ones(len(self.item_index), dtype=np.bool_)
+        for coluna, valores in filters.items():
+            if coluna not in FILTER_COLUMNS:
+                raise ValueError(
+                    f"Filtro desconhecido: '{coluna}'. Use um de {FILTER_COLUMNS}."
                 )
-            ),
+            if coluna not in self._attribute_masks:
+                # O catálogo não tem a coluna (a API não enviou o campo): não há como
+                # filtrar por ela, e descartar todos os itens seria pior
+                continue
+            if isinstance(valores, (str, bool)) or not isinstance(valores, Iterable):
+                valores = [valores]
+            mascaras = self._attribute_masks[coluna]
+            na_coluna = np.zeros_like(permitidos)
+            for valor in valores:
+                if valor in mascaras:
+                    na_coluna |= mascaras[valor]
+            permitidos &= na_coluna
+        return permitidos
+
+    def _diversify(
+        self,
+        candidates: np.ndarray,
+        valid: np.ndarray,
+        top_n: int,
+        max_per_type: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Re-ranqueamento guloso de diversidade, vetorizado para um bloco de usuários:
+        percorre os candidatos de cada linha do maior para o menor score e aceita um
+        item só se ainda há menos de `max_per_type` itens do mesmo DIVERSITY_COLUMN
+        aceitos antes dele.
+
+        Como um item só é recusado pelo seu próprio tipo, ele é aceito exatamente quando
+        tem menos de `max_per_type` candidatos do mesmo tipo antes dele; essa posição
+        dentro do tipo sai de uma única ordenação por (tipo, posição) em cada linha.
+
+        Args:
+            candidates: Matriz (usuários x candidatos) de índices internos, do maior
+                para o menor score.
+            valid: Máscara dos candidatos válidos (score diferente de -inf).
+
+        Returns:
+            Uma tupla (indices, valid) com até `top_n` colunas.
+        """
+        if self._diversity_codes is None:
+            return candidates[:, :top_n], valid[:, :top_n]
+
+        tipos = self._diversity_codes[candidates]
+        posicoes = np.arange(tipos.shape[1])
+        ordem = np.argsort(tipos * tipos.shape[1] + posicoes, axis=1)
+        tipos_ordenados = np.take_along_axis(tipos, ordem, axis=1)
+        inicio_do_tipo = np.ones_like(tipos_ordenados, dtype=np.bool_)
+        inicio_do_tipo[:, 1:] = tipos_ordenados[:, 1:] != tipos_ordenados[:, :-1]
+        primeira_posicao = np.maximum.accumulate(
+            np.where(inicio_do_tipo, posicoes, 0), axis=1
         )
+        posicao_no_tipo = np.empty_like(ordem)
+        np.put_along_axis(posicao_no_tipo, ordem, posicoes - primeira_posicao, axis=1)
+
+        # Itens sem tipo não entram no limite
+        aceitos = valid & ((posicao_no_tipo < max_per_type) | (tipos < 0))
+        escolhidos = np.argsort(~aceitos, axis=1, kind="stable")[:, :top_n]
+        return (
+            np.take_along_axis(candidates, escolhidos, axis=1),
+            np.take_along_axis(aceitos, escolhidos, axis=1),
+        )
+
+    def build_seen_index(self, user_ratings_df: pd.DataFrame):
+        """
+        Constrói uma matriz esparsa CSR (usuários x itens), alinhada aos índices internos
+        do modelo, marcando as cachaças que cada usuário já avaliou.
 
-        # Ordena os itens pelo score (do maior para o menor)
-        top_items_indices = np.argsort(-scores)
+        Args:
+            user_ratings_df: DataFrame com as colunas ['user.id', 'cachaca.id'].
+        """
+        user_indices = self.user_index.get_indexer(user_ratings_df["user.id"])
+        item_indices = self.item_index.get_indexer(user_ratings_df["cachaca.id"])
 
-        recommendations = []
-        for item_index in top_items_indices:
-            # Converte o índice interno de volta para o ID original da cachaça
-            original_item_id = self.item_id_map_inv[item_index]
+        # Descarta avaliações de usuários/itens que o modelo não conhece
+        valid = (user_indices >= 0) & (item_indices >= 0)
+        rows = user_indices[valid].astype(np.int32)
+        cols = item_indices[valid].astype(np.int32)
+
+        seen_items = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.bool_), (rows, cols)),
+            shape=(len(self.user_index), len(self.item_index)),
+        )
+        seen_items.sum_duplicates()
 
-            # Adiciona à lista de recomendação apenas se o usuário ainda não avaliou
-            if original_item_id not in known_positives_ids:
-                item_details = self.cachacas_df[
-                    self.cachacas_df["id"] == original_item_id
-                ]
-                if not item_details.empty:
-                    recommendations.append(item_details.to_dict("records")[0])
+        self.seen_items = seen_items
+        self._seen_counts = np.diff(seen_items.indptr)
+        self._indexed_ratings_df = user_ratings_df
 
-            # Para quando atingimos o número desejado de recomendações
-            if len(recommendations) >= top_n:
+    def _get_seen_index(
+        self, user_ratings_df: Optional[pd.DataFrame]
+    ) -> Tuple[sparse.csr_matrix, np.ndarray]:
+        """
+        Retorna o índice de itens vistos e o número de avaliações de cada usuário,
+        reconstruindo-os apenas se o DataFrame de avaliações mudou. Sem DataFrame, usa
+        o índice publicado junto com o modelo.
+        """
+        if user_ratings_df is None:
+            return self._published_seen_items, self._published_seen_counts
+        if self.seen_items is None or user_ratings_df is not self._indexed_ratings_df:
+            self.build_seen_index(user_ratings_df)
+        return self.seen_items, self._seen_counts
+
+    def _records(self, item_indices: Iterable[int]) -> List[Dict[str, Any]]:
+        """Converte índices internos de cachaças em seus registros do catálogo."""
+        return [
+            self.item_records[item_index]
+            for item_index in item_indices
+            if self.item_records[item_index] is not None
+        ]
+
+    def _popular_ranking(
+        self, tipo_cachaca: Optional[str] = None, regiao: Optional[str] = None
+    ) -> np.ndarray:
+        """
+        Ranking de popularidade pré-computado do segmento pedido (O(1)). Com os dois
+        filtros, usa o segmento combinado de tipo e região; segmentos desconhecidos
+        caem no ranking geral.
+        """
+        pares: List[Any] = []
+        if tipo_cachaca is not None:
+            pares += ["tipoCachaca", tipo_cachaca]
+        if regiao is not None:
+            pares += ["regiao", regiao]
+        chave = model_store.segment_key(*pares) if pares else ""
+        inicio, fim = self._popular_slices.get(chave, self._popular_slices[""])
+        return np.asarray(self.artifacts.popular_indices[inicio:fim])
+
+    def _cold_start_popular(self, allowed: Optional[np.ndarray]) -> Iterator[int]:
+        """
+        Percorre o ranking geral de popularidade (completo) restrito aos itens
+        permitidos, para completar as listas de cold start. O ranking é lido em fatias
+        de POPULAR_CHUNK itens, sob demanda: um usuário que só precisa dos primeiros
+        não paga pelo catálogo inteiro.
+        """
+        ranking = self._popular_ranking()
+        for inicio in range(0, len(ranking), POPULAR_CHUNK):
+            fatia = ranking[inicio : inicio + POPULAR_CHUNK]
+            if allowed is not None:
+                fatia = fatia[allowed[fatia]]
+            yield from fatia.tolist()
+
+    def _cold_start_indices(
+        self,
+        seen_indices: np.ndarray,
+        top_n: int,
+        popular: Iterable[int],
+        allowed: Optional[np.ndarray] = None,
+        max_per_type: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Recomendações para quem tem poucas (ou nenhuma) avaliações: as cachaças mais
+        similares às que o usuário avaliou (intercaladas por posição no ranking de
+        similaridade) e, para completar, as mais populares entre as permitidas
+        (`popular`, ver `_cold_start_popular`). Respeita a máscara de itens permitidos
+        e o limite de itens por tipo, como o caminho do modelo.
+        """
+        excluidos = set(seen_indices.tolist())
+        escolhidos: List[int] = []
+        por_tipo: Dict[int, int] = {}
+
+        candidatos = []
+        if len(seen_indices) and self.similar_item_table.shape[1]:
+            candidatos = self.similar_item_table[seen_indices].T.ravel().tolist()
+        for item_index in itertools.chain(candidatos, popular):
+            if len(escolhidos) >= top_n:
                 break
+            if item_index in excluidos or (
+                allowed is not None and not allowed[item_index]
+            ):
+                continue
+            if max_per_type is not None and self._diversity_codes is not None:
+                tipo = self._diversity_codes[item_index]
+                if tipo >= 0 and por_tipo.get(tipo, 0) >= max_per_type:
+                    continue
+                por_tipo[tipo] = por_tipo.get(tipo, 0) + 1
+            escolhidos.append(item_index)
+            excluidos.add(item_index)
+        return escolhidos
+
+    def _seen_by_cold_users(
+        self,
+        cold_users: List[Any],
+        cold_internal_ids: np.ndarray,
+        seen_items: sparse.csr_matrix,
+        user_ratings_df: Optional[pd.DataFrame],
+    ) -> Dict[Any, np.ndarray]:
+        """
+        Itens já avaliados por cada usuário atendido via cold start. Para usuários que o
+        modelo ainda não conhece, as avaliações vêm do DataFrame (se informado).
+        """
+        seen: Dict[Any, np.ndarray] = {}
+        desconhecidos = []
+        for user_id, internal_id in zip(cold_users, cold_internal_ids):
+            if internal_id >= 0:
+                inicio, fim = seen_items.indptr[internal_id], seen_items.indptr[internal_id + 1]
+                seen[user_id] = seen_items.indices[inicio:fim]
+            else:
+                seen[user_id] = np.empty(0, dtype=np.int64)
+                desconhecidos.append(user_id)
+
+        if desconhecidos and user_ratings_df is not None:
+            ratings = user_ratings_df[user_ratings_df["user.id"].isin(desconhecidos)]
+            item_indices = pd.Series(
+                self.item_index.get_indexer(ratings["cachaca.id"]),
+                index=ratings["user.id"].to_numpy(),
+            )
+            for user_id, indices in item_indices[item_indices >= 0].groupby(level=0):
+                seen[user_id] = indices.to_numpy()
+        return seen
+
+    def recommend_popular(
+        self,
+        top_n: int = 5,
+        tipo_cachaca: Optional[str] = None,
+        regiao: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Retorna as cachaças mais populares no geral ou de um segmento (tipo e/ou região),
+        a partir dos rankings pré-computados pelo pipeline de treinamento.
+        """
+        if not self.loaded:
+            print("Recomendador não foi inicializado corretamente. Abortando.")
+            return []
+        return self._records(self._popular_ranking(tipo_cachaca, regiao)[:top_n])
+
+    def similar_items(self, item_id: Any, top_n: int = 5) -> List[Dict[str, Any]]:
+        """Retorna as cachaças mais similares a uma cachaça (tabela pré-computada)."""
+        if not self.loaded or item_id not in self.item_index:
+            return []
+        item_index = self.item_index.get_loc(item_id)
+        return self._records(self.similar_item_table[item_index][:top_n].tolist())
+
+    @staticmethod
+    def _observe_scoring(inicio: float, n_users: int, path: str):
+        """
+        Registra a latência por usuário de um bloco pontuado de uma só vez (o tempo do
+        bloco dividido igualmente entre os seus usuários).
+        """
+        if n_users:
+            metrics.observe(
+                "scoring_user_seconds",
+                (time.perf_counter() - inicio) / n_users,
+                count=n_users,
+                path=path,
+            )
+            metrics.inc("users_scored_total", n_users, path=path)
+
+    def recommend_all(
+        self,
+        user_ids: Iterable[Any],
+        user_ratings_df: Optional[pd.DataFrame] = None,
+        top_n: int = 5,
+        batch_size: int = 1024,
+        cold_start: bool = True,
+        filters: Optional[Dict[str, Any]] = None,
+        max_per_type: Optional[int] = None,
+    ) -> Dict[Any, List[Dict[str, Any]]]:
+        """
+        Gera as N melhores recomendações para vários usuários de uma só vez.
+
+        As representações das cachaças são calculadas uma única vez e os usuários são
+        pontuados em blocos, como um produto de matrizes densas (usuários x itens).
+        Usuários desconhecidos pelo modelo ou com até COLD_START_MAX_RATINGS avaliações
+        são atendidos pelas tabelas de cold start (similares + populares).
+
+        Com `filters`, só as cachaças permitidas pelas máscaras pré-computadas entram no
+        produto de matrizes (filtrar custa menos que não filtrar). Com `max_per_type`,
+        o re-ranqueamento guloso de diversidade escolhe o top-N entre os
+        DIVERSITY_CANDIDATES_PER_SLOT * N melhores, limitando os itens de cada tipo.
+
+        Args:
+            user_ids: Os IDs dos usuários para os quais gerar recomendações.
+            user_ratings_df: DataFrame contendo todas as avaliações para filtrar itens já vistos.
+                Se None, usa as avaliações do treino publicadas junto com o modelo.
+            top_n: O número de recomendações a serem retornadas por usuário.
+            batch_size: Quantos usuários são pontuados por bloco (limita o uso de memória).
+            cold_start: Se False, usuários desconhecidos recebem uma lista vazia e todos
+                os conhecidos são pontuados pelo modelo.
+            filters: Restringe as recomendações por atributos do catálogo, ex:
+                {"regiao": ["Salinas"], "disponivel": True} (ver FILTER_COLUMNS).
+            max_per_type: Máximo de cachaças de um mesmo DIVERSITY_COLUMN por usuário.
+
+        Returns:
+            Um dicionário {id_usuario: lista de recomendações}.
+        """
+        user_ids = list(user_ids)
+        results: Dict[Any, List[Dict[str, Any]]] = {user_id: [] for user_id in user_ids}
+
+        if not self.loaded:
+            print("Recomendador não foi inicializado corretamente. Abortando.")
+            return results
+
+        # Índice CSR de itens já avaliados (construído uma única vez por DataFrame)
+        seen_items, seen_counts = self._get_seen_index(user_ratings_df)
+        permitidos = self._filter_mask(filters)
+
+        # Índices internos de todos os usuários pedidos (-1 para os desconhecidos)
+        internal_ids = self.user_index.get_indexer(pd.Index(user_ids))
+        known = internal_ids >= 0
+        warm = known.copy()
+        if cold_start:
+            warm[known] = seen_counts[internal_ids[known]] > COLD_START_MAX_RATINGS
+
+        if not warm.all():
+            cold_users = [user_id for user_id, ok in zip(user_ids, warm) if not ok]
+            if cold_start:
+                inicio = time.perf_counter()
+                seen_by_user = self._seen_by_cold_users(
+                    cold_users, internal_ids[~warm], seen_items, user_ratings_df
+                )
+                for user_id in cold_users:
+                    results[user_id] = self._records(
+                        self._cold_start_indices(
+                            seen_by_user[user_id],
+                            top_n,
+                            self._cold_start_popular(permitidos),
+                            permitidos,
+                            max_per_type,
+                        )
+                    )
+                self._observe_scoring(inicio, len(cold_users), "cold_start")
+            else:
+                metrics.inc("users_skipped_total", len(cold_users))
+
+        warm_users = [user_id for user_id, ok in zip(user_ids, warm) if ok]
+        warm_internal_ids = internal_ids[warm]
+
+        user_biases, user_embeddings = self.user_biases, self.user_embeddings
+        item_biases, item_embeddings = self.item_biases, self.item_embeddings
+
+        # Com filtros, só as colunas dos itens permitidos são pontuadas; `posicao_filtrada`
+        # traduz um índice interno para a sua coluna na matriz filtrada (-1 = fora)
+        itens_pontuados = None
+        if permitidos is not None:
+            itens_pontuados = np.flatnonzero(permitidos)
+            item_biases = item_biases[itens_pontuados]
+            item_embeddings = item_embeddings[itens_pontuados]
+            posicao_filtrada = np.full(len(permitidos), -1, dtype=np.int64)
+            posicao_filtrada[itens_pontuados] = np.arange(len(itens_pontuados))
+
+        n_candidatos = top_n
+        if max_per_type is not None:
+            n_candidatos = top_n * DIVERSITY_CANDIDATES_PER_SLOT
+
+        for start in range(0, len(warm_users), batch_size):
+            inicio = time.perf_counter()
+            block_users = warm_users[start : start + batch_size]
+            internal_ids = warm_internal_ids[start : start + batch_size]
+
+            # Scores do bloco: (usuários x componentes) @ (componentes x itens) + biases
+            scores = user_embeddings[internal_ids] @ item_embeddings.T
+            scores += user_biases[internal_ids, np.newaxis]
+            scores += item_biases[np.newaxis, :]
+
+            # Itens já avaliados recebem -inf para nunca entrarem no top-N.
+            # O custo é proporcional ao número de itens vistos pelos usuários do bloco.
+            seen_rows, seen_cols = seen_items[internal_ids].nonzero()
+            if itens_pontuados is not None:
+                seen_cols = posicao_filtrada[seen_cols]
+                pontuados = seen_cols >= 0
+                seen_rows, seen_cols = seen_rows[pontuados], seen_cols[pontuados]
+            scores[seen_rows, seen_cols] = -np.inf
+
+            top_indices = self._select_top_items(scores, n_candidatos)
+            valid = ~np.isneginf(np.take_along_axis(scores, top_indices, axis=1))
+            if itens_pontuados is not None:
+                top_indices = itens_pontuados[top_indices]
+            if max_per_type is not None:
+                top_indices, valid = self._diversify(
+                    top_indices, valid, top_n, max_per_type
+                )
+
+            for row, user_id in enumerate(block_users):
+                results[user_id] = self._records(top_indices[row][valid[row]])
+            self._observe_scoring(inicio, len(block_users), "modelo")
+
+        return results
+
+    def recommend_sharded(
+        self,
+        user_ids: Iterable[Any],
+        top_n: int = 5,
+        workers: int = 1,
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        filters: Optional[Dict[str, Any]] = None,
+        max_per_type: Optional[int] = None,
+    ) -> Iterator[Dict[Any, List[Dict[str, Any]]]]:
+        """
+        Gera recomendações para muitos usuários dividindo-os em fatias (shards) e
+        devolvendo o resultado de cada fatia assim que ela termina.
+
+        Com `workers > 1`, as fatias são processadas por um pool de processos. Cada
+        processo abre a mesma versão dos artefatos deste Recommender via mmap (as
+        páginas são compartilhadas entre processos) e só os IDs das fatias e as
+        recomendações trafegam entre eles. Os itens já avaliados vêm do índice publicado
+        junto com o modelo.
+
+        Args:
+            user_ids: Os IDs dos usuários para os quais gerar recomendações.
+            top_n: O número de recomendações por usuário.
+            workers: Quantos processos usar (1 = tudo neste processo).
+            shard_size: Quantos usuários por fatia.
+            filters / max_per_type: Como em `recommend_all`.
+
+        Yields:
+            Um dicionário {id_usuario: lista de recomendações} por fatia concluída.
+        """
+        if not self.loaded:
+            print("Recomendador não foi inicializado corretamente. Abortando.")
+            return
+
+        user_ids = list(user_ids)
+        shards = [
+            user_ids[inicio : inicio + shard_size]
+            for inicio in range(0, len(user_ids), shard_size)
+        ]
+
+        if workers <= 1 or len(shards) <= 1:
+            for shard in shards:
+                yield self.recommend_all(
+                    shard, top_n=top_n, filters=filters, max_per_type=max_per_type
+                )
+            return
+
+        print(f"Gerando recomendações em {len(shards)} fatia(s) com {workers} processo(s)...")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.artifacts_path, self.version),
+        ) as executor:
+            futuros = [
+                executor.submit(_recommend_shard, shard, top_n, filters, max_per_type)
+                for shard in shards
+            ]
+            for futuro in as_completed(futuros):
+                recommendations, shard_metrics = futuro.result()
+                metrics.REGISTRY.merge(shard_metrics)
+                yield recommendations
+
+    def generate_recommendations(
+        self,
+        user_id: Any,
+        user_ratings_df: Optional[pd.DataFrame] = None,
+        top_n: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        max_per_type: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Gera uma lista das N melhores recomendações para um usuário específico.
+        Usuários novos ou com poucas avaliações recebem recomendações de cold start.
+
+        Args:
+            user_id: O ID do usuário para o qual gerar recomendações.
+            user_ratings_df: DataFrame contendo todas as avaliações para filtrar itens já vistos.
+                Se None, usa as avaliações do treino publicadas junto com o modelo.
+            top_n: O número de recomendações a serem retornadas.
+            filters: Restringe as recomendações por atributos do catálogo (ver
+                `recommend_all`).
+            max_per_type: Máximo de cachaças de um mesmo tipo na lista.
+
+        Returns:
+            Uma lista de dicionários, onde cada dicionário contém os detalhes de uma cachaça recomendada.
+        """
+        if not self.loaded:
+            print("Recomendador não foi inicializado corretamente. Abortando.")
+            return []
 
-        return recommendations
+        # Reaproveita o caminho em lote (representações dos itens já pré-computadas)
+        return self.recommend_all(
+            [user_id],
+            user_ratings_df,
+            top_n=top_n,
+            filters=filters,
+            max_per_type=max_per_type,
+        )[user_id]
@@ -0,0 +1,298 @@
+# server.py
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+import metrics
+import model_store
+from recommender import ARTIFACTS_PATH, FILTER_COLUMNS, Recommender
+
+# Configurações padrão do servidor (podem ser sobrescritas pelo .env:
+# SERVER_HOST, SERVER_PORT, RECS_CACHE_SIZE, RECS_CACHE_TTL e MODEL_RELOAD_INTERVAL)
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_CACHE_SIZE = 100_000
+DEFAULT_CACHE_TTL = 300.0
+DEFAULT_RELOAD_INTERVAL = 10.0
+
+# Limites do parâmetro ?n=
+DEFAULT_N = 5
+MAX_N = 100
+
+_ROTA_RECOMENDACOES = re.compile(r"^/users/([^/]+)/recommendations/?$")
+
+
+class _TTLCache:
+    """Cache LRU com expiração por tempo (TTL), seguro para várias threads."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            entrada = self._data.get(key)
+            if entrada is None:
+                return None
+            expira_em, valor = entrada
+            if expira_em < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return valor
+
+    def put(self, key: Any, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def _json_safe(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Troca NaN/NA (campos ausentes no catálogo) por None, que vira `null` no JSON."""
+    return {
+        chave: None
+        if valor is pd.NA or (isinstance(valor, float) and math.isnan(valor))
+        else valor
+        for chave, valor in record.items()
+    }
+
+
+def _parse_filters(query: Dict[str, List[str]]) -> Dict[str, Any]:
+    """
+    Lê os filtros da query string (?regiao=Salinas&regiao=Paraíba&disponivel=true):
+    um parâmetro por coluna de FILTER_COLUMNS, podendo se repetir.
+    """
+    filtros: Dict[str, Any] = {}
+    for coluna in FILTER_COLUMNS:
+        valores = query.get(coluna)
+        if not valores:
+            continue
+        if coluna == "disponivel":
+            valores = [valor.lower() in ("true", "1", "sim") for valor in valores]
+        filtros[coluna] = valores
+    return filtros
+
+
+class RecommendationService:
+    """
+    Mantém um `Recommender` residente em memória e responde recomendações por usuário.
+
+    Os resultados ficam em um cache LRU/TTL cuja chave inclui a versão do modelo. Uma
+    thread de fundo verifica periodicamente se o pipeline publicou uma nova versão e,
+    se sim, carrega-a fora do caminho das requisições e troca a referência de uma vez:
+    requisições em andamento terminam com a versão antiga, as novas já usam a nova.
+    """
+
+    def __init__(
+        self,
+        artifacts_path: str = ARTIFACTS_PATH,
+        cache_size: Optional[int] = None,
+        cache_ttl: Optional[float] = None,
+        reload_interval: Optional[float] = None,
+    ):
+        self.artifacts_path = artifacts_path
+        self.reload_interval = reload_interval or float(
+            os.getenv("MODEL_RELOAD_INTERVAL", DEFAULT_RELOAD_INTERVAL)
+        )
+        self.cache = _TTLCache(
+            cache_size or int(os.getenv("RECS_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+            cache_ttl or float(os.getenv("RECS_CACHE_TTL", DEFAULT_CACHE_TTL)),
+        )
+        self.recommender = Recommender(artifacts_path)
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def reload_if_changed(self) -> bool:
+        """Carrega e ativa a versão publicada mais recente, se ela mudou."""
+        with self._reload_lock:
+            versao = model_store.current_version(self.artifacts_path)
+            if versao is None or versao == self.recommender.version:
+                return False
+            novo = Recommender(self.artifacts_path)
+            if not novo.loaded:
+                return False
+            # Atribuição de referência é atômica: não há janela sem modelo
+            self.recommender = novo
+            print(f"Nova versão do modelo ativada: {novo.version}")
+            return True
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                # Uma versão com problema não derruba o servidor: segue com a atual
+                print(f"FALHA ao recarregar o modelo: {e}")
+
+    def start_watcher(self):
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def recommend(
+        self,
+        user_id_texto: str,
+        n: int,
+        filters: Optional[Dict[str, Any]] = None,
+        max_per_type: Optional[int] = None,
+    ) -> Tuple[Optional[str], Optional[List[Dict[str, Any]]]]:
+        """
+        Retorna (versão, recomendações) do usuário; recomendações é None se o ID não é
+        válido para o modelo. Usuários novos recebem as recomendações de cold start.
+        Os filtros e o limite por tipo são os de `Recommender.recommend_all`.
+        """
+        # Pega a referência uma única vez: a requisição inteira usa a mesma versão
+        recommender = self.recommender
+        if not recommender.loaded:
+            return None, None
+
+        # IDs numéricos chegam como texto na URL
+        user_id: Any = user_id_texto
+        if recommender.user_index.dtype.kind in "iu":
+            try:
+                user_id = int(user_id_texto)
+            except ValueError:
+                return recommender.version, None
+
+        chave_filtros = tuple(
+            sorted(
+                (coluna, tuple(valores)) for coluna, valores in (filters or {}).items()
+            )
+        )
+        chave = (recommender.version, user_id, n, chave_filtros, max_per_type)
+        resultado = self.cache.get(chave)
+        metrics.inc("recs_cache_lookups_total", hit=resultado is not None)
+        if resultado is None:
+            recomendacoes = recommender.recommend_all(
+                [user_id], top_n=n, filters=filters, max_per_type=max_per_type
+            )[user_id]
+            resultado = [_json_safe(rec) for rec in recomendacoes]
+            self.cache.put(chave, resultado)
+        return recommender.version, resultado
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    service: RecommendationService  # Definido em `create_server`
+    protocol_version = "HTTP/1.1"  # Mantém a conexão viva entre requisições
+
+    def log_message(self, format, *args):
+        pass  # Não imprime uma linha por requisição
+
+    def _responder(
+        self,
+        status: int,
+        corpo: Union[Dict[str, Any], str],
+        content_type: str = "application/json; charset=utf-8",
+    ):
+        if isinstance(corpo, str):
+            dados = corpo.encode("utf-8")
+        else:
+            dados = json.dumps(corpo, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            # Métricas do processo no formato de exposição do Prometheus
+            self._responder(
+                200, metrics.REGISTRY.to_prometheus(), "text/plain; version=0.0.4"
+            )
+            return
+
+        inicio = time.perf_counter()
+        rota = _ROTA_RECOMENDACOES.match(url.path)
+        if rota is None:
+            self._responder(404, {"erro": "Rota não encontrada."})
+            return
+
+        query = parse_qs(url.query)
+        try:
+            n = int(query.get("n", [DEFAULT_N])[0])
+        except ValueError:
+            n = 0
+        if not 1 <= n <= MAX_N:
+            self._responder(400, {"erro": f"O parâmetro n deve estar entre 1 e {MAX_N}."})
+            return
+        max_per_type = None
+        if "max_per_type" in query:
+            try:
+                max_per_type = int(query["max_per_type"][0])
+            except ValueError:
+                max_per_type = 0
+        if max_per_type is not None and max_per_type < 1:
+            self._responder(400, {"erro": "O parâmetro max_per_type deve ser positivo."})
+            return
+
+        user_id = rota.group(1)
+        versao, recomendacoes = self.service.recommend(
+            user_id, n, _parse_filters(query), max_per_type
+        )
+        if versao is None:
+            self._responder(503, {"erro": "Modelo ainda não disponível."})
+        elif recomendacoes is None:
+            self._responder(404, {"erro": f"ID de usuário inválido: {user_id}."})
+        else:
+            self._responder(
+                200,
+                {"user_id": user_id, "version": versao, "recommendations": recomendacoes},
+            )
+        metrics.observe("http_server_request_seconds", time.perf_counter() - inicio)
+
+
+def create_server(
+    service: RecommendationService, host: str, port: int
+) -> ThreadingHTTPServer:
+    """Cria o servidor HTTP (uma thread por conexão) ligado ao serviço informado."""
+    handler = type("RequestHandler", (_RequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def run_server(host: Optional[str] = None, port: Optional[int] = None):
+    """Sobe o servidor de recomendações e fica atendendo até ser interrompido."""
+    host = host or os.getenv("SERVER_HOST", DEFAULT_HOST)
+    port = port or int(os.getenv("SERVER_PORT", DEFAULT_PORT))
+
+    service = RecommendationService()
+    service.start_watcher()
+    server = create_server(service, host, port)
+    print(
+        f"Servindo recomendações em http://{host}:{port}/users/<id>/recommendations"
+        "?n=&regiao=&tipoCachaca=&disponivel=&max_per_type="
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop_watcher()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    # Carrega as variáveis de ambiente do arquivo .env para o sistema
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    run_server()
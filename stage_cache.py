@@ -0,0 +1,145 @@
+# stage_cache.py
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Diretório padrão dos resultados de etapas guardados pelo StageCache
+STAGE_CACHE_PATH = "cache/stages/"
+
+
+def _hash_pandas(valor) -> bytes:
+    """Hash por linha de um DataFrame/Series (listas e dicts entram pelo JSON)."""
+    try:
+        hashes = pd.util.hash_pandas_object(valor, index=False)
+    except TypeError:
+        if isinstance(valor, pd.Series):
+            valor = valor.to_frame()
+        valor = valor.apply(
+            lambda coluna: coluna.map(lambda v: json.dumps(v, default=str))
+            if coluna.dtype == object
+            else coluna
+        )
+        hashes = pd.util.hash_pandas_object(valor, index=False)
+    return hashes.to_numpy().tobytes()
+
+
+def _update(digest, valor: Any):
+    """Acrescenta ao hash o conteúdo de um valor (DataFrame, array, matriz ou JSON)."""
+
+    def bloco(dados: bytes):
+        # O tamanho antes dos dados evita que partes diferentes colidam ao se juntar
+        digest.update(len(dados).to_bytes(8, "little"))
+        digest.update(dados)
+
+    if isinstance(valor, pd.DataFrame):
+        bloco(b"dataframe")
+        bloco(json.dumps([[str(c), str(t)] for c, t in valor.dtypes.items()]).encode())
+        bloco(_hash_pandas(valor))
+    elif isinstance(valor, pd.Series):
+        bloco(b"series")
+        bloco(str(valor.dtype).encode())
+        bloco(_hash_pandas(valor))
+    elif sparse.issparse(valor):
+        matriz = valor.tocsr()
+        matriz.sum_duplicates()
+        bloco(b"sparse")
+        bloco(json.dumps(matriz.shape).encode())
+        for array in (matriz.indptr, matriz.indices, matriz.data):
+            _update(digest, array)
+    elif isinstance(valor, np.ndarray):
+        if valor.dtype == object:
+            _update(digest, pd.Series(valor))
+            return
+        bloco(f"ndarray {valor.dtype.str} {valor.shape}".encode())
+        bloco(np.ascontiguousarray(valor).tobytes())
+    else:
+        bloco(json.dumps(valor, sort_keys=True, default=str).encode())
+
+
+def fingerprint(*partes: Any) -> str:
+    """
+    Calcula uma impressão digital (SHA-256) do conteúdo das partes informadas.
+
+    DataFrames, Series, arrays do numpy e matrizes esparsas entram pelo conteúdo
+    (valores, tipos e formato); os demais valores (parâmetros, versões, ...) entram
+    pela sua serialização JSON.
+    """
+    digest = hashlib.sha256()
+    for parte in partes:
+        _update(digest, parte)
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+    Guarda a impressão digital das entradas de cada etapa do pipeline ao lado das
+    suas saídas, para que uma nova execução com as mesmas entradas reaproveite o
+    resultado em vez de recalculá-lo.
+
+    Cada etapa tem um `<etapa>.json` com a impressão digital e metadados e,
+    opcionalmente, um `<etapa>.joblib` com o resultado. O JSON é sempre gravado por
+    último (e de forma atômica), então uma etapa interrompida no meio nunca é
+    considerada pronta.
+    """
+
+    def __init__(self, path: str = STAGE_CACHE_PATH):
+        self.path = path
+
+    def _caminhos(self, stage: str):
+        return (
+            os.path.join(self.path, f"{stage}.json"),
+            os.path.join(self.path, f"{stage}.joblib"),
+        )
+
+    def lookup(self, stage: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Retorna os metadados da etapa se ela já foi feita com essas entradas."""
+        caminho_json, _ = self._caminhos(stage)
+        try:
+            with open(caminho_json, encoding="utf-8") as f:
+                registro = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return registro if registro.get("fingerprint") == fingerprint else None
+
+    def record(self, stage: str, fingerprint: str, **metadata):
+        """Registra que a etapa foi concluída com essas entradas."""
+        caminho_json, _ = self._caminhos(stage)
+        os.makedirs(self.path, exist_ok=True)
+        registro = {
+            **metadata,
+            "fingerprint": fingerprint,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with open(caminho_json + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(registro, f, default=str)
+        os.replace(caminho_json + ".tmp", caminho_json)
+
+    def load(self, stage: str, fingerprint: str) -> Optional[Any]:
+        """Retorna o resultado guardado da etapa, ou None se as entradas mudaram."""
+        _, caminho_resultado = self._caminhos(stage)
+        if self.lookup(stage, fingerprint) is None:
+            return None
+        try:
+            return joblib.load(caminho_resultado)
+        except FileNotFoundError:
+            return None
+
+    def save(self, stage: str, fingerprint: str, value: Any, **metadata):
+        """Guarda o resultado da etapa junto com a impressão digital das entradas."""
+        caminho_json, caminho_resultado = self._caminhos(stage)
+        os.makedirs(self.path, exist_ok=True)
+        # Invalida o registro anterior antes de trocar o resultado
+        try:
+            os.remove(caminho_json)
+        except FileNotFoundError:
+            pass
+        joblib.dump(value, caminho_resultado + ".tmp")
+        os.replace(caminho_resultado + ".tmp", caminho_resultado)
+        self.record(stage, fingerprint, **metadata)
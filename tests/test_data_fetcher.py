@@ -0,0 +1,314 @@
+# test_data_fetcher.py
+import codecs
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+
+import data_fetcher
+from data_fetcher import ApiClient, _iter_json_array
+
+# Uma rota recebe (query, headers da requisição) e devolve (status, headers, corpo)
+Resposta = Tuple[int, Dict[str, str], bytes]
+Rota = Callable[[Dict[str, List[str]], Dict[str, str]], Resposta]
+
+
+class _StubApi:
+    """API HTTP local: cada caminho tem uma rota; as requisições ficam registradas."""
+
+    def __init__(self):
+        self.rotas: Dict[str, Rota] = {}
+        self.requisicoes: List[Tuple[str, Dict[str, List[str]], Dict[str, str]]] = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                headers = dict(self.headers.items())
+                with stub.lock:
+                    stub.requisicoes.append((url.path, query, headers))
+                rota = stub.rotas.get(url.path)
+                status, extras, corpo = (
+                    rota(query, headers) if rota else (404, {}, b"")
+                )
+                self.send_response(status)
+                for nome, valor in extras.items():
+                    self.send_header(nome, valor)
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        )
+        self.thread.start()
+
+    def paginas_pedidas(self, caminho: str) -> List[int]:
+        return sorted(
+            int(query["page"][0])
+            for path, query, _ in self.requisicoes
+            if path == caminho
+        )
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _json(dados: Any, status: int = 200, **headers: str) -> Resposta:
+    extras = {"Content-Type": "application/json", **headers}
+    return status, extras, json.dumps(dados).encode("utf-8")
+
+
+def _spring_pages(
+    registros: List[Dict[str, Any]], total_pages: bool = True, **headers: str
+) -> Rota:
+    """Rota paginada no formato do Spring Data."""
+
+    def rota(query, _headers):
+        page, size = int(query["page"][0]), int(query["size"][0])
+        total = max(1, -(-len(registros) // size))
+        pagina = {"content": registros[page * size : (page + 1) * size]}
+        if total_pages:
+            pagina.update({"totalPages": total, "last": page >= total - 1})
+        return _json(pagina, **headers)
+
+    return rota
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv("API_KEY", "teste")
+    stub = _StubApi()
+    yield stub
+    stub.close()
+
+
+def _client(api: _StubApi, **kwargs) -> ApiClient:
+    opcoes = {"page_size": 10, "max_workers": 3, "max_retries": 3, "timeout": 5}
+    opcoes.update(kwargs)
+    return ApiClient(base_url=api.base_url, **opcoes)
+
+
+def _avaliacoes(n: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": i,
+            "user": {"id": i % 7, "nome": "descartado"},
+            "cachaca": {"id": i % 11},
+            "notaGeral": float(i % 10),
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("total_pages", [True, False])
+def test_paginacao_busca_todas_as_paginas_em_ordem(api, total_pages):
+    registros = _avaliacoes(95)
+    api.rotas["/avaliacoes"] = _spring_pages(registros, total_pages)
+
+    with _client(api) as client:
+        df = client.get_dataframe("/avaliacoes")
+
+    assert df["id"].tolist() == list(range(95))
+    assert df["user.id"].tolist() == [r["user"]["id"] for r in registros]
+    # 'user.regiao' não vem nos registros: a coluna fica de fora
+    assert list(df.columns) == ["id", "user.id", "cachaca.id", "notaGeral"]
+    assert api.paginas_pedidas("/avaliacoes") == list(range(10))
+    _, query, headers = api.requisicoes[0]
+    assert query["size"] == ["10"]
+    assert headers["Authorization"] == "Bearer teste"
+
+
+def test_array_simples_e_lido_em_streaming(api, monkeypatch):
+    # Blocos pequenos forçam elementos (e caracteres UTF-8) cortados entre blocos
+    monkeypatch.setattr(data_fetcher, "STREAM_CHUNK_BYTES", 7)
+    registros = [
+        {"id": i, "nome": f"Cachaça nº {i}", "tipoCachaca": "OURO", "preco": 12.5 * i}
+        for i in range(23)
+    ]
+    api.rotas["/cachacas"] = lambda query, headers: _json(registros)
+
+    with _client(api, page_size=4) as client:
+        blocos, _ = client._fetch_chunks_with_etag("/cachacas")
+        blocos = list(blocos)
+
+    assert [len(bloco) for bloco in blocos] == [4, 4, 4, 4, 4, 3]
+    assert [r for bloco in blocos for r in bloco] == registros
+    assert len(api.requisicoes) == 1
+
+
+def test_campos_ausentes_nao_viram_colunas_de_nulos(api):
+    registros = [{"id": i, "nome": f"Cachaça {i}"} for i in range(6)]
+    # O campo só aparece a partir do segundo bloco (e é nulo em um registro)
+    for i, disponivel in zip(range(4, 6), [True, None]):
+        registros[i]["disponivel"] = disponivel
+    api.rotas["/cachacas"] = lambda query, headers: _json(registros)
+
+    with _client(api, page_size=4) as client:
+        df = client.get_dataframe("/cachacas")
+
+    assert list(df.columns) == ["id", "nome", "disponivel"]
+    assert str(df["disponivel"].dtype) == "boolean"
+    assert df["disponivel"].tolist()[3:] == [pd.NA, True, pd.NA]
+
+
+def test_ids_de_texto_nao_sao_convertidos_em_nulos():
+    df = data_fetcher._records_to_frame(
+        [{"id": "a", "user": {"id": 3}}, {"id": 3, "user": {"id": "u7"}}],
+        data_fetcher.ENDPOINT_SCHEMAS["/avaliacoes"],
+    )
+
+    assert df["id"].tolist() == ["a", 3]
+    assert df["user.id"].tolist() == [3, "u7"]
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_falhas_transitorias_sao_repetidas_com_backoff(api, status):
+    falhas = {"restantes": 3}
+
+    def rota(query, headers):
+        if falhas["restantes"]:
+            falhas["restantes"] -= 1
+            return status, {}, b""
+        return _spring_pages(_avaliacoes(5))(query, headers)
+
+    api.rotas["/avaliacoes"] = rota
+    inicio = time.monotonic()
+    with _client(api, backoff_factor=0.05) as client:
+        df = client.get_dataframe("/avaliacoes")
+    duracao = time.monotonic() - inicio
+
+    assert len(df) == 5
+    assert len(api.requisicoes) == 4
+    # Backoff exponencial do urllib3: 0s, 0.1s e 0.2s antes das tentativas seguintes
+    assert duracao >= 0.25
+
+
+def test_retry_after_do_servidor_e_respeitado(api):
+    falhas = {"restantes": 1}
+
+    def rota(query, headers):
+        if falhas["restantes"]:
+            falhas["restantes"] -= 1
+            return 429, {"Retry-After": "1"}, b""
+        return _spring_pages(_avaliacoes(5))(query, headers)
+
+    api.rotas["/avaliacoes"] = rota
+    inicio = time.monotonic()
+    with _client(api, backoff_factor=0) as client:
+        df = client.get_dataframe("/avaliacoes")
+
+    assert len(df) == 5
+    assert time.monotonic() - inicio >= 0.9
+
+
+def test_falha_persistente_esgota_as_tentativas(api, capsys):
+    api.rotas["/avaliacoes"] = lambda query, headers: (503, {}, b"")
+
+    with _client(api, max_retries=2, backoff_factor=0) as client:
+        df = client.get_dataframe("/avaliacoes")
+
+    assert df is None
+    assert len(api.requisicoes) == 3
+    assert "Erro ao buscar dados da API" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("corpo", [b'[{"id": 1}, {"id": 2', b'{"content": [{"id"'])
+def test_corpo_truncado_e_tratado_como_erro(api, capsys, tmp_path, corpo):
+    api.rotas["/avaliacoes"] = lambda query, headers: (
+        200,
+        {"Content-Type": "application/json"},
+        corpo,
+    )
+
+    with _client(api) as client:
+        assert client.get_dataframe("/avaliacoes") is None
+        assert client.sync_dataframe("/avaliacoes", cache_path=str(tmp_path)) is None
+
+    assert capsys.readouterr().out.count("Erro ao buscar dados da API") == 2
+
+
+def test_etag_304_reaproveita_o_cache(api, tmp_path):
+    paginas = _spring_pages(_avaliacoes(25), ETag='"v1"')
+
+    def rota(query, headers):
+        if headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, b""
+        return paginas(query, headers)
+
+    api.rotas["/avaliacoes"] = rota
+    with _client(api) as client:
+        primeira = client.sync_dataframe("/avaliacoes", cache_path=str(tmp_path))
+        requisicoes_completas = len(api.requisicoes)
+        segunda = client.sync_dataframe("/avaliacoes", cache_path=str(tmp_path))
+
+    assert requisicoes_completas == 3
+    assert len(api.requisicoes) == requisicoes_completas + 1
+    _, query, headers = api.requisicoes[-1]
+    assert headers["If-None-Match"] == '"v1"'
+    assert "updatedSince" in query
+    assert segunda.equals(primeira)
+    assert segunda["id"].tolist() == list(range(25))
+
+
+def _em_blocos(texto: str, tamanho: int) -> List[bytes]:
+    dados = texto.encode("utf-8")
+    return [dados[i : i + tamanho] for i in range(0, len(dados), tamanho)]
+
+
+def _ler_array(blocos: List[bytes], tamanho_lote: int = 2) -> List[Any]:
+    decodificador = codecs.getincrementaldecoder("utf-8")()
+    restantes = iter(blocos)
+    texto = ""
+    while "[" not in texto:
+        texto += decodificador.decode(next(restantes))
+    lotes = list(_iter_json_array(texto, restantes, decodificador, tamanho_lote))
+    assert all(0 < len(lote) <= tamanho_lote for lote in lotes)
+    return [elemento for lote in lotes for elemento in lote]
+
+
+def test_iter_json_array_com_tokens_cortados_entre_blocos():
+    # Números que continuam no bloco seguinte ('12' + '.5e3'), strings com escapes e
+    # aspas, caracteres multibyte, literais e objetos aninhados
+    texto = json.dumps(
+        [
+            12.5e3,
+            -7,
+            "vírgula, colchete ] e aspas \" dentro",
+            {"nome": "Cachaça São João", "tags": ["ouro", "envelhecida"]},
+            True,
+            None,
+            [1, [2, {"a": "]"}]],
+            123456789,
+        ],
+        ensure_ascii=False,
+    )
+    esperado = json.loads(texto)
+    for tamanho in range(1, len(texto.encode("utf-8")) + 1):
+        assert _ler_array(_em_blocos(texto, tamanho)) == esperado, tamanho
+
+
+def test_iter_json_array_com_espacos_e_array_vazio():
+    assert _ler_array(_em_blocos(" [ ] ", 1)) == []
+    assert _ler_array(_em_blocos("[\n  1 ,\n  2\n]\n", 3)) == [1, 2]
+
+
+@pytest.mark.parametrize("texto", ["[1, 2", "[1, 2 3]", '[{"a": 1}'])
+def test_iter_json_array_rejeita_array_malformado(texto):
+    with pytest.raises(json.JSONDecodeError):
+        _ler_array(_em_blocos(texto, 2))
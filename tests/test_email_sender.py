@@ -0,0 +1,219 @@
+# test_email_sender.py
+import socketserver
+import threading
+from email import message_from_string
+import time
+from typing import List
+
+import pytest
+
+from email_sender import BulkRenderer, SmtpPool, _render_card, render_message
+from outbox import Outbox
+
+
+class _SmtpSinkHandler(socketserver.StreamRequestHandler):
+    """Servidor SMTP mínimo: aceita as mensagens e conta o total por conexão."""
+
+    def _responder(self, linha: str):
+        self.wfile.write(linha.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        with self.server.lock:
+            conexao = len(self.server.por_conexao)
+            self.server.por_conexao.append(0)
+        self._responder("220 sink pronto")
+        recebendo_dados = False
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            if recebendo_dados:
+                if linha.rstrip(b"\r\n") == b".":
+                    recebendo_dados = False
+                    with self.server.lock:
+                        self.server.por_conexao[conexao] += 1
+                        recebidas = self.server.por_conexao[conexao]
+                    self._responder("250 OK")
+                    # Simula o servidor derrubando a conexão (ex: timeout do relay)
+                    if recebidas == self.server.derrubar_apos:
+                        return
+                continue
+
+            comando = linha[:4].upper()
+            if comando in (b"HELO", b"EHLO"):
+                self._responder("250 sink")
+            elif comando == b"DATA":
+                recebendo_dados = True
+                self._responder("354 envie a mensagem")
+            elif comando == b"QUIT":
+                self._responder("221 tchau")
+                return
+            else:
+                self._responder("250 OK")
+
+
+class _SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, derrubar_apos: int = 0):
+        super().__init__(("127.0.0.1", 0), _SmtpSinkHandler)
+        self.lock = threading.Lock()
+        self.por_conexao: List[int] = []
+        self.derrubar_apos = derrubar_apos
+
+    @property
+    def mensagens(self) -> int:
+        with self.lock:
+            return sum(self.por_conexao)
+
+
+@pytest.fixture
+def iniciar_sink():
+    sinks = []
+
+    def iniciar(**kwargs) -> _SmtpSink:
+        sink = _SmtpSink(**kwargs)
+        threading.Thread(
+            target=sink.serve_forever, args=(0.05,), daemon=True
+        ).start()
+        sinks.append(sink)
+        return sink
+
+    yield iniciar
+    for sink in sinks:
+        sink.shutdown()
+        sink.server_close()
+
+
+def _pool(sink: _SmtpSink, **kwargs) -> SmtpPool:
+    opcoes = {
+        "host": "127.0.0.1",
+        "port": sink.server_address[1],
+        "sender_email": "teste@exemplo.com",
+        "pool_size": 1,
+        "max_per_second": 0,
+        "use_tls": False,
+        "login": False,
+        "timeout": 5,
+    }
+    opcoes.update(kwargs)
+    return SmtpPool(**opcoes)
+
+
+def _emails(n: int):
+    recomendacoes = [{"nome": "Cachaça Teste", "tipoCachaca": "OURO", "regiao": "MG"}]
+    return [(f"user_{i}@exemplo.com", recomendacoes) for i in range(n)]
+
+
+def test_conexao_e_reaproveitada(iniciar_sink):
+    sink = iniciar_sink()
+    with _pool(sink) as pool:
+        resultados = pool.send_many(_emails(20))
+
+    assert all(resultados.values()) and len(resultados) == 20
+    assert sink.por_conexao == [20]
+
+
+def test_conexao_e_reciclada_apos_max_per_connection(iniciar_sink):
+    sink = iniciar_sink()
+    with _pool(sink, max_per_connection=4) as pool:
+        resultados = pool.send_many(_emails(10))
+
+    assert all(resultados.values())
+    assert sink.por_conexao == [4, 4, 2]
+
+
+def test_reconecta_quando_o_servidor_derruba_a_conexao(iniciar_sink):
+    sink = iniciar_sink(derrubar_apos=3)
+    with _pool(sink) as pool:
+        for destinatario, _ in _emails(7):
+            pool.send_message(destinatario, "Subject: teste\r\n\r\ncorpo")
+
+    # Nenhuma mensagem se perde: o envio que encontra a conexão caída é refeito
+    assert sink.por_conexao == [3, 3, 1]
+
+
+def test_pool_com_varias_conexoes(iniciar_sink):
+    sink = iniciar_sink()
+    with _pool(sink, pool_size=3) as pool:
+        resultados = pool.send_many(_emails(30))
+
+    assert all(resultados.values())
+    assert sink.mensagens == 30
+    assert len(sink.por_conexao) <= 3
+
+
+def test_limite_de_taxa(iniciar_sink):
+    sink = iniciar_sink()
+    inicio = time.monotonic()
+    with _pool(sink, pool_size=3, max_per_second=20) as pool:
+        pool.send_many(_emails(11))
+    duracao = time.monotonic() - inicio
+
+    # 11 envios a 20/s: a primeira sai na hora e as outras 10 a cada 50 ms,
+    # não importa quantas conexões o pool tenha
+    assert sink.mensagens == 11
+    assert duracao >= 0.45
+
+
+def test_sem_credenciais_nada_e_enviado(iniciar_sink, monkeypatch, capsys, tmp_path):
+    monkeypatch.delenv("EMAIL_USER", raising=False)
+    monkeypatch.delenv("EMAIL_PASSWORD", raising=False)
+    sink = iniciar_sink()
+
+    with _pool(sink, login=True) as pool:
+        assert pool.send_many(_emails(3)) == {}
+        with Outbox(str(tmp_path / "outbox.sqlite3")) as outbox:
+            outbox.enqueue_many("rodada", [(1, "user_1@exemplo.com", "corpo")])
+            assert outbox.drain(pool) == (0, 0)
+            assert len(outbox.pending()) == 1
+
+    assert "variáveis de ambiente do e-mail" in capsys.readouterr().out
+    assert sink.por_conexao == []
+
+
+def test_cartao_com_campos_nulos_usa_os_textos_padrao():
+    cartao = _render_card(
+        {"nome": "Cachaça Teste", "tipoCachaca": float("nan"), "descricao": None}
+    )
+
+    assert "Cachaça Teste" in cartao
+    assert "Descrição não disponível." in cartao
+    assert "N/A" in cartao
+    assert "None" not in cartao and "nan" not in cartao
+
+
+def _partes(mensagem: str):
+    """Cabeçalhos e partes decodificadas de uma mensagem serializada."""
+    msg = message_from_string(mensagem)
+    cabecalhos = {nome: msg[nome] for nome in ("Subject", "From", "To", "MIME-Version")}
+    partes = [
+        (parte.get_content_type(), parte.get_payload(decode=True).decode("utf-8"))
+        for parte in msg.get_payload()
+    ]
+    return msg.get_content_type(), cabecalhos, partes
+
+
+def test_bulk_renderer_equivale_a_render_message(monkeypatch):
+    monkeypatch.setenv("EMAIL_USER", "teste@exemplo.com")
+    monkeypatch.setenv("EMAIL_SENDER_NAME", "Pingou Teste")
+    ouro = {"id": 1, "nome": "Cachaça Ouro", "tipoCachaca": "OURO", "regiao": "MG"}
+    incompleta = {"id": 2, "nome": "Sem Detalhes", "regiao": None, "descricao": None}
+    emails = [
+        ("user_1@exemplo.com", [ouro, incompleta]),
+        # Mesmas cachaças de novo: os cartões vêm do cache
+        ("user_2@exemplo.com", [incompleta, ouro]),
+        ("user_3@exemplo.com", [{"nome": "Sem id"}]),
+        # Endereço que precisa de codificação passa pelo caminho completo
+        ("José da Silva <jose@exemplo.com>", [ouro]),
+    ]
+
+    renderer = BulkRenderer()
+    renderizadas = renderer.render_many(emails)
+
+    assert set(renderer._cards) == {1, 2}
+    for (destinatario, recomendacoes), mensagem in zip(emails, renderizadas):
+        assert _partes(mensagem) == _partes(render_message(destinatario, recomendacoes))
+    _, _, partes = _partes(renderizadas[0])
+    assert "Descrição não disponível." in partes[1][1]
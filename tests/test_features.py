@@ -0,0 +1,104 @@
+# test_features.py
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+from lightfm.data import Dataset
+
+import features
+from matrix_builder import build_item_features
+
+TOKENS = [
+    "tipoCachaca=OURO",
+    "regiao=Salinas",
+    "tags=envelhecida",
+    "gosto:regiao=Salinas",
+]
+
+
+def test_baldes_fixos_entre_versoes():
+    # Os baldes de um modelo publicado precisam continuar os mesmos nas próximas
+    # execuções (modo incremental): mudar o hash invalidaria os embeddings salvos
+    baldes = features.hash_tokens(TOKENS, features.ITEM_FEATURE_BUCKETS)
+    assert baldes.tolist() == [3729, 2289, 3736, 688]
+
+
+def test_baldes_iguais_em_outro_processo():
+    codigo = (
+        "import features; print(features.hash_tokens("
+        f"{TOKENS!r}, features.ITEM_FEATURE_BUCKETS).tolist())"
+    )
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    saida = subprocess.run(
+        [sys.executable, "-c", codigo],
+        cwd=raiz,
+        env={**os.environ, "PYTHONHASHSEED": "123"},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    esperado = features.hash_tokens(TOKENS, features.ITEM_FEATURE_BUCKETS).tolist()
+    assert saida.strip() == str(esperado)
+
+
+def test_balde_de_um_token_nao_depende_do_lote():
+    baldes = features.hash_tokens(TOKENS, features.ITEM_FEATURE_BUCKETS)
+    for token, balde in zip(TOKENS, baldes):
+        assert features.hash_tokens([token], features.ITEM_FEATURE_BUCKETS)[0] == balde
+    invertidos = features.hash_tokens(TOKENS[::-1], features.ITEM_FEATURE_BUCKETS)
+    assert invertidos.tolist() == baldes[::-1].tolist()
+
+
+def _catalogo() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "id": np.arange(6),
+            "tipoCachaca": ["OURO", "PRATA"] * 3,
+            "regiao": [f"Região {i}" for i in range(6)],
+            "preco": np.linspace(20, 300, 6),
+            "tags": ["envelhecida|carvalho"] + [None] * 5,
+        }
+    )
+
+
+def _features_dos_itens(dataset: Dataset, catalogo: pd.DataFrame):
+    return build_item_features(
+        dataset, catalogo, n_buckets=features.ITEM_FEATURE_BUCKETS
+    )
+
+
+def test_itens_e_valores_novos_nao_mudam_as_features_existentes():
+    nomes = features.bucket_names(features.ITEM_PREFIX, features.ITEM_FEATURE_BUCKETS)
+    catalogo = _catalogo()
+    dataset = Dataset()
+    dataset.fit(users=[0], items=catalogo["id"], item_features=nomes)
+    antes = _features_dos_itens(dataset, catalogo)
+
+    # Uma cachaça nova, de uma região e com uma tag que o modelo nunca viu
+    novo = pd.concat(
+        [
+            catalogo,
+            pd.DataFrame(
+                {
+                    "id": [6],
+                    "tipoCachaca": ["OURO"],
+                    "regiao": ["Região nova"],
+                    "preco": [55.0],
+                    "tags": ["nova tag"],
+                }
+            ),
+        ],
+        ignore_index=True,
+    )
+    dataset.fit_partial(items=novo["id"], item_features=nomes)
+    depois = _features_dos_itens(dataset, novo)
+
+    # Só cresce a identidade do item novo: os baldes e as linhas antigas não mudam
+    assert depois.shape == (antes.shape[0] + 1, antes.shape[1] + 1)
+    antigas = depois[:6].toarray()
+    assert np.array_equal(antigas[:, : antes.shape[1]], antes.toarray())
+    assert not antigas[:, antes.shape[1] :].any()
+    # A linha soma 1 (normalização L1), com peso nos baldes dos seus atributos
+    assert np.isclose(depois[6].sum(), 1.0)
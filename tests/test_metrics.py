@@ -0,0 +1,32 @@
+# test_metrics.py
+import json
+import math
+
+from metrics import Histogram, MetricsRegistry
+
+
+def test_quantil_no_balde_infinito_usa_o_maior_limite_finito():
+    histograma = Histogram(buckets=(0.1, 1.0))
+    histograma.observe(0.05)
+    histograma.observe(5.0, count=9)
+
+    assert histograma.quantile(0.1) == 0.1
+    assert histograma.quantile(0.99) == 1.0
+    assert Histogram(buckets=(0.1,)).quantile(0.5) is None
+
+
+def test_export_grava_json_estrito(tmp_path):
+    registro = MetricsRegistry()
+    registro.observe("lento_seconds", 1000.0)
+    registro.set_gauge("indefinido", math.nan)
+
+    caminho_json, caminho_prom = registro.export(str(tmp_path))
+
+    with open(caminho_json, encoding="utf-8") as f:
+        # parse_constant só é chamado para NaN/Infinity, que não são JSON válido
+        snapshot = json.loads(f.read(), parse_constant=lambda nome: 1 / 0)
+    (histograma,) = snapshot["histograms"]
+    assert histograma["p99"] == 10.0
+    assert snapshot["gauges"][0]["value"] is None
+    with open(caminho_prom, encoding="utf-8") as f:
+        assert 'pingou_lento_seconds_bucket{le="+Inf"} 1.0' in f.read()
@@ -0,0 +1,34 @@
+# test_outbox.py
+import sqlite3
+
+from outbox import Outbox
+
+
+def test_rodada_sem_mensagens_fica_registrada(tmp_path):
+    with Outbox(str(tmp_path / "outbox.sqlite3")) as outbox:
+        assert not outbox.has_run("2026-10-17")
+        assert outbox.enqueue_many("2026-10-17", []) == 0
+        assert outbox.has_run("2026-10-17")
+        assert not outbox.has_run("2026-10-18")
+        assert outbox.pending() == []
+
+
+def test_rodada_com_mensagens(tmp_path):
+    with Outbox(str(tmp_path / "outbox.sqlite3")) as outbox:
+        mensagens = [(1, "user_1@exemplo.com", "a"), (2, "user_2@exemplo.com", "b")]
+        assert outbox.enqueue_many("rodada", mensagens) == 2
+        # Gravar a mesma rodada de novo não duplica mensagens
+        assert outbox.enqueue_many("rodada", mensagens) == 0
+        assert outbox.has_run("rodada")
+        assert [key for key, _, _ in outbox.pending()] == ["rodada:1", "rodada:2"]
+
+
+def test_caixa_gravada_antes_da_tabela_de_rodadas(tmp_path):
+    caminho = str(tmp_path / "outbox.sqlite3")
+    with Outbox(caminho) as outbox:
+        outbox.enqueue_many("antiga", [(1, "user_1@exemplo.com", "a")])
+    with sqlite3.connect(caminho) as conexao:
+        conexao.execute("DELETE FROM runs")
+
+    with Outbox(caminho) as outbox:
+        assert outbox.has_run("antiga")
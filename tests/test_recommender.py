@@ -0,0 +1,273 @@
+# test_recommender.py
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+import metrics
+import model_store
+import recommender as recommender_module
+from recommender import Recommender
+
+N_ITENS = 30
+N_USUARIOS = 40
+
+
+class _Dataset:
+    """Mapeamentos no formato de `lightfm.data.Dataset.mapping()`."""
+
+    def __init__(self, user_ids, item_ids):
+        self.user_ids, self.item_ids = list(user_ids), list(item_ids)
+
+    def mapping(self):
+        return (
+            {user_id: i for i, user_id in enumerate(self.user_ids)},
+            {},
+            {item_id: i for i, item_id in enumerate(self.item_ids)},
+            {},
+        )
+
+
+class _Modelo:
+    """Representações fixas, com a mesma interface de consulta do LightFM."""
+
+    def __init__(self, n_usuarios: int, n_itens: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.user = (np.zeros(n_usuarios), rng.random((n_usuarios, 4)))
+        self.item = (np.zeros(n_itens), rng.random((n_itens, 4)))
+
+    def get_user_representations(self, features=None):
+        return self.user
+
+    def get_item_representations(self, features=None):
+        return self.item
+
+
+def _catalogo() -> pd.DataFrame:
+    itens = np.arange(N_ITENS)
+    return pd.DataFrame(
+        {
+            "id": 100 + itens,
+            "nome": [f"Cachaça {i}" for i in itens],
+            "tipoCachaca": np.where(itens % 2 == 0, "OURO", "PRATA"),
+            "regiao": np.where(itens < 20, "Salinas", "Paraty"),
+            "disponivel": itens % 3 != 0,
+        }
+    )
+
+
+def _publicar(artifacts_path: str, user_ids=None, catalogo=None) -> str:
+    user_ids = list(range(N_USUARIOS)) if user_ids is None else user_ids
+    catalogo = _catalogo() if catalogo is None else catalogo
+    # O item i foi avaliado pelos usuários 0..(N_ITENS - 1 - i): popularidade decrescente
+    linhas, colunas = zip(
+        *[(u, i) for i in range(N_ITENS) for u in range(N_ITENS - i)]
+    )
+    interactions = sparse.coo_matrix(
+        (np.ones(len(linhas)), (linhas, colunas)), shape=(len(user_ids), N_ITENS)
+    )
+    return model_store.publish(
+        _Modelo(len(user_ids), N_ITENS),
+        _Dataset(user_ids, catalogo["id"]),
+        None,
+        interactions,
+        catalogo,
+        artifacts_path,
+    )
+
+
+@pytest.fixture
+def recommender(tmp_path, monkeypatch):
+    # Segmentos curtos: o ranking de um segmento não cobre o catálogo inteiro
+    monkeypatch.setattr(model_store, "POPULAR_TOP_K", 5)
+    _publicar(str(tmp_path))
+    return Recommender(str(tmp_path))
+
+
+def _ids(recomendacoes):
+    return [r["id"] - 100 for r in recomendacoes]
+
+
+def test_cold_start_com_filtros_usa_o_ranking_completo(recommender):
+    # As cachaças de Paraty (itens 20 a 29) estão fora do top 5 geral
+    resultados = recommender.recommend_all(
+        ["novo"], top_n=5, filters={"regiao": "Paraty"}
+    )
+    assert _ids(resultados["novo"]) == [20, 21, 22, 23, 24]
+
+    resultados = recommender.recommend_all(
+        ["novo"], top_n=5, filters={"regiao": "Paraty", "disponivel": True}
+    )
+    assert _ids(resultados["novo"]) == [20, 22, 23, 25, 26]
+
+
+def test_cold_start_le_o_ranking_em_fatias_e_nao_imprime(
+    recommender, monkeypatch, capsys
+):
+    monkeypatch.setattr(recommender_module, "POPULAR_CHUNK", 3)
+    metrics.REGISTRY.reset()
+    capsys.readouterr()
+
+    for _ in range(2):
+        resultados = recommender.recommend_all(
+            ["novo", "outro"], top_n=5, filters={"regiao": "Paraty", "disponivel": True}
+        )
+        assert _ids(resultados["novo"]) == [20, 22, 23, 25, 26]
+
+    # O servidor chama recommend_all a cada requisição: o resumo vai para as métricas
+    assert capsys.readouterr().out == ""
+    chave = ("users_scored_total", (("path", "cold_start"),))
+    assert metrics.REGISTRY.counters[chave] == 4
+    metrics.REGISTRY.reset()
+
+
+def test_cold_start_com_filtros_e_diversidade(recommender):
+    resultados = recommender.recommend_all(
+        ["novo"], top_n=5, filters={"regiao": "Paraty"}, max_per_type=1
+    )
+    assert _ids(resultados["novo"]) == [20, 21]
+
+
+def test_cold_start_sem_filtros_continua_pelos_mais_populares(recommender):
+    resultados = recommender.recommend_all(["novo"], top_n=3)
+    assert _ids(resultados["novo"]) == [0, 1, 2]
+
+
+def test_filtro_por_coluna_ausente_do_catalogo_nao_descarta_tudo(tmp_path):
+    _publicar(str(tmp_path), catalogo=_catalogo().drop(columns="disponivel"))
+    recommender = Recommender(str(tmp_path))
+
+    resultados = recommender.recommend_all(
+        ["novo"], top_n=3, filters={"disponivel": True}
+    )
+    assert _ids(resultados["novo"]) == [0, 1, 2]
+
+
+def _diversidade_por_forca_bruta(recommender, user_id, top_n, max_per_type, filters):
+    """Referência: pontua tudo, pega os candidatos e aplica o limite item a item."""
+    u = recommender.user_index.get_loc(user_id)
+    scores = recommender.user_embeddings[u] @ recommender.item_embeddings.T
+    scores = scores + recommender.user_biases[u] + recommender.item_biases
+    catalogo = recommender.cachacas_df
+    permitidos = np.ones(N_ITENS, dtype=bool)
+    for coluna, valor in (filters or {}).items():
+        permitidos &= (catalogo[coluna] == valor).to_numpy()
+    vistos = set(np.arange(N_ITENS)[: N_ITENS - u].tolist())
+    ranking = [
+        i
+        for i in np.argsort(-scores, kind="stable")
+        if permitidos[i] and i not in vistos
+    ]
+
+    escolhidos, por_tipo = [], {}
+    for i in ranking[: top_n * recommender_module.DIVERSITY_CANDIDATES_PER_SLOT]:
+        tipo = catalogo["tipoCachaca"].iloc[i]
+        if pd.notna(tipo):
+            if por_tipo.get(tipo, 0) >= max_per_type:
+                continue
+            por_tipo[tipo] = por_tipo.get(tipo, 0) + 1
+        escolhidos.append(int(i))
+        if len(escolhidos) == top_n:
+            break
+    return escolhidos
+
+
+@pytest.mark.parametrize(
+    "top_n, max_per_type, filters",
+    [(5, 1, None), (5, 2, None), (8, 2, None), (4, 1, {"regiao": "Paraty"})],
+)
+def test_diversidade_no_caminho_do_modelo(tmp_path, top_n, max_per_type, filters):
+    catalogo = _catalogo()
+    # Três tipos e alguns itens sem tipo (que não entram no limite)
+    catalogo["tipoCachaca"] = pd.Series(
+        ["OURO", "PRATA", "BRANCA", "OURO", "PRATA", None] * 5, dtype=object
+    )
+    _publicar(str(tmp_path), catalogo=catalogo)
+    recommender = Recommender(str(tmp_path))
+    # Usuários pontuados pelo modelo (mais de COLD_START_MAX_RATINGS avaliações) e com
+    # itens não vistos de sobra; blocos pequenos: o re-ranqueamento roda em vários
+    quentes = list(range(5, 28))
+
+    resultados = recommender.recommend_all(
+        quentes,
+        top_n=top_n,
+        batch_size=4,
+        filters=filters,
+        max_per_type=max_per_type,
+    )
+
+    for user_id in quentes:
+        esperado = _diversidade_por_forca_bruta(
+            recommender, user_id, top_n, max_per_type, filters
+        )
+        assert _ids(resultados[user_id]) == esperado, user_id
+        tipos = [
+            r["tipoCachaca"] for r in resultados[user_id] if pd.notna(r["tipoCachaca"])
+        ]
+        assert all(tipos.count(tipo) <= max_per_type for tipo in tipos)
+
+
+def test_ids_inteiros_continuam_inteiros(tmp_path):
+    _publicar(str(tmp_path))
+    recommender = Recommender(str(tmp_path))
+
+    assert recommender.artifacts.user_ids.dtype == np.int64
+    assert recommender.artifacts.item_ids.dtype == np.int64
+    # Um usuário conhecido (muitas avaliações) é pontuado pelo modelo, seja qual for
+    # o tipo inteiro usado na consulta
+    for user_id in (3, np.int32(3)):
+        assert len(recommender.recommend_all([user_id], top_n=3)[user_id]) == 3
+
+
+def test_ids_de_texto(tmp_path):
+    user_ids = [f"u{i}" for i in range(N_USUARIOS)]
+    _publicar(str(tmp_path), user_ids)
+    recommender = Recommender(str(tmp_path))
+
+    assert recommender.user_index.get_loc("u3") == 3
+    with open(
+        tmp_path / "serving" / recommender.version / "manifest.json", encoding="utf-8"
+    ) as f:
+        manifest = json.load(f)
+    assert (manifest["user_id_dtype"], manifest["item_id_dtype"]) == ("str", "int64")
+
+
+def test_ids_misturados_sao_recusados(tmp_path):
+    user_ids = list(range(N_USUARIOS - 1)) + ["u39"]
+    with pytest.raises(ValueError, match="IDs de user com tipos misturados"):
+        _publicar(str(tmp_path), user_ids)
+
+
+def test_populares_por_tipo_e_regiao(recommender):
+    # O top 5 de PRATA (itens 1, 3, ..., 9) é todo de Salinas: o segmento combinado
+    # não depende dele
+    populares = recommender.recommend_popular(
+        top_n=3, tipo_cachaca="PRATA", regiao="Paraty"
+    )
+    assert _ids(populares) == [21, 23, 25]
+    assert _ids(recommender.recommend_popular(top_n=2, regiao="Paraty")) == [20, 21]
+    assert _ids(recommender.recommend_popular(top_n=2, tipo_cachaca="OURO")) == [0, 2]
+
+
+def test_sharded_nao_duplica_as_metricas_do_processo_principal(recommender):
+    metrics.REGISTRY.reset()
+    metrics.inc("antes_do_pool_total")
+    metrics.observe("antes_do_pool_seconds", 0.01)
+    usuarios = list(range(N_USUARIOS))
+
+    fatias = list(
+        recommender.recommend_sharded(usuarios, top_n=3, workers=2, shard_size=10)
+    )
+
+    assert sum(len(fatia) for fatia in fatias) == N_USUARIOS
+    assert metrics.REGISTRY.counters[("antes_do_pool_total", ())] == 1
+    assert metrics.REGISTRY.histograms[("antes_do_pool_seconds", ())].count == 1
+    pontuados = sum(
+        valor
+        for (nome, _), valor in metrics.REGISTRY.counters.items()
+        if nome == "users_scored_total"
+    )
+    assert pontuados == N_USUARIOS
+    metrics.REGISTRY.reset()
@@ -0,0 +1,105 @@
+# test_server.py
+import json
+import threading
+import time
+import urllib.request
+
+import pytest
+
+import metrics
+import model_store
+from server import RecommendationService, create_server
+from test_recommender import _ids, _publicar
+
+
+@pytest.fixture
+def service(tmp_path):
+    _publicar(str(tmp_path))
+    service = RecommendationService(str(tmp_path), reload_interval=3600)
+    metrics.REGISTRY.reset()
+    yield service
+    service.stop_watcher()
+    metrics.REGISTRY.reset()
+
+
+def _contar_chamadas(service: RecommendationService, monkeypatch) -> list:
+    """Conta as chamadas a `recommend_all` do Recommender atual do serviço."""
+    chamadas = []
+    original = service.recommender.recommend_all
+
+    def recommend_all(user_ids, **kwargs):
+        chamadas.append(list(user_ids))
+        return original(user_ids, **kwargs)
+
+    monkeypatch.setattr(service.recommender, "recommend_all", recommend_all)
+    return chamadas
+
+
+def test_cache_por_usuario_parametros_e_filtros(service, monkeypatch):
+    chamadas = _contar_chamadas(service, monkeypatch)
+
+    versao, primeira = service.recommend("3", 3)
+    _, segunda = service.recommend("3", 3)
+    assert versao == service.recommender.version
+    assert segunda is primeira and len(chamadas) == 1
+
+    # Outro n, outros filtros ou outro limite por tipo não reaproveitam o resultado
+    service.recommend("3", 4)
+    service.recommend("3", 3, {"regiao": ["Paraty"]})
+    service.recommend("3", 3, max_per_type=1)
+    service.recommend("3", 3, {"regiao": ["Paraty"]})
+    assert len(chamadas) == 4
+
+    consultas = {
+        rotulos: valor
+        for (nome, rotulos), valor in metrics.REGISTRY.counters.items()
+        if nome == "recs_cache_lookups_total"
+    }
+    assert consultas == {(("hit", "True"),): 2, (("hit", "False"),): 4}
+
+
+def test_id_invalido_para_ids_inteiros(service):
+    versao, recomendacoes = service.recommend("abc", 3)
+    assert versao == service.recommender.version and recomendacoes is None
+
+
+def test_nova_versao_e_ativada_e_nao_usa_o_cache_antigo(service, tmp_path):
+    versao_antiga, _ = service.recommend("999", 3)
+    assert not service.reload_if_changed()
+
+    versao_nova = _publicar(str(tmp_path))
+    assert versao_nova != versao_antiga
+    assert model_store.current_version(str(tmp_path)) == versao_nova
+    assert service.reload_if_changed()
+    assert not service.reload_if_changed()
+
+    versao, recomendacoes = service.recommend("999", 3)
+    assert versao == versao_nova
+    assert _ids(recomendacoes) == [0, 1, 2]
+
+
+def test_watcher_ativa_a_nova_versao_em_segundo_plano(service, tmp_path):
+    service.reload_interval = 0.05
+    service.start_watcher()
+    versao_nova = _publicar(str(tmp_path))
+
+    limite = time.monotonic() + 5
+    while service.recommender.version != versao_nova and time.monotonic() < limite:
+        time.sleep(0.02)
+    assert service.recommender.version == versao_nova
+
+
+def test_rota_http_de_recomendacoes(service):
+    server = create_server(service, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        url = f"{base_url}/users/999/recommendations?n=2&regiao=Paraty"
+        with urllib.request.urlopen(url) as resposta:
+            corpo = json.loads(resposta.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert corpo["version"] == service.recommender.version
+    assert _ids(corpo["recommendations"]) == [20, 21]
@@ -0,0 +1,74 @@
+# test_stage_cache.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import pipeline
+from stage_cache import StageCache, fingerprint
+
+
+def test_fingerprint_depende_do_conteudo_e_dos_tipos():
+    df = pd.DataFrame({"id": [1, 2, 3], "nota": [4.0, 5.0, 3.5]})
+
+    assert fingerprint(df, {"a": 1}) == fingerprint(df.copy(), {"a": 1})
+    assert fingerprint(df, {"a": 1}) != fingerprint(df, {"a": 2})
+    assert fingerprint(df) != fingerprint(df.astype({"id": "int32"}))
+    # A impressão digital é sensível à ordem: quem quer ignorá-la ordena antes
+    assert fingerprint(df) != fingerprint(df.iloc[::-1].reset_index(drop=True))
+
+
+def test_lookup_load_e_save(tmp_path):
+    cache = StageCache(str(tmp_path))
+    assert cache.lookup("etapa", "abc") is None
+    assert cache.load("etapa", "abc") is None
+
+    cache.save("etapa", "abc", {"resultado": np.arange(3)}, version="v1")
+    assert cache.lookup("etapa", "abc")["version"] == "v1"
+    assert cache.load("etapa", "abc")["resultado"].tolist() == [0, 1, 2]
+    # Outras entradas: o resultado guardado não vale
+    assert cache.lookup("etapa", "def") is None
+    assert cache.load("etapa", "def") is None
+
+    cache.record("etapa", "def")
+    assert cache.lookup("etapa", "abc") is None
+    assert cache.lookup("etapa", "def") is not None
+
+
+@pytest.fixture
+def dados():
+    return benchmark.gerar_dados_sinteticos(60, 25, 0.2, seed=7)
+
+
+def test_treinamento_reaproveitado_com_entradas_embaralhadas(
+    dados, tmp_path, monkeypatch, capsys
+):
+    monkeypatch.setattr(pipeline, "EPOCAS_MAXIMAS", 2)
+    avaliacoes, cachacas = dados
+    artifacts_path = str(tmp_path)
+
+    versao = pipeline.executar_pipeline_treinamento(
+        avaliacoes, cachacas, artifacts_path=artifacts_path, parada_antecipada=False
+    )
+    capsys.readouterr()
+
+    # A mesma base em outra ordem (como a API pode devolvê-la): cache hit
+    assert (
+        pipeline.executar_pipeline_treinamento(
+            avaliacoes.sample(frac=1, random_state=1),
+            cachacas.sample(frac=1, random_state=2),
+            artifacts_path=artifacts_path,
+            parada_antecipada=False,
+        )
+        == versao
+    )
+    assert "reaproveitando o modelo publicado" in capsys.readouterr().out
+
+    # Uma nota alterada: cache miss e uma nova versão publicada
+    alteradas = avaliacoes.copy()
+    alteradas.loc[alteradas.index[0], "notaGeral"] += 1
+    nova_versao = pipeline.executar_pipeline_treinamento(
+        alteradas, cachacas, artifacts_path=artifacts_path, parada_antecipada=False
+    )
+    assert nova_versao != versao
+    assert "reaproveitando o modelo publicado" not in capsys.readouterr().out